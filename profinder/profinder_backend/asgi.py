@@ -2,6 +2,8 @@
 ASGI config for profinder_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests are served by Django; WebSocket connections are routed to
+``users.websocket``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +14,15 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'profinder_backend.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from users import websocket  # noqa: E402  (needs the app registry loaded)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await websocket.application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,78 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from rest_framework import exceptions
+
+
+class AsyncAPIViewMixin:
+    """
+    Async dispatch for DRF views when `ASYNC_VIEWS` is set, which asgi.py
+    does. A handler with a coroutine twin named `a<handler>` (`alist`,
+    `aget`) is served by the twin on the event loop, after authenticators
+    with an `aauthenticate` method are awaited, so a warm request needs no
+    thread at all; permissions and throttles must then not touch the
+    database. Other handlers run in one worker thread together with the
+    usual `initial` checks.
+
+    Under WSGI the view stays synchronous and runs the plain handlers, so
+    it pays for no event loop.
+    """
+    async_dispatch = False
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        if not settings.ASYNC_VIEWS:
+            return super().as_view(*args, **kwargs)
+        return markcoroutinefunction(super().as_view(*args, async_dispatch=True, **kwargs))
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.async_dispatch:
+            return self.adispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            twin = getattr(self, f'a{handler.__name__}', None)
+            if twin is not None and iscoroutinefunction(twin):
+                await self.aperform_authentication(request)
+                self.initial(request, *args, **kwargs)
+                response = await twin(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(self._handle)(handler, request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    def _handle(self, handler, request, *args, **kwargs):
+        self.initial(request, *args, **kwargs)
+        return handler(request, *args, **kwargs)
+
+    async def aperform_authentication(self, request):
+        """
+        Resolve `request.user` the way `Request._authenticate` does.
+        """
+        try:
+            for authenticator in request.authenticators:
+                if hasattr(authenticator, 'aauthenticate'):
+                    user_auth = await authenticator.aauthenticate(request)
+                else:
+                    user_auth = await sync_to_async(authenticator.authenticate)(request)
+                if user_auth is not None:
+                    request._authenticator = authenticator
+                    request.user, request.auth = user_auth
+                    return
+        except exceptions.APIException:
+            request._not_authenticated()
+            raise
+        request._not_authenticated()
@@ -0,0 +1,200 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import authentication, exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from .models import User
+
+
+class PrincipalCache:
+    """
+    Two-level cache of token key -> User: a per-process LRU in front of the
+    shared Django cache. A request costs no shared-cache read when the LRU
+    holds the token, and one when it does not.
+
+    Revoking a token replaces its shared entry with a marker recording when
+    it was revoked. A lookup that began reading the database before then
+    may hold the old principal, so `set`, given the time the lookup
+    started, does not replace the marker with it. The revoking process
+    drops its LRU entry at once; other processes keep serving theirs for at
+    most `local_ttl` seconds.
+    """
+    def __init__(self, maxsize, local_ttl, shared_ttl, alias='default'):
+        self.maxsize = maxsize
+        self.local_ttl = local_ttl
+        self.shared_ttl = shared_ttl
+        self.alias = alias
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, token_key):
+        return f'principal:{token_key}'
+
+    def get_local(self, token_key, now):
+        with self._lock:
+            entry = self._local.get(token_key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._local.move_to_end(token_key)
+                    return entry[1]
+                del self._local[token_key]
+        return None
+
+    def get(self, token_key):
+        now = time.monotonic()
+        user = self.get_local(token_key, now)
+        if user is None:
+            user = caches[self.alias].get(self._key(token_key))
+            if not isinstance(user, User):
+                return None
+            self._remember(token_key, user, now)
+        return user
+
+    async def aget(self, token_key):
+        now = time.monotonic()
+        user = self.get_local(token_key, now)
+        if user is None:
+            user = await caches[self.alias].aget(self._key(token_key))
+            if not isinstance(user, User):
+                return None
+            self._remember(token_key, user, now)
+        return user
+
+    def set(self, token_key, user, started):
+        """
+        Cache `user`, read from the database by a lookup that started at
+        `started` (`time.time_ns()`), unless the token was revoked since.
+        """
+        cache, key = caches[self.alias], self._key(token_key)
+        if not cache.add(key, user, self.shared_ttl):
+            revoked_at = cache.get(key)
+            if isinstance(revoked_at, User) or revoked_at is not None and revoked_at >= started:
+                return
+            cache.set(key, user, self.shared_ttl)
+        self._remember(token_key, user, time.monotonic())
+
+    async def aset(self, token_key, user, started):
+        cache, key = caches[self.alias], self._key(token_key)
+        if not await cache.aadd(key, user, self.shared_ttl):
+            revoked_at = await cache.aget(key)
+            if isinstance(revoked_at, User) or revoked_at is not None and revoked_at >= started:
+                return
+            await cache.aset(key, user, self.shared_ttl)
+        self._remember(token_key, user, time.monotonic())
+
+    def revoke(self, *token_keys):
+        with self._lock:
+            for token_key in token_keys:
+                self._local.pop(token_key, None)
+        revoked_at = time.time_ns()
+        caches[self.alias].set_many(
+            {self._key(token_key): revoked_at for token_key in token_keys}, self.shared_ttl
+        )
+
+    def revoke_users(self, *user_ids):
+        """
+        Revoke the principals of every token the users hold, after a change
+        to their accounts or profiles.
+        """
+        keys = list(Token.objects.filter(user_id__in=user_ids).values_list('key', flat=True))
+        if keys:
+            self.revoke(*keys)
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def _remember(self, token_key, user, now):
+        with self._lock:
+            self._local[token_key] = (now + self.local_ttl, user)
+            self._local.move_to_end(token_key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+
+principal_cache = PrincipalCache(
+    maxsize=getattr(settings, 'TOKEN_PRINCIPAL_LRU_SIZE', 10000),
+    local_ttl=getattr(settings, 'TOKEN_PRINCIPAL_LOCAL_TTL', 30),
+    shared_ttl=getattr(settings, 'TOKEN_PRINCIPAL_CACHE_TTL', 300),
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Authenticate `Authorization: Token <key>` headers issued by
+    `UserViewSet.login`. The principal is the `users.User` sharing the
+    token owner's id, served from `principal_cache` so that a warm request
+    hashes no password and runs no query.
+    """
+    def token_key(self, request):
+        """
+        Return the key from an `Authorization: Token <key>` header, or None
+        when the header uses another scheme.
+        """
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            return auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. Token string should not contain invalid characters.')
+            )
+
+    def authenticate(self, request):
+        key = self.token_key(request)
+        return None if key is None else self.authenticate_credentials(key)
+
+    def authenticate_credentials(self, key):
+        user = principal_cache.get(key)
+        if user is None:
+            started = time.time_ns()
+            user_id = Token.objects.filter(key=key, user__is_active=True).values_list('user_id', flat=True).first()
+            user = User.objects.filter(pk=user_id).first() if user_id is not None else None
+            if user is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            principal_cache.set(key, user, started)
+        return (user, key)
+
+    async def aauthenticate(self, request):
+        """
+        `authenticate` for async views: lookups are awaited, and a principal
+        in the local LRU costs no thread hop.
+        """
+        key = self.token_key(request)
+        if key is None:
+            return None
+        user = await principal_cache.aget(key)
+        if user is None:
+            started = time.time_ns()
+            tokens = Token.objects.filter(key=key, user__is_active=True).values_list('user_id', flat=True)
+            user_id = await tokens.afirst()
+            user = await User.objects.filter(pk=user_id).afirst() if user_id is not None else None
+            if user is None:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            await principal_cache.aset(key, user, started)
+        return (user, key)
+
+
+class SessionAuthentication(authentication.SessionAuthentication):
+    """
+    DRF's session authentication, with the session user loaded without a
+    worker thread in async views.
+    """
+    async def aauthenticate(self, request):
+        auser = getattr(request._request, 'auser', None)
+        user = await auser() if auser is not None else None
+        if not user or not user.is_active:
+            return None
+        self.enforce_csrf(request)
+        return (user, None)
@@ -0,0 +1,96 @@
+import datetime
+import re
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import writequeue
+from .models import ServiceProviderProfile, Booking, AvailabilitySlot
+
+MAX_SLOT_LENGTH = timedelta(hours=12)
+WEEK_RE = re.compile(r'^(\d{4})-?W(\d{2})$')
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def parse_week(value):
+    """
+    Return the [start, end) datetimes of an ISO week such as `2026-W42`,
+    or of the current week when `value` is empty.
+    """
+    if value:
+        match = WEEK_RE.match(value)
+        if match is None:
+            raise ValueError(f'Invalid ISO week: {value!r}')
+        monday = datetime.date.fromisocalendar(int(match[1]), int(match[2]), 1)
+    else:
+        today = timezone.localdate()
+        monday = today - timedelta(days=today.weekday())
+    start = timezone.make_aware(datetime.datetime.combine(monday, datetime.time.min))
+    return start, start + timedelta(days=7)
+
+
+def overlapping(provider_id, start, end):
+    """
+    Slots of a provider that intersect [start, end). Since no slot is
+    longer than MAX_SLOT_LENGTH, the search is a bounded range scan of
+    `slot_interval_idx` on starts_at.
+    """
+    return AvailabilitySlot.objects.filter(
+        service_provider_id=provider_id,
+        starts_at__gt=start - MAX_SLOT_LENGTH,
+        starts_at__lt=end,
+        ends_at__gt=start,
+    ).order_by('starts_at')
+
+
+def free_slots(provider_id, start, end):
+    return overlapping(provider_id, start, end).filter(booking__isnull=True, starts_at__gte=timezone.now())
+
+
+def publish(provider, intervals):
+    """
+    Add (starts_at, ends_at) slots to a provider's calendar, rejecting any
+    that overlap each other or an existing slot.
+    """
+    intervals = sorted(intervals)
+    for (starts_at, ends_at), following in zip(intervals, intervals[1:] + [None]):
+        if not starts_at < ends_at <= starts_at + MAX_SLOT_LENGTH:
+            raise ValueError(f'Slots must end after they start and last at most {MAX_SLOT_LENGTH}.')
+        if following is not None and following[0] < ends_at:
+            raise ValueError('Slots overlap each other.')
+    if not intervals:
+        return []
+
+    with transaction.atomic():
+        # Lock the provider so concurrent publishers check overlaps in turn.
+        ServiceProviderProfile.objects.select_for_update().filter(pk=provider.pk).exists()
+        existing = overlapping(provider.pk, intervals[0][0], intervals[-1][1]).values_list('starts_at', 'ends_at')
+        for starts_at, ends_at in existing:
+            if any(start < ends_at and starts_at < end for start, end in intervals):
+                raise ValueError('Slots overlap an existing slot.')
+        return AvailabilitySlot.objects.bulk_create(
+            AvailabilitySlot(service_provider=provider, starts_at=start, ends_at=end) for start, end in intervals
+        )
+
+
+def reserve(client, slot, service):
+    """
+    Book `slot` for `client`. The claim is a single conditional UPDATE, so
+    of several concurrent callers exactly one sees a row change and the
+    rest roll back their booking and get SlotUnavailable.
+    """
+    with writequeue.serialized():
+        booking = Booking.objects.create(
+            client=client, service_provider_id=slot.service_provider_id, service=service,
+            booking_date=slot.starts_at, status='confirmed',
+        )
+        claimed = AvailabilitySlot.objects.filter(
+            pk=slot.pk, booking__isnull=True, starts_at__gte=timezone.now()
+        ).update(booking=booking)
+        if not claimed:
+            raise SlotUnavailable()
+    return booking
@@ -0,0 +1,522 @@
+import http.client
+import itertools
+import json
+import math
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from urllib.parse import urlencode, urlsplit
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from socketserver import ThreadingMixIn
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import search
+from .models import (
+    User, ServiceProviderProfile, ServiceCategory, Service, ServiceSearchDocument, Conversation, ConversationMember,
+    Message, Notification, NotificationCounter,
+)
+
+EMAIL_PREFIX = 'bench-'
+PASSWORD = 'benchmark-password'
+
+VOLUMES = {
+    'users': 1_000_000,
+    'providers': 200_000,
+    'services': 2_000_000,
+    'messages': 10_000_000,
+    'notifications': 2_000_000,
+    'accounts': 1_000,
+}
+
+CITIES = [
+    ('Tunis', 36.81, 10.18), ('Sfax', 34.74, 10.76), ('Sousse', 35.83, 10.64), ('Kairouan', 35.68, 10.10),
+    ('Bizerte', 37.27, 9.87), ('Gabes', 33.88, 10.10), ('Ariana', 36.86, 10.19), ('Nabeul', 36.45, 10.74),
+]
+TRADES = {
+    'Plumbing': ('Plumber', ['Pipe repair', 'Drain unblocking', 'Boiler service', 'Leak detection']),
+    'Electrical': ('Electrician', ['Rewiring', 'Socket installation', 'Lighting repair', 'Fuse box upgrade']),
+    'Gardening': ('Gardener', ['Hedge trimming', 'Lawn mowing', 'Tree pruning', 'Garden design']),
+    'Cleaning': ('Cleaner', ['Deep cleaning', 'Window cleaning', 'Carpet cleaning', 'Office cleaning']),
+    'Painting': ('Painter', ['Interior painting', 'Facade painting', 'Wallpapering', 'Varnishing']),
+    'Carpentry': ('Carpenter', ['Door fitting', 'Kitchen cabinets', 'Furniture repair', 'Parquet laying']),
+    'Tutoring': ('Tutor', ['Maths lessons', 'Physics lessons', 'Language lessons', 'Exam preparation']),
+    'Moving': ('Mover', ['House moving', 'Piano moving', 'Furniture assembly', 'Storage transport']),
+}
+WORDS = ['fast', 'reliable', 'affordable', 'certified', 'weekend', 'emergency', 'quality', 'local', 'expert']
+SEARCH_TERMS = ['pipe', 'drain', 'boil', 'wiring', 'hedge', 'lawn', 'clean', 'paint', 'door', 'maths', 'mov', 'tunis']
+
+
+def _batches(items, size):
+    items = iter(items)
+    while batch := list(itertools.islice(items, size)):
+        yield batch
+
+
+class Seeder:
+    """
+    Bulk-generate a deterministic dataset of the given volumes. Writes go
+    through bulk_create, so everything save() and the signals would derive
+    (geohashes, search index and documents, conversation pointers, unread
+    counters) is computed here instead.
+    """
+    def __init__(self, volumes, batch_size=10000, seed=0, log=None):
+        self.volumes = {**VOLUMES, **volumes}
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        self.log = log or (lambda message: None)
+
+    def run(self):
+        if User.objects.filter(email__startswith=EMAIL_PREFIX).exists():
+            raise ValueError('The database already holds benchmark data.')
+        started = time.perf_counter()
+        for step in (self.users, self.providers, self.services, self.messages, self.notifications, self.accounts):
+            start = time.perf_counter()
+            count = step()
+            self.log(f'{step.__name__}: {count:,} rows in {time.perf_counter() - start:.1f}s')
+        self.log(f'Seeded in {time.perf_counter() - started:.1f}s')
+
+    def _create(self, model, objects):
+        """
+        Insert `objects` (any iterable) in batches and return their ids.
+        """
+        ids = []
+        for batch in _batches(objects, self.batch_size):
+            with transaction.atomic():
+                ids += [obj.pk for obj in model.objects.bulk_create(batch)]
+        return ids
+
+    def users(self):
+        rng, providers = self.rng, self.volumes['providers']
+        ids = self._create(User, (
+            User(
+                email=f'{EMAIL_PREFIX}{i}@example.com',
+                user_type='service_provider' if i < providers else 'client',
+                first_name=f'First{i % 997}', last_name=f'Last{i % 991}',
+                phone_number=f'+216{rng.randrange(10 ** 7, 10 ** 8)}',
+                address=f'{rng.randrange(1, 200)} Rue {rng.choice(CITIES)[0]}',
+            )
+            for i in range(self.volumes['users'])
+        ))
+        self.provider_user_ids, self.client_ids = ids[:providers], ids[providers:]
+        return len(ids)
+
+    def _place(self, obj):
+        city, lat, lon = self.rng.choice(CITIES)
+        obj.location = city
+        obj.latitude = lat + self.rng.uniform(-0.1, 0.1)
+        obj.longitude = lon + self.rng.uniform(-0.1, 0.1)
+        obj.set_geohash()
+        return obj
+
+    def providers(self):
+        rng, trades = self.rng, list(TRADES)
+        self.provider_trades = [rng.choice(trades) for _ in self.provider_user_ids]
+        self.profile_ids = self._create(ServiceProviderProfile, (
+            self._place(ServiceProviderProfile(
+                user_id=user_id, profession=TRADES[trade][0], experience=rng.randrange(0, 30),
+                service_description=f'{rng.choice(WORDS).capitalize()} {TRADES[trade][0].lower()}',
+            ))
+            for user_id, trade in zip(self.provider_user_ids, self.provider_trades)
+        ))
+        return len(self.profile_ids)
+
+    def services(self):
+        rng = self.rng
+        categories = {
+            category.name: category.pk
+            for category in ServiceCategory.objects.bulk_create(ServiceCategory(name=name) for name in TRADES)
+        }
+        rating = ServiceProviderProfile._meta.get_field('rating').get_default()
+
+        def services():
+            for i in range(self.volumes['services']):
+                # Every provider gets one service before the rest are spread at random.
+                provider = i if i < len(self.profile_ids) else rng.randrange(len(self.profile_ids))
+                trade = self.provider_trades[provider]
+                yield self._place(Service(
+                    service_provider_id=self.profile_ids[provider], category_id=categories[trade],
+                    title=rng.choice(TRADES[trade][1]),
+                    description=f'{rng.choice(WORDS).capitalize()} and {rng.choice(WORDS)} service',
+                    price=Decimal(rng.randrange(1000, 50000)) / 100, rating=rating,
+                ))
+
+        count = len(self._create(Service, services()))
+        search.rebuild_index()
+        ServiceSearchDocument.objects.reconcile(batch_size=self.batch_size)
+        return count
+
+    def messages(self):
+        """
+        Spread messages over client-provider conversations of ~20 messages,
+        tracking each member's read cursor and unread count as they go.
+        """
+        rng, total = self.rng, self.volumes['messages']
+        pairs = {
+            (rng.choice(self.client_ids), rng.choice(self.provider_user_ids)) for _ in range(max(1, total // 20))
+        }
+        pairs = sorted(pairs)
+        conversation_ids = self._create(Conversation, (
+            Conversation(pair_key=f'{min(pair)}:{max(pair)}') for pair in pairs
+        ))
+
+        unread = defaultdict(int)
+        read_cursor, last_message = {}, {}
+        created = 0
+        for start in range(0, total, self.batch_size):
+            batch = []
+            for _ in range(min(self.batch_size, total - start)):
+                index = rng.randrange(len(pairs))
+                sender, receiver = pairs[index] if rng.random() < 0.5 else pairs[index][::-1]
+                batch.append(Message(
+                    conversation_id=conversation_ids[index], sender_id=sender, receiver_id=receiver,
+                    content=f'{rng.choice(WORDS).capitalize()} message about {rng.choice(SEARCH_TERMS)}',
+                ))
+            with transaction.atomic():
+                Message.objects.bulk_create(batch)
+            for message in batch:
+                conversation = message.conversation_id
+                last_message[conversation] = (message.pk, message.created_at)
+                unread[conversation, message.receiver_id] += 1
+                unread[conversation, message.sender_id] = 0
+                read_cursor[conversation, message.sender_id] = message.pk
+            created += len(batch)
+
+        for batch in _batches(last_message.items(), self.batch_size):
+            Conversation.objects.bulk_update(
+                [Conversation(pk=pk, last_message_id=message_id) for pk, (message_id, _) in batch],
+                ['last_message'], batch_size=1000,
+            )
+        now = timezone.now()
+
+        def members():
+            for conversation, pair in zip(conversation_ids, pairs):
+                latest_at = last_message.get(conversation, (None, now))[1]
+                for user, peer in (pair, pair[::-1]):
+                    yield ConversationMember(
+                        conversation_id=conversation, user_id=user, peer_id=peer, last_message_at=latest_at,
+                        last_read_message_id=read_cursor.get((conversation, user)),
+                        unread_count=unread[conversation, user],
+                    )
+
+        self._create(ConversationMember, members())
+        return created
+
+    def notifications(self):
+        rng, unread = self.rng, defaultdict(int)
+        users = self.client_ids + self.provider_user_ids
+
+        def notifications():
+            for i in range(self.volumes['notifications']):
+                notification = Notification(user_id=rng.choice(users), message=f'Update {i}', read=rng.random() < 0.6)
+                unread[notification.user_id] += not notification.read
+                yield notification
+
+        count = len(self._create(Notification, notifications()))
+        self._create(NotificationCounter, (
+            NotificationCounter(user_id=user_id, unread=count) for user_id, count in unread.items()
+        ))
+        return count
+
+    def accounts(self):
+        """
+        Login accounts and API tokens for the first clients; `auth.User`
+        rows share their id with the `users.User` they act for.
+        """
+        ids = self.client_ids[:self.volumes['accounts']]
+        password = make_password(PASSWORD)
+        account_ids = self._create(get_user_model(), (
+            get_user_model()(id=user_id, username=f'{EMAIL_PREFIX}{user_id}', password=password) for user_id in ids
+        ))
+        self._create(Token, (Token(user_id=user_id, key=Token.generate_key()) for user_id in account_ids))
+        return len(account_ids)
+
+
+class Context:
+    """
+    What scenarios draw from: the benchmark accounts and their tokens.
+    """
+    def __init__(self):
+        rows = Token.objects.filter(user__username__startswith=EMAIL_PREFIX).values_list('key', 'user__username')
+        self.tokens = [key for key, _ in rows]
+        self.usernames = [username for _, username in rows]
+        if not self.tokens:
+            raise ValueError('No benchmark accounts found; run seed_benchmark_data first.')
+
+
+def _authorized(context, rng):
+    return {'Authorization': f'Token {rng.choice(context.tokens)}'}
+
+
+def search_services(context, rng):
+    params = {'search': rng.choice(SEARCH_TERMS)}
+    ordering = rng.choice(['', 'price', '-rating'])
+    if ordering:
+        params['ordering'] = ordering
+    return 'GET', f'/services/search/?{urlencode(params)}', None, {}
+
+
+def search_cards(context, rng):
+    method, url, body, headers = search_services(context, rng)
+    return method, url.replace('/services/search/', '/services/search/cards/'), body, headers
+
+
+def login(context, rng):
+    return 'POST', '/users/login/', {'username': rng.choice(context.usernames), 'password': PASSWORD}, {}
+
+
+def inbox(context, rng):
+    return 'GET', '/conversations/', None, _authorized(context, rng)
+
+
+def messages(context, rng):
+    return 'GET', '/messages/', None, _authorized(context, rng)
+
+
+def notification_feed(context, rng):
+    return 'GET', '/notifications/', None, _authorized(context, rng)
+
+
+def mark_notifications(context, rng):
+    return 'POST', '/notifications/mark-all-read/', None, _authorized(context, rng)
+
+
+SCENARIOS = {
+    'search': search_services,
+    'search-cards': search_cards,
+    'login': login,
+    'inbox': inbox,
+    'messages': messages,
+    'notification-feed': notification_feed,
+    'notifications': mark_notifications,
+}
+
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+def _queries(server_timing):
+    match = QUERIES_RE.search(server_timing or '')
+    return int(match[1]) if match else None
+
+
+class ClientDriver:
+    """
+    Drive the app in-process through Django's test client.
+    """
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, data, headers):
+        body = json.dumps(data) if data is not None else ''
+        response = self.client.generic(method, path, body, content_type='application/json', headers=headers)
+        return response.status_code, _queries(response.headers.get('Server-Timing'))
+
+    def close(self):
+        # Worker threads own their connection; the caller's open transaction does not.
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+class HTTPDriver:
+    """
+    Drive a running server over HTTP/1.1, one kept-alive connection per
+    worker thread.
+    """
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        self.prefix = parts.path.rstrip('/')
+
+    def request(self, method, path, data, headers):
+        body = json.dumps(data) if data is not None else None
+        headers = {**headers, 'Content-Type': 'application/json'}
+        try:
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            return 0, None
+        response.read()
+        if response.getheader('Connection', '').lower() == 'close':
+            self.connection.close()
+        return response.status, _queries(response.getheader('Server-Timing'))
+
+    def close(self):
+        self.connection.close()
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class LocalWSGIServer:
+    """
+    Serve the project's WSGI application on a free local port for the
+    duration of a `with` block.
+    """
+    def __enter__(self):
+        self.server = make_server(
+            '127.0.0.1', 0, get_wsgi_application(), server_class=_ThreadingWSGIServer, handler_class=_QuietHandler
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Both run under gunicorn's process manager so only the interface differs.
+# (uvicorn's own --workers listener also leaves TCP_NODELAY off, which adds
+# ~40 ms of delayed-ACK stall to every keep-alive response.)
+SERVERS = {
+    'uvicorn': [
+        '-m', 'gunicorn', 'profinder_backend.asgi:application', '--bind', '127.0.0.1:{port}',
+        '--workers', '{workers}', '--worker-class', 'uvicorn.workers.UvicornWorker', '--log-level', 'warning',
+    ],
+    'gunicorn': [
+        '-m', 'gunicorn', 'profinder_backend.wsgi:application', '--bind', '127.0.0.1:{port}',
+        '--workers', '{workers}', '--threads', '{threads}', '--log-level', 'warning',
+    ],
+}
+
+
+class ServerProcess:
+    """
+    Run one of `SERVERS` on a free local port, with this process's settings
+    module and environment, for the duration of a `with` block.
+    """
+    def __init__(self, server, workers=1, threads=1, timeout=30):
+        self.server = server
+        self.workers = workers
+        self.threads = threads
+        self.timeout = timeout
+
+    def __enter__(self):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        arguments = [
+            argument.format(port=port, workers=self.workers, threads=self.threads)
+            for argument in SERVERS[self.server]
+        ]
+        self.process = subprocess.Popen([sys.executable, *arguments], cwd=settings.BASE_DIR)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return f'http://127.0.0.1:{port}'
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.__exit__()
+                    raise RuntimeError(f'{self.server} did not start listening on port {port}.')
+                time.sleep(0.1)
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of sorted `values`.
+    """
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def run_scenario(name, make_driver, context, requests, concurrency=1, warmup=0, seed=0):
+    """
+    Issue `requests` requests of scenario `name` from `concurrency` worker
+    threads and summarise latency, throughput, errors and queries.
+    """
+    scenario = SCENARIOS[name]
+    share = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+
+    def worker(index, count):
+        rng = random.Random(seed * 1000 + index)
+        driver = make_driver()
+        latencies, queries, errors = [], [], 0
+        try:
+            for _ in range(warmup):
+                driver.request(*scenario(context, rng))
+            for _ in range(count):
+                request = scenario(context, rng)
+                start = time.perf_counter()
+                status, query_count = driver.request(*request)
+                latencies.append(time.perf_counter() - start)
+                errors += not 200 <= status < 400
+                if query_count is not None:
+                    queries.append(query_count)
+        finally:
+            driver.close()
+        return latencies, queries, errors
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        results = [worker(0, share[0])]
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(worker, range(concurrency), share))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    queries = [count for result in results for count in result[1]]
+    return {
+        'requests': len(latencies),
+        'errors': sum(result[2] for result in results),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'queries': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    List regressions of `results` against `baseline`: latency percentiles or
+    throughput worse by more than `tolerance`, queries per request up by
+    half a query or more (cache hits make the average drift slightly), or
+    errors where the baseline had none.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if result[key] > before[key] * (1 + tolerance):
+                regressions.append(f'{name}: {key} {result[key]} > {before[key]} (+{tolerance:.0%})')
+        if result['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']} < {before['throughput']} (-{tolerance:.0%})")
+        if None not in (result['queries'], before['queries']) and result['queries'] - before['queries'] >= 0.5:
+            regressions.append(f"{name}: queries per request {result['queries']} > {before['queries']}")
+        if result['errors'] and not before['errors']:
+            regressions.append(f"{name}: {result['errors']} errors")
+    return regressions
@@ -0,0 +1,132 @@
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from rest_framework import serializers, relations
+from rest_framework.response import Response
+
+# Fields whose to_representation returns database values unchanged.
+PASSTHROUGH_FIELDS = (
+    serializers.CharField, serializers.EmailField, serializers.IntegerField,
+    serializers.BooleanField, serializers.FloatField, serializers.ChoiceField,
+    serializers.ReadOnlyField, relations.PrimaryKeyRelatedField,
+)
+
+
+class NotCompilable(TypeError):
+    pass
+
+
+class CompiledSerializer:
+    """
+    Read-only rendering plan for a ModelSerializer. Rows are fetched with
+    `.values()` and turned into the same dicts the serializer would build,
+    without instantiating serializers or model instances.
+    """
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self.paths = []
+        self.plan = self._compile(serializer_class(), '')
+
+    def _compile(self, serializer, prefix):
+        if not isinstance(serializer, serializers.ModelSerializer):
+            raise NotCompilable(f'{type(serializer).__name__} is not a ModelSerializer')
+        model = serializer.Meta.model
+        plan = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or isinstance(field, (serializers.SerializerMethodField, serializers.ListSerializer)):
+                raise NotCompilable(f'{name} cannot be read with .values()')
+            path = prefix + field.source.replace('.', '__')
+            if isinstance(field, serializers.ModelSerializer):
+                model_field = model._meta.get_field(field.source.split('.')[0])
+                if model_field.many_to_many or model_field.one_to_many:
+                    raise NotCompilable(f'{name} is a to-many relation')
+                guard = None
+                if model_field.null:
+                    guard = path
+                    self.paths.append(guard)
+                plan.append((name, 'nested', (guard, self._compile(field, path + '__'))))
+                continue
+            if isinstance(field, relations.RelatedField) and not isinstance(field, relations.PrimaryKeyRelatedField):
+                raise NotCompilable(f'{name} renders a related object')
+            self.paths.append(path)
+            if type(field) in PASSTHROUGH_FIELDS and getattr(field, 'pk_field', None) is None:
+                plan.append((name, 'value', path))
+            else:
+                plan.append((name, 'convert', (path, field.to_representation)))
+        return plan
+
+    def values(self, queryset, *extra):
+        """
+        Return `queryset` as `.values()` rows carrying every rendered path.
+        """
+        return queryset.values(*dict.fromkeys([*self.paths, *extra]))
+
+    def render_row(self, row, plan=None):
+        ret = {}
+        for name, kind, arg in self.plan if plan is None else plan:
+            if kind == 'value':
+                ret[name] = row[arg]
+            elif kind == 'convert':
+                value = row[arg[0]]
+                ret[name] = None if value is None else arg[1](value)
+            else:
+                guard, nested = arg
+                ret[name] = None if guard and row[guard] is None else self.render_row(row, nested)
+        return ret
+
+    def render(self, rows):
+        return [self.render_row(row) for row in rows]
+
+
+@lru_cache(maxsize=None)
+def compile_serializer(serializer_class):
+    return CompiledSerializer(serializer_class)
+
+
+class CompiledListMixin:
+    """
+    Serve `list` through the compiled read-only path of the view's
+    serializer, falling back to regular serialization when it cannot be
+    compiled.
+    """
+    def list(self, request, *args, **kwargs):
+        return self.compiled_list_response(self.filter_queryset(self.get_queryset()))
+
+    def compiled_list_response(self, queryset):
+        try:
+            compiled = compile_serializer(self.get_serializer_class())
+        except NotCompilable:
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page if page is not None else queryset, many=True)
+            if page is None:
+                return Response(serializer.data)
+            return self.get_paginated_response(serializer.data)
+
+        rows = compiled.values(queryset, *self._ordering_keys(queryset))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(compiled.render(rows))
+        return self.get_paginated_response(compiled.render(page))
+
+    async def acompiled_list_response(self, queryset):
+        """
+        `compiled_list_response` for async views. The page is fetched with
+        the async ORM when the serializer compiles and the paginator can
+        seek asynchronously; otherwise the sync path runs in a worker thread.
+        """
+        try:
+            compiled = compile_serializer(self.get_serializer_class())
+        except NotCompilable:
+            compiled = None
+        if compiled is None or not hasattr(self.paginator, 'apaginate_queryset'):
+            return await sync_to_async(self.compiled_list_response)(queryset)
+        rows = compiled.values(queryset, *self._ordering_keys(queryset))
+        page = await self.paginator.apaginate_queryset(rows, self.request, view=self)
+        return self.get_paginated_response(compiled.render(page))
+
+    def _ordering_keys(self, queryset):
+        if self.paginator is not None and hasattr(self.paginator, 'get_ordering'):
+            return [key.lstrip('-') for key in self.paginator.get_ordering(queryset)]
+        return []
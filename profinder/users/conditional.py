@@ -0,0 +1,144 @@
+import hashlib
+import time
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Subquery, Value
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import search_cache
+
+
+class CacheControlMixin:
+    """
+    Add `Cache-Control` to successful GET responses: `public` views may be
+    stored by any cache for `PUBLIC_CACHE_MAX_AGE` seconds, `private` ones
+    only by the client, which must revalidate them before each reuse.
+    """
+    cache_scope = 'private'
+
+    def get_cache_control(self):
+        if self.cache_scope == 'public':
+            return {'public': True, 'max_age': settings.PUBLIC_CACHE_MAX_AGE}
+        return {'private': True, 'no_cache': True}
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+            patch_cache_control(response, **self.get_cache_control())
+            if self.cache_scope != 'public':
+                patch_vary_headers(response, ['Authorization'])
+        return response
+
+
+def deletion_tag(model):
+    return f'deleted:{model._meta.label_lower}'
+
+
+class ConditionalGetMixin(CacheControlMixin):
+    """
+    ETag for `list` and `retrieve`, answered with 304 before any row is
+    fetched or serialized. The main validator is the newest `etag_field`
+    (`updated_at`, which creates set too), read with `ORDER BY ... DESC
+    LIMIT 1` through an index on the queryset's filter and that field.
+    A list also counts its rows through the same index: a row saved out of
+    the filter leaves the newest timestamp as it was, but not the count.
+    `etag_aggregates` add values computed over the whole queryset, for
+    per-user querysets small enough to add up, such as the timestamps of
+    related rows the serializer renders.
+
+    Deletions leave no timestamp behind, so the version of each model in
+    `etag_deletions` (the view's model by default), bumped on `post_delete`
+    in the search cache, is part of the ETag too.
+
+    Detail responses also carry Last-Modified, but only once its second has
+    passed: a later write then always lands in a later second, so an
+    `If-Modified-Since` check cannot miss it. Lists have none, as a
+    timestamp cannot show a deletion.
+
+    The validators are read before the body, so a write landing in between
+    leaves an ETag older than the body; the next request then misses and
+    refetches, which is safe.
+    """
+    etag_field = 'updated_at'
+    etag_aggregates = {}
+    etag_deletions = None
+
+    def list(self, request, *args, **kwargs):
+        return self.not_modified(request) or super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.not_modified(request, self.get_object_queryset(), detail=True) or super().retrieve(
+            request, *args, **kwargs
+        )
+
+    def get_object_queryset(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+
+    def not_modified(self, request, queryset=None, detail=False):
+        """
+        Set this response's validators from `queryset` (the filtered list
+        by default) and return a 304 response if the client's copy is
+        current, else None. A `detail` queryset with no row is left to the
+        view's 404.
+        """
+        rows = list(self._validator_query(queryset, detail))
+        versions = search_cache.versions(self._deletion_tags(queryset))
+        return self._conditional(request, rows, versions, detail)
+
+    async def anot_modified(self, request, queryset=None, detail=False):
+        rows = [row async for row in self._validator_query(queryset, detail)]
+        versions = await sync_to_async(search_cache.versions)(self._deletion_tags(queryset))
+        return self._conditional(request, rows, versions, detail)
+
+    def _validator_query(self, queryset, detail=False):
+        if queryset is None:
+            queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.select_related(None).prefetch_related(None).order_by()
+        etag_aggregates = self.etag_aggregates if detail else {'count': Count('pk'), **self.etag_aggregates}
+        # Prefixed so that an alias never shadows a field the aggregates join through.
+        aggregates = {
+            f'etag_{name}': Subquery(
+                queryset.annotate(etag_group=Value(1)).values('etag_group').annotate(value=aggregate).values('value')
+            )
+            for name, aggregate in etag_aggregates.items()
+        }
+        # The newest row hosts the aggregates, so an empty queryset yields no row.
+        return (
+            queryset.order_by(f'-{self.etag_field}').annotate(**aggregates)
+            .values(self.etag_field, *aggregates)[:1]
+        )
+
+    def _deletion_tags(self, queryset):
+        if self.etag_deletions is not None:
+            return [deletion_tag(model) for model in self.etag_deletions]
+        return [deletion_tag(queryset.model if queryset is not None else self.get_queryset().model)]
+
+    def _conditional(self, request, rows, versions, detail):
+        validators = rows[0] if rows else {}
+        if detail and all(value is None for value in validators.values()):
+            return None
+        state = (
+            request.get_full_path(), request.accepted_media_type, sorted(validators.items()), sorted(versions.items())
+        )
+        self.etag = '"%s"' % hashlib.md5(repr(state).encode(), usedforsecurity=False).hexdigest()
+        self.last_modified = None
+        modified = [value for value in validators.values() if isinstance(value, datetime)]
+        if detail and modified:
+            last_modified = int(max(modified).timestamp())
+            if last_modified < int(time.time()):
+                self.last_modified = last_modified
+        return get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'etag', None) and response.status_code in (200, 304):
+            response['ETag'] = self.etag
+            if self.last_modified is not None:
+                response['Last-Modified'] = http_date(self.last_modified)
+        return response
@@ -0,0 +1,110 @@
+import math
+
+from django.db.models import Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9
+MAX_CELLS = 16
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """
+    Encode a coordinate as a geohash of `precision` characters.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = bit_count = 0
+    even = True
+    while len(chars) < precision:
+        bounds, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            bounds[0] = mid
+        else:
+            bits = bits * 2
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = bit_count = 0
+    return ''.join(chars)
+
+
+def _grid(precision):
+    bits = 5 * precision
+    lat_bits, lon_bits = bits // 2, (bits + 1) // 2
+    return 2 ** lat_bits, 2 ** lon_bits
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distance between two coordinates, in kilometres.
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Return (min_lat, max_lat, min_lon, max_lon) enclosing a circle.
+    Longitudes may fall outside [-180, 180] near the antimeridian.
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(latitude))
+    if cos_lat < 1e-9:
+        dlon = 180.0
+    else:
+        dlon = min(180.0, math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)))
+    return max(-90.0, latitude - dlat), min(90.0, latitude + dlat), longitude - dlon, longitude + dlon
+
+
+def covering_cells(min_lat, max_lat, min_lon, max_lon, max_cells=MAX_CELLS):
+    """
+    Return the geohash prefixes of the finest grid that covers the box in
+    at most `max_cells` cells (or the coarsest grid, if none does).
+    """
+    for precision in range(PRECISION, 0, -1):
+        lat_cells, lon_cells = _grid(precision)
+        height, width = 180.0 / lat_cells, 360.0 / lon_cells
+        first_row = max(0, math.floor((min_lat + 90) / height))
+        last_row = min(lat_cells - 1, math.floor((max_lat + 90) / height))
+        first_col = math.floor((min_lon + 180) / width)
+        last_col = min(first_col + lon_cells - 1, math.floor((max_lon + 180) / width))
+        if (last_row - first_row + 1) * (last_col - first_col + 1) <= max_cells:
+            break
+
+    cells = set()
+    for row in range(first_row, last_row + 1):
+        for col in range(first_col, last_col + 1):
+            latitude = -90 + (row + 0.5) * height
+            longitude = -180 + (col % lon_cells + 0.5) * width
+            cells.add(encode(latitude, longitude, precision))
+    return sorted(cells)
+
+
+def nearby(queryset, latitude, longitude, radius_km):
+    """
+    Return objects within `radius_km` of a point, nearest first, each with a
+    `distance_km` attribute. Candidates come from geohash range scans; only
+    those are measured exactly.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    cells = Q()
+    for cell in covering_cells(min_lat, max_lat, min_lon, max_lon):
+        cells |= Q(geohash__gte=cell, geohash__lt=cell + '~')
+
+    results = []
+    for obj in queryset.filter(cells, latitude__range=(min_lat, max_lat)):
+        distance = haversine(latitude, longitude, obj.latitude, obj.longitude)
+        if distance <= radius_km:
+            obj.distance_km = round(distance, 3)
+            results.append(obj)
+    results.sort(key=lambda obj: (obj.distance_km, obj.pk))
+    return results
@@ -0,0 +1,351 @@
+import csv
+import io
+import json
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+
+from . import search, search_cache, suggest
+from .authentication import principal_cache
+from .models import User, ServiceProviderProfile, ServiceCategory, Service, ServiceSearchDocument
+
+CHUNK_SIZE = 5000
+PHONE_RE = re.compile(r'^\+?[0-9]{8,15}$')
+TRUE_VALUES = {'1', 'true', 't', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'f', 'no', 'n'}
+
+
+def text(max_length):
+    def parse(value):
+        if len(value) > max_length:
+            raise ValueError(f'Ensure this field has no more than {max_length} characters.')
+        return value
+    return parse
+
+
+def email(value):
+    try:
+        validate_email(value)
+    except ValidationError:
+        raise ValueError('Enter a valid email address.')
+    return value
+
+
+def phone(value):
+    if not PHONE_RE.match(value):
+        raise ValueError('Enter a valid phone number.')
+    return value
+
+
+def integer(min_value=None):
+    def parse(value):
+        number = int(value)
+        if min_value is not None and number < min_value:
+            raise ValueError(f'Ensure this value is greater than or equal to {min_value}.')
+        return number
+    return parse
+
+
+def number(min_value, max_value):
+    def parse(value):
+        result = float(value)
+        if not min_value <= result <= max_value:
+            raise ValueError(f'Ensure this value is between {min_value} and {max_value}.')
+        return result
+    return parse
+
+
+def decimal(max_digits, decimal_places):
+    limit = Decimal(10) ** (max_digits - decimal_places)
+    quantum = Decimal(1).scaleb(-decimal_places)
+
+    def parse(value):
+        try:
+            result = Decimal(value)
+        except InvalidOperation:
+            raise ValueError('A valid number is required.')
+        if not result.is_finite() or result < 0 or result >= limit:
+            raise ValueError(f'Ensure this value is between 0 and {limit}.')
+        if result != result.quantize(quantum):
+            raise ValueError(f'Ensure that there are no more than {decimal_places} decimal places.')
+        return result.quantize(quantum)
+    return parse
+
+
+def boolean(value):
+    lowered = value.lower()
+    if lowered in TRUE_VALUES:
+        return True
+    if lowered in FALSE_VALUES:
+        return False
+    raise ValueError('Must be a valid boolean.')
+
+
+class Column:
+    def __init__(self, name, parse, required=False, default=None):
+        self.name = name
+        self.parse = parse
+        self.required = required
+        self.default = default
+
+
+def validate_columns(columns, rows):
+    """
+    Validate a batch one column at a time. Returns the cleaned rows and a
+    dict of row index -> {column: message}.
+    """
+    cleaned = [{} for _ in rows]
+    errors = {}
+    for column in columns:
+        parse, name = column.parse, column.name
+        for i, row in enumerate(rows):
+            raw = row.get(name)
+            raw = '' if raw is None else str(raw).strip()
+            if not raw:
+                if column.required:
+                    errors.setdefault(i, {})[name] = 'This field is required.'
+                cleaned[i][name] = column.default
+                continue
+            try:
+                cleaned[i][name] = parse(raw)
+            except (ValueError, TypeError) as exc:
+                errors.setdefault(i, {})[name] = str(exc) or 'Invalid value.'
+    return cleaned, errors
+
+
+def _geohash(obj):
+    obj.set_geohash()
+    return obj
+
+
+class ProviderImporter:
+    """
+    Upsert service providers keyed by email: the `User` row and its
+    `ServiceProviderProfile`. A row naming an account of another type is
+    rejected, unless `convert_clients` asks for that account to become a
+    provider.
+    """
+    columns = [
+        Column('email', email, required=True),
+        Column('first_name', text(30), default=''),
+        Column('last_name', text(30), default=''),
+        Column('phone_number', phone, default=''),
+        Column('address', text(255), default=''),
+        Column('profession', text(100), required=True),
+        Column('location', text(100), default=''),
+        Column('service_description', str, default=''),
+        Column('experience', integer(min_value=0), default=0),
+        Column('latitude', number(-90.0, 90.0)),
+        Column('longitude', number(-180.0, 180.0)),
+    ]
+    user_fields = ['first_name', 'last_name', 'phone_number', 'address']
+    profile_fields = ['profession', 'location', 'service_description', 'experience', 'latitude', 'longitude']
+
+    def __init__(self, convert_clients=False):
+        self.convert_clients = convert_clients
+
+    def check_batch(self, cleaned, errors):
+        seen = set()
+        for i, row in enumerate(cleaned):
+            if i in errors:
+                continue
+            if row['email'] in seen:
+                errors[i] = {'email': 'Duplicate email in this batch.'}
+            seen.add(row['email'])
+        if self.convert_clients:
+            return
+        others = set(User.objects.filter(email__in=seen).exclude(user_type='service_provider').values_list(
+            'email', flat=True
+        ))
+        for i, row in enumerate(cleaned):
+            if i not in errors and row['email'] in others:
+                errors[i] = {'email': 'This email belongs to an account that is not a service provider.'}
+
+    def write(self, rows):
+        now = timezone.now()
+        existing_users = {user.email: user for user in User.objects.filter(email__in=[row['email'] for row in rows])}
+        new_users, changed_users = [], []
+        for row in rows:
+            user = existing_users.get(row['email'])
+            if user is None:
+                user = User(email=row['email'])
+                new_users.append(user)
+            else:
+                changed_users.append(user)
+            for field in self.user_fields:
+                setattr(user, field, row[field])
+            user.user_type = 'service_provider'
+            user.updated_at = now
+            row['user'] = user
+        User.objects.bulk_create(new_users)
+        User.objects.bulk_update(changed_users, [*self.user_fields, 'user_type', 'updated_at'])
+
+        profiles = ServiceProviderProfile.objects.filter(user_id__in=[row['user'].pk for row in rows])
+        existing_profiles = {profile.user_id: profile for profile in profiles}
+        new_profiles, changed_profiles = [], []
+        for row in rows:
+            profile = existing_profiles.get(row['user'].pk)
+            if profile is None:
+                profile = ServiceProviderProfile(user=row['user'])
+                new_profiles.append(profile)
+            else:
+                changed_profiles.append(profile)
+            for field in self.profile_fields:
+                setattr(profile, field, row[field])
+            profile.updated_at = now
+            _geohash(profile)
+        ServiceProviderProfile.objects.bulk_create(new_profiles)
+        ServiceProviderProfile.objects.bulk_update(
+            changed_profiles, [*self.profile_fields, 'geohash', 'updated_at']
+        )
+        suggest.providers_changed([*new_profiles, *changed_profiles])
+        ServiceSearchDocument.objects.refresh(
+            Service.objects.filter(service_provider__in=[profile.pk for profile in changed_profiles])
+        )
+
+        user_tags = [tag for user in changed_users for tag in search_cache.user_tags(user.pk)]
+        transaction.on_commit(lambda: search_cache.invalidate(*user_tags))
+        # bulk_update sends no post_save, so the cached principals are revoked here.
+        changed_ids = [user.pk for user in changed_users]
+        transaction.on_commit(lambda: principal_cache.revoke_users(*changed_ids))
+        return len(new_users), len(changed_users)
+
+
+class ServiceImporter:
+    """
+    Create services for existing providers, creating categories by name
+    as needed.
+    """
+    columns = [
+        Column('provider_email', email, required=True),
+        Column('category', text(100), required=True),
+        Column('title', text(100), required=True),
+        Column('description', str, required=True),
+        Column('price', decimal(max_digits=10, decimal_places=2), required=True),
+        Column('location', text(100), default=''),
+        Column('latitude', number(-90.0, 90.0)),
+        Column('longitude', number(-180.0, 180.0)),
+        Column('is_active', boolean, default=True),
+    ]
+    service_fields = ['title', 'description', 'price', 'location', 'latitude', 'longitude', 'is_active']
+
+    def check_batch(self, cleaned, errors):
+        emails = {row['provider_email'] for i, row in enumerate(cleaned) if i not in errors}
+        self.providers = {
+            email: (profile_id, rating)
+            for email, profile_id, rating in ServiceProviderProfile.objects.filter(
+                user__email__in=emails
+            ).values_list('user__email', 'id', 'rating')
+        }
+        for i, row in enumerate(cleaned):
+            if i not in errors and row['provider_email'] not in self.providers:
+                errors[i] = {'provider_email': 'No service provider with this email.'}
+
+    def write(self, rows):
+        names = {row['category'] for row in rows}
+        categories = {category.name: category for category in ServiceCategory.objects.filter(name__in=names)}
+        missing = [ServiceCategory(name=name) for name in sorted(names - categories.keys())]
+        for category in ServiceCategory.objects.bulk_create(missing):
+            categories[category.name] = category
+        suggest.categories_changed(missing)
+
+        services = []
+        for row in rows:
+            profile_id, rating = self.providers[row['provider_email']]
+            services.append(_geohash(Service(
+                service_provider_id=profile_id,
+                category=categories[row['category']],
+                rating=rating,
+                **{field: row[field] for field in self.service_fields}
+            )))
+        Service.objects.bulk_create(services)
+
+        search.reindex_services(*[service.pk for service in services])
+        ServiceSearchDocument.objects.refresh(Service.objects.filter(pk__in=[service.pk for service in services]))
+        suggest.services_changed(services)
+        tags = [tag for service in services for tag in search_cache.service_tags(service)]
+        transaction.on_commit(lambda: search_cache.invalidate(*tags))
+        return len(services), 0
+
+
+IMPORTERS = {
+    'providers': ProviderImporter,
+    'services': ServiceImporter,
+}
+
+
+class MalformedRow:
+    """
+    A line that could not be read as a row, reported like an invalid one.
+    """
+    def __init__(self, errors):
+        self.errors = errors
+
+
+def read_rows(source, input_format):
+    """
+    Iterate dict rows from a text stream of CSV or NDJSON. An NDJSON line
+    that is not a JSON object yields a `MalformedRow` in its place.
+    """
+    if input_format == 'csv':
+        yield from csv.DictReader(source)
+        return
+    for number, line in enumerate(source, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield MalformedRow({'line': f'Line {number} is not valid JSON: {exc}.'})
+            continue
+        if not isinstance(row, dict):
+            yield MalformedRow({'line': f'Line {number} is not a JSON object.'})
+            continue
+        yield row
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest(kind, rows, chunk_size=CHUNK_SIZE, **options):
+    """
+    Validate and write `rows` in chunks, each in its own transaction.
+    Invalid and malformed rows are skipped and reported by 1-based row
+    number. `options` go to the importer.
+    """
+    importer = IMPORTERS[kind](**options)
+    report = {'created': 0, 'updated': 0, 'errors': []}
+    offset = 0
+    for chunk in _chunks(rows, chunk_size):
+        malformed = {i: row.errors for i, row in enumerate(chunk) if isinstance(row, MalformedRow)}
+        readable = [{} if i in malformed else row for i, row in enumerate(chunk)]
+        cleaned, errors = validate_columns(importer.columns, readable)
+        errors.update(malformed)
+        importer.check_batch(cleaned, errors)
+        valid = [row for i, row in enumerate(cleaned) if i not in errors]
+        if valid:
+            with transaction.atomic():
+                created, updated = importer.write(valid)
+            report['created'] += created
+            report['updated'] += updated
+        report['errors'].extend(
+            {'row': offset + i + 1, 'errors': errors[i]} for i in sorted(errors)
+        )
+        offset += len(chunk)
+    return report
+
+
+def ingest_text(kind, body, input_format, chunk_size=CHUNK_SIZE, **options):
+    return ingest(kind, read_rows(io.StringIO(body), input_format), chunk_size, **options)
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import ingest
+from users.benchmark import CITIES, TRADES, WORDS
+
+TARGET_ROWS_PER_MINUTE = 100000
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the bulk import pipeline: import --rows generated providers, then one service for each, and '
+        f'fail below --min-rows-per-minute (default {TARGET_ROWS_PER_MINUTE:,}). Run it against a scratch '
+        'database; the imported rows are left in place.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=TARGET_ROWS_PER_MINUTE)
+        parser.add_argument('--chunk-size', type=int, default=ingest.CHUNK_SIZE)
+        parser.add_argument('--min-rows-per-minute', type=int, default=TARGET_ROWS_PER_MINUTE)
+
+    def handle(self, *args, **options):
+        count, run = options['rows'], f'{time.time_ns():x}'
+        trades = list(TRADES)
+        emails = [f'import-{run}-{i}@example.com' for i in range(count)]
+        kinds = {
+            'providers': (
+                {'email': email, 'profession': TRADES[trades[i % len(trades)]][0],
+                 'location': CITIES[i % len(CITIES)][0], 'experience': str(i % 30)}
+                for i, email in enumerate(emails)
+            ),
+            'services': (
+                {'provider_email': email, 'category': trades[i % len(trades)],
+                 'title': TRADES[trades[i % len(trades)]][1][0], 'description': f'{WORDS[i % len(WORDS)]} service',
+                 'price': f'{10 + i % 490}.50', 'latitude': str(CITIES[i % len(CITIES)][1]),
+                 'longitude': str(CITIES[i % len(CITIES)][2])}
+                for i, email in enumerate(emails)
+            ),
+        }
+
+        slowest = None
+        for kind, rows in kinds.items():
+            began = time.perf_counter()
+            report = ingest.ingest(kind, rows, options['chunk_size'])
+            elapsed = time.perf_counter() - began
+            if report['errors']:
+                raise CommandError(f"{kind}: {len(report['errors'])} rows rejected, first {report['errors'][0]}")
+            rate = count / elapsed * 60
+            slowest = rate if slowest is None else min(slowest, rate)
+            self.stdout.write(f'{kind:<10} {count:>9,} rows in {elapsed:6.2f}s  {rate:>12,.0f} rows/min')
+
+        if slowest < options['min_rows_per_minute']:
+            raise CommandError(
+                f"Import ran at {slowest:,.0f} rows/min, below {options['min_rows_per_minute']:,}."
+            )
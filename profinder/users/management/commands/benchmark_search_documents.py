@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import search
+from users.benchmark import SEARCH_TERMS, percentile
+from users.compiled import compile_serializer
+from users.models import Service, ServiceSearchDocument
+from users.serializers import ServiceCardSerializer, ServiceSerializer
+
+ORDERINGS = ['', 'price', '-rating']
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare search page latency reading result cards through joins from Service against reading them '
+        'from ServiceSearchDocument, with the nested ServiceSearchView payload for reference. Uses the '
+        'data from seed_benchmark_data; the search result cache is not involved.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Runs of every query.')
+        parser.add_argument('--page-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        backend = search.get_backend()
+        if backend is None:
+            raise CommandError('No search backend for this database.')
+        if not ServiceSearchDocument.objects.exists():
+            raise CommandError('No search documents; run reconcile_search_documents first.')
+        cards = compile_serializer(ServiceCardSerializer)
+        nested = compile_serializer(ServiceSerializer)
+        variants = {
+            'nested (joins)': lambda query: nested.render(nested.values(query(Service.objects.all()))),
+            'cards (joins)': lambda query: cards.render(ServiceSearchDocument.objects.source(query(Service.objects.all()))),
+            'cards (flat)': lambda query: cards.render(query(ServiceSearchDocument.objects.all()).values()),
+        }
+        queries = [
+            self.query(backend, term, ordering, options['page_size'])
+            for term in [None, *SEARCH_TERMS] for ordering in ORDERINGS
+        ]
+
+        self.stdout.write(f"{'variant':<16} {'p50 ms':>8} {'p99 ms':>8} {'mean ms':>8}")
+        for name, run in variants.items():
+            latencies = []
+            for _ in range(options['repeat']):
+                for query in queries:
+                    began = time.perf_counter()
+                    run(query)
+                    latencies.append(time.perf_counter() - began)
+            latencies.sort()
+            self.stdout.write(
+                f'{name:<16} {percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} '
+                f'{sum(latencies) / len(latencies) * 1000:>8.2f}'
+            )
+
+    def query(self, backend, term, ordering, page_size):
+        """
+        Return a function applying one search page's filter, ordering and
+        limit to a queryset, as ServiceSearchView would.
+        """
+        def apply(queryset):
+            if term:
+                queryset = backend.filter(queryset, [term])
+            if ordering:
+                queryset = queryset.order_by(ordering, 'id')
+            elif not term:
+                queryset = queryset.order_by('-created_at', '-id')
+            return queryset[:page_size + 1]
+        return apply
@@ -0,0 +1,64 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from users.compiled import compile_serializer
+from users.models import User, ServiceProviderProfile, ServiceCategory, Service
+from users.renderers import FastJSONRenderer
+from users.serializers import ServiceSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF and compiled serialization throughput for services.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['rows'])
+            queryset = Service.objects.select_related('service_provider__user').order_by('id')
+            compiled = compile_serializer(ServiceSerializer)
+
+            drf = self.measure(options['repeat'], lambda: JSONRenderer().render(
+                ServiceSerializer(queryset.all(), many=True).data
+            ))
+            fast = self.measure(options['repeat'], lambda: FastJSONRenderer().render(
+                compiled.render(compiled.values(queryset.all()))
+            ))
+            transaction.set_rollback(True)
+
+        rows = options['rows']
+        self.stdout.write(f'DRF serializer:      {rows / drf:12,.0f} rows/sec')
+        self.stdout.write(f'Compiled serializer: {rows / fast:12,.0f} rows/sec')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {drf / fast:.1f}x'))
+
+    def measure(self, repeat, render):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            render()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def seed(self, rows):
+        category = ServiceCategory.objects.create(name='Benchmark')
+        users = User.objects.bulk_create(
+            User(email=f'bench{i}@example.com', user_type='service_provider', first_name='Bench')
+            for i in range(rows)
+        )
+        profiles = ServiceProviderProfile.objects.bulk_create(
+            ServiceProviderProfile(user=user, profession='Plumber', location='Tunis', rating=4.5)
+            for user in users
+        )
+        Service.objects.bulk_create(
+            Service(
+                service_provider=profile, category=category, title=f'Service {i}',
+                description='Benchmark service', price=Decimal('19.99'), location='Tunis',
+            )
+            for i, profile in enumerate(profiles)
+        )
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare throughput and latency of API scenarios served by uvicorn (ASGI) and gunicorn (WSGI) '
+        'as the number of concurrent connections grows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios', nargs='*',
+            help=f"Any of: {', '.join(benchmark.SCENARIOS)} (default: search messages notification-feed).",
+        )
+        parser.add_argument('--servers', nargs='+', default=list(benchmark.SERVERS))
+        parser.add_argument('--workers', type=int, default=2, help='Worker processes per server.')
+        parser.add_argument('--threads', type=int, default=4, help='Threads per gunicorn worker.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 64])
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per scenario and level.')
+        parser.add_argument('--warmup', type=int, default=10, help='Requests per connection before measuring.')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or ['search', 'messages', 'notification-feed']
+        unknown = set(scenarios) - benchmark.SCENARIOS.keys()
+        unknown_servers = set(options['servers']) - benchmark.SERVERS.keys()
+        if unknown or unknown_servers:
+            raise CommandError(f"Unknown scenarios or servers: {', '.join(sorted(unknown | unknown_servers))}.")
+        try:
+            context = benchmark.Context()
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        self.stdout.write(
+            f"{'server':<10} {'scenario':<18} {'conns':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}"
+        )
+        for server in options['servers']:
+            try:
+                with benchmark.ServerProcess(server, options['workers'], options['threads']) as url:
+                    for name in scenarios:
+                        for concurrency in options['concurrency']:
+                            self.report(server, name, concurrency, benchmark.run_scenario(
+                                name, lambda: benchmark.HTTPDriver(url), context,
+                                options['requests'], concurrency, options['warmup'],
+                            ))
+            except RuntimeError as exc:
+                raise CommandError(exc)
+
+    def report(self, server, name, concurrency, result):
+        self.stdout.write(
+            f"{server:<10} {name:<18} {concurrency:>5} {result['throughput']:>9,.0f} "
+            f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['errors']:>6}"
+        )
@@ -0,0 +1,134 @@
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from users import availability
+from users.benchmark import percentile
+from users.models import (
+    User, ServiceProviderProfile, ServiceCategory, Service, Message, Notification, Conversation,
+)
+
+MODES = {
+    # What settings.py gave every deployment before SQLITE_PERFORMANCE existed.
+    'default': ({'init_command': 'PRAGMA journal_mode=DELETE; PRAGMA synchronous=FULL'}, False),
+    'pragmas': (settings.SQLITE_PERFORMANCE_OPTIONS, False),
+    'performance': (settings.SQLITE_PERFORMANCE_OPTIONS, True),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure concurrent Message, Notification and Booking writes on SQLite with the default '
+        'configuration, the performance PRAGMAs alone, and the PRAGMAs plus the write queue.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('modes', nargs='*', help=f"Modes to run (default: {', '.join(MODES)}).")
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--writes', type=int, default=60, help='Writes issued by each thread.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('This benchmark only applies to SQLite.')
+        modes = options['modes'] or list(MODES)
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}. Choose from {', '.join(MODES)}.")
+
+        database = connections.settings[DEFAULT_DB_ALIAS]
+        original_options = database.get('OPTIONS', {})
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        provider, service, clients = self.seed(options['threads'])
+        try:
+            for offset, mode in enumerate(modes):
+                pragmas, queue = MODES[mode]
+                connections.close_all()
+                database['OPTIONS'] = dict(pragmas)
+                with override_settings(SQLITE_WRITE_QUEUE=queue):
+                    self.report(mode, *self.run(provider, service, clients, options['writes'], offset))
+        finally:
+            connections.close_all()
+            database['OPTIONS'] = original_options
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+            self.clean(provider, clients)
+
+    def run(self, provider, service, clients, writes, offset):
+        count = len(clients) * writes
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1, hours=offset * count)
+        slots = availability.publish(provider, [
+            (start + timedelta(hours=i), start + timedelta(hours=i, minutes=30))
+            for i in range(count)
+        ])
+        provider_user = provider.user
+        latencies, errors = [], []
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(clients))
+
+        def write(index, client):
+            own_latencies, own_errors = [], 0
+            barrier.wait()
+            try:
+                for i in range(writes):
+                    began = time.perf_counter()
+                    try:
+                        if i % 3 == 0:
+                            Message.objects.create(sender=client, receiver=provider_user, content=f'Write {i}')
+                        elif i % 3 == 1:
+                            Notification.objects.create(user=client, message=f'Write {i}')
+                        else:
+                            availability.reserve(client, slots[index * writes + i], service)
+                    except OperationalError:
+                        own_errors += 1
+                    own_latencies.append(time.perf_counter() - began)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(own_latencies)
+                errors.append(own_errors)
+
+        threads = [threading.Thread(target=write, args=(i, client)) for i, client in enumerate(clients)]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(latencies), sum(errors), time.perf_counter() - began
+
+    def report(self, mode, latencies, errors, elapsed):
+        done = len(latencies) - errors
+        self.stdout.write(
+            f'{mode:<12} {done:>6} writes {errors:>5} locked  {done / elapsed:>8,.0f} writes/s  '
+            f'p50 {percentile(latencies, 0.5) * 1000:>7.1f} ms  p99 {percentile(latencies, 0.99) * 1000:>7.1f} ms'
+        )
+
+    @transaction.atomic
+    def seed(self, client_count):
+        tag = timezone.now().strftime('%Y%m%d%H%M%S%f')
+        provider = ServiceProviderProfile.objects.create(
+            user=User.objects.create(email=f'write-provider-{tag}@example.com', user_type='service_provider'),
+            profession='Plumber',
+        )
+        category, _ = ServiceCategory.objects.get_or_create(name='Write benchmark')
+        service = Service.objects.create(
+            service_provider=provider, category=category, title='Write benchmark',
+            description='Write benchmark', price=Decimal('10.00'),
+        )
+        clients = User.objects.bulk_create(
+            User(email=f'write-client-{tag}-{i}@example.com') for i in range(client_count)
+        )
+        return provider, service, clients
+
+    def clean(self, provider, clients):
+        user_ids = [provider.user_id, *(client.pk for client in clients)]
+        Conversation.objects.filter(members__user_id__in=user_ids).delete()
+        User.objects.filter(pk__in=user_ids).delete()
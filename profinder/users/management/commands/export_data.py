@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users import export
+
+
+class Command(BaseCommand):
+    help = 'Stream users, services or bookings as NDJSON or CSV, optionally only rows changed since a watermark.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(export.EXPORTS))
+        parser.add_argument('--output', choices=sorted(export.FORMATS), default='ndjson')
+        parser.add_argument(
+            '--since', help='Only rows with updated_at after this ISO 8601 datetime, less EXPORT_WATERMARK_LAG.'
+        )
+        parser.add_argument('--after', help='Id of the last row already exported at the --since timestamp.')
+        parser.add_argument('--file', help='Write to this path instead of stdout.')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            watermark = export.parse_watermark(options['since'], options['after'])
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        chunks = export.stream(options['name'], options['output'], watermark, options['chunk_size'])
+        if options['file']:
+            with open(options['file'], 'w', newline='') as target:
+                for chunk in chunks:
+                    target.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
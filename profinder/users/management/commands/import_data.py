@@ -0,0 +1,36 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users import export, ingest
+
+
+class Command(BaseCommand):
+    help = 'Bulk import providers or services from a CSV or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(ingest.IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--input', choices=sorted(export.FORMATS), help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=ingest.CHUNK_SIZE)
+        parser.add_argument(
+            '--convert-clients', action='store_true', help='Let provider rows turn client accounts into providers.'
+        )
+
+    def handle(self, *args, **options):
+        input_format = options['input'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+        importer_options = {'convert_clients': options['convert_clients']} if options['kind'] == 'providers' else {}
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as source:
+                report = ingest.ingest(
+                    options['kind'], ingest.read_rows(source, input_format), options['chunk_size'],
+                    **importer_options
+                )
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+
+        for error in report['errors']:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(
+            f"{report['created']} created, {report['updated']} updated, {len(report['errors'])} rejected."
+        )
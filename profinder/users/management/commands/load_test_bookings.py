@@ -0,0 +1,98 @@
+import random
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+from django.db.models import Count
+from django.utils import timezone
+
+from users import availability
+from users.models import User, ServiceProviderProfile, ServiceCategory, Service, Booking, AvailabilitySlot
+
+
+class Command(BaseCommand):
+    help = 'Race many clients for a small set of slots and check that no slot is booked twice.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50)
+        parser.add_argument('--slots', type=int, default=20)
+        parser.add_argument('--attempts', type=int, default=10, help='Reservations tried by each client.')
+
+    def handle(self, *args, **options):
+        provider, service, clients, slots = self.seed(options['clients'], options['slots'])
+        outcomes = {'booked': 0, 'conflict': 0, 'error': 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(clients))
+
+        def book(client):
+            rng = random.Random(client.pk)
+            barrier.wait()
+            try:
+                for _ in range(options['attempts']):
+                    try:
+                        availability.reserve(client, rng.choice(slots), service)
+                        outcome = 'booked'
+                    except availability.SlotUnavailable:
+                        outcome = 'conflict'
+                    except OperationalError:
+                        outcome = 'error'
+                    with lock:
+                        outcomes[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(client,)) for client in clients]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        try:
+            self.verify(provider, outcomes, len(slots))
+        finally:
+            User.objects.filter(pk__in=[provider.user_id, *(client.pk for client in clients)]).delete()
+
+        total = sum(outcomes.values())
+        self.stdout.write(
+            f"{total} attempts by {len(clients)} clients in {elapsed:.2f}s ({total / elapsed:,.0f}/sec): "
+            f"{outcomes['booked']} booked, {outcomes['conflict']} conflicts, {outcomes['error']} errors."
+        )
+        self.stdout.write(self.style.SUCCESS('No slot was booked twice.'))
+
+    def verify(self, provider, outcomes, slot_count):
+        bookings = Booking.objects.filter(service_provider=provider)
+        claimed = AvailabilitySlot.objects.filter(service_provider=provider, booking__isnull=False)
+        if bookings.count() != outcomes['booked'] or claimed.count() != outcomes['booked']:
+            raise CommandError(
+                f"{outcomes['booked']} reservations succeeded but {bookings.count()} bookings "
+                f"and {claimed.count()} claimed slots exist."
+            )
+        if outcomes['booked'] > slot_count or bookings.values('booking_date').annotate(
+            n=Count('id')
+        ).filter(n__gt=1).exists():
+            raise CommandError('A slot was booked more than once.')
+
+    def seed(self, client_count, slot_count):
+        tag = timezone.now().strftime('%Y%m%d%H%M%S%f')
+        provider = ServiceProviderProfile.objects.create(
+            user=User.objects.create(email=f'load-provider-{tag}@example.com', user_type='service_provider'),
+            profession='Plumber',
+        )
+        category, _ = ServiceCategory.objects.get_or_create(name='Load test')
+        service = Service.objects.create(
+            service_provider=provider, category=category, title='Load test',
+            description='Load test', price=Decimal('10.00'),
+        )
+        clients = User.objects.bulk_create(
+            User(email=f'load-client-{tag}-{i}@example.com') for i in range(client_count)
+        )
+        first = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        slots = availability.publish(provider, [
+            (first + timedelta(hours=i), first + timedelta(hours=i, minutes=45)) for i in range(slot_count)
+        ])
+        return provider, service, clients, slots
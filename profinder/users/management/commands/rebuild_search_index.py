@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from users import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for services.'
+
+    def handle(self, *args, **options):
+        if search.get_backend() is None:
+            self.stderr.write('No search backend for this database; nothing to rebuild.')
+            return
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
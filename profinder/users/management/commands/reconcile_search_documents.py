@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from users.models import ServiceSearchDocument
+
+
+class Command(BaseCommand):
+    help = (
+        'Rewrite search documents that differ from their service and delete those whose service is gone. '
+        'Run periodically to repair drift from writes that bypass signals.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rewritten, deleted = ServiceSearchDocument.objects.reconcile(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rewrote {rewritten} and deleted {deleted} search documents.'))
@@ -0,0 +1,86 @@
+import json
+from contextlib import ExitStack
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from users import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Run API scenarios against seeded benchmark data, report latency percentiles, throughput and '
+        'queries per request, and fail on regressions against a stored baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Any of: {', '.join(benchmark.SCENARIOS)} (default all).")
+        parser.add_argument('--target', choices=['client', 'wsgi'], default='client',
+                            help='Drive the app in-process through the test client or a local WSGI server.')
+        parser.add_argument('--url', help='Drive an already running server (e.g. an ASGI server) instead.')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', help='JSON file of earlier results to compare against.')
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results to --baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.25)
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or list(benchmark.SCENARIOS)
+        unknown = set(scenarios) - benchmark.SCENARIOS.keys()
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}.")
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError('--save-baseline needs --baseline.')
+        try:
+            context = benchmark.Context()
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        results = {}
+        with ExitStack() as stack:
+            if options['url']:
+                make_driver = lambda: benchmark.HTTPDriver(options['url'])
+            else:
+                # Query counts come from the Server-Timing header.
+                stack.enter_context(override_settings(PERF_SERVER_TIMING=True, ALLOWED_HOSTS=['testserver', '127.0.0.1']))
+                if options['target'] == 'wsgi':
+                    url = stack.enter_context(benchmark.LocalWSGIServer())
+                    make_driver = lambda: benchmark.HTTPDriver(url)
+                else:
+                    make_driver = benchmark.ClientDriver
+            for name in scenarios:
+                results[name] = benchmark.run_scenario(
+                    name, make_driver, context, options['requests'], options['concurrency'],
+                    options['warmup'], options['seed'],
+                )
+                self.report(name, results[name])
+
+        if not options['baseline']:
+            return
+        run = {key: options[key] for key in ('target', 'url', 'requests', 'concurrency')}
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as target:
+                json.dump({'run': run, 'scenarios': results}, target, indent=2, sort_keys=True)
+            self.stdout.write(f"Baseline written to {options['baseline']}.")
+            return
+        try:
+            with open(options['baseline']) as source:
+                baseline = json.load(source)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Could not read baseline: {exc}')
+        if baseline.get('run') != run:
+            raise CommandError(f"Baseline was recorded with {baseline.get('run')}, not {run}.")
+        regressions = benchmark.compare(results, baseline['scenarios'], options['tolerance'])
+        if regressions:
+            raise CommandError('Regressions against baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against baseline.'))
+
+    def report(self, name, result):
+        queries = '-' if result['queries'] is None else f"{result['queries']:g}"
+        self.stdout.write(
+            f"{name:<14} {result['requests']:>6} req  {result['errors']:>4} err  "
+            f"p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  p99 {result['p99_ms']:>8.2f} ms  "
+            f"{result['throughput']:>8.1f} req/s  {queries:>5} queries"
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Fill an empty database with a deterministic benchmark dataset (1M users, 10M messages by default).'
+
+    def add_arguments(self, parser):
+        for name, default in benchmark.VOLUMES.items():
+            parser.add_argument(f'--{name}', type=int, default=default)
+        parser.add_argument('--scale', type=float, default=1.0, help='Multiply every volume, e.g. 0.01 for a quick run.')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        volumes = {
+            name: max(1, int(options[name] * options['scale'])) for name in benchmark.VOLUMES
+        }
+        if volumes['providers'] >= volumes['users']:
+            raise CommandError('--providers must be smaller than --users.')
+        seeder = benchmark.Seeder(volumes, options['batch_size'], options['seed'], log=self.stdout.write)
+        try:
+            seeder.run()
+        except ValueError as exc:
+            raise CommandError(exc)
@@ -0,0 +1,163 @@
+"""
+Request histograms for the /metrics/ endpoint.
+
+Observations are kept in memory by each process. With several workers
+(gunicorn, uWSGI) set METRICS_DIR to a directory shared by all of them:
+every worker then writes its series to a file of its own there, at most
+every METRICS_FLUSH_SECONDS, and render() sums the files so a scrape
+reports the whole server rather than whichever worker answered it. The
+files are cumulative, so empty the directory when the server starts and
+not while it runs. Without METRICS_DIR a scrape only sees its own worker.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _format(value):
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """
+    A Prometheus histogram keyed by a single `view` label. Observations
+    land in one bucket; cumulative counts are only built when rendered.
+    """
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, view, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(view)
+            if series is None:
+                series = self._series[view] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self, view):
+        with self._lock:
+            counts, total = self._series[view]
+            return list(counts), total
+
+    def snapshot(self):
+        with self._lock:
+            return {view: (list(counts), total) for view, (counts, total) in self._series.items()}
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self, series=None):
+        """Render `series` (a snapshot, by default this process's own) in the text format."""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        if series is None:
+            series = self.snapshot()
+        for view, (counts, total) in sorted(series.items()):
+            label = view.replace('\\', '\\\\').replace('"', '\\"')
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _format(bound)
+                lines.append(f'{self.name}_bucket{{view="{label}",le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{label}"}} {_format(total)}')
+            lines.append(f'{self.name}_count{{view="{label}"}} {cumulative}')
+        return '\n'.join(lines)
+
+
+request_duration = Histogram(
+    'profinder_request_duration_seconds', 'Wall time spent handling the request.', DURATION_BUCKETS
+)
+db_queries = Histogram('profinder_db_queries', 'Database queries issued per request.', COUNT_BUCKETS)
+db_duration = Histogram(
+    'profinder_db_duration_seconds', 'Time spent executing database queries per request.', DURATION_BUCKETS
+)
+render_duration = Histogram(
+    'profinder_serialization_duration_seconds', 'Time spent rendering the response body.', DURATION_BUCKETS
+)
+response_bytes = Histogram('profinder_response_bytes', 'Size of the response body.', BYTES_BUCKETS)
+
+HISTOGRAMS = (request_duration, db_queries, db_duration, render_duration, response_bytes)
+
+
+_flush_lock = threading.Lock()
+_flushed = 0.0
+_process_file = (None, None)
+
+
+def _path():
+    """This process's file in METRICS_DIR, named afresh after a fork so workers never share one."""
+    global _process_file
+    pid, name = _process_file
+    if pid != os.getpid():
+        pid, name = os.getpid(), f'{os.getpid()}-{time.time_ns():x}.json'
+        _process_file = (pid, name)
+    return Path(settings.METRICS_DIR) / name
+
+
+def flush(force=False):
+    """Write this process's series to METRICS_DIR, at most every METRICS_FLUSH_SECONDS unless forced."""
+    global _flushed
+    if not getattr(settings, 'METRICS_DIR', None):
+        return
+    if not force and time.monotonic() - _flushed < getattr(settings, 'METRICS_FLUSH_SECONDS', 5):
+        return
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        _flushed = time.monotonic()
+        path = _path()
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps({histogram.name: histogram.snapshot() for histogram in HISTOGRAMS}))
+        os.replace(temporary, path)
+    finally:
+        _flush_lock.release()
+
+
+def collect():
+    """Sum the series every process has written to METRICS_DIR, by histogram name."""
+    flush(force=True)
+    merged = {histogram.name: {} for histogram in HISTOGRAMS}
+    sizes = {histogram.name: len(histogram.buckets) + 1 for histogram in HISTOGRAMS}
+    for path in Path(settings.METRICS_DIR).glob('*.json'):
+        try:
+            written = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for name, series in written.items():
+            if name not in merged:
+                continue
+            for view, (counts, total) in series.items():
+                if len(counts) != sizes[name]:
+                    continue
+                into = merged[name].setdefault(view, ([0] * sizes[name], [0.0]))
+                for index, count in enumerate(counts):
+                    into[0][index] += count
+                into[1][0] += total
+    return {
+        name: {view: (counts, total[0]) for view, (counts, total) in series.items()}
+        for name, series in merged.items()
+    }
+
+
+def render():
+    merged = collect() if getattr(settings, 'METRICS_DIR', None) else {}
+    return '\n'.join(histogram.render(merged.get(histogram.name)) for histogram in HISTOGRAMS) + '\n'
+
+
+def clear():
+    for histogram in HISTOGRAMS:
+        histogram.clear()
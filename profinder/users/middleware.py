@@ -0,0 +1,236 @@
+import asyncio
+import contextvars
+import inspect
+import itertools
+import logging
+import os
+import time
+import traceback
+
+from asgiref.sync import SyncToAsync, iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics, routers
+
+logger = logging.getLogger('users.performance')
+
+ASGIREF_SYNC_FILE = inspect.getfile(SyncToAsync)
+
+
+class RequestStats:
+    __slots__ = ('view', 'slow', 'queries', 'query_time', 'render_start', 'render_time', 'task')
+
+    def __init__(self, slow, task=None):
+        self.view = 'unresolved'
+        self.task = task
+        self.slow = slow
+        self.queries = 0
+        self.query_time = 0.0
+        self.render_start = None
+        self.render_time = 0.0
+
+
+_request_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+def view_name(view_func, method):
+    """
+    Label a resolved view as `ViewClass` or `ViewSet.action`.
+    """
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if cls is None:
+        return f'{view_func.__module__}.{view_func.__qualname__}'
+    action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+    return f'{cls.__name__}.{action}' if action else cls.__name__
+
+
+def awaited_frames(task):
+    """
+    Return the frames of the coroutines `task` is suspended in, innermost
+    first, by following what each of them awaits.
+    """
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'ag_frame', None)
+        if frame is None:
+            break
+        frames.append(frame)
+        awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'ag_await', None)
+    return reversed(frames)
+
+
+def query_origin(task=None):
+    """
+    Return the innermost project frame that led to the current query. In
+    an async request, a query the async ORM runs in a worker thread has
+    only Django's frames above the thread's `sync_to_async` entry, so the
+    coroutines of the request's `task`, which await that thread, are
+    searched after them.
+    """
+    root = str(settings.BASE_DIR)
+    stack = traceback.extract_stack()[::-1]
+    if task is not None:
+        thread_frames = list(itertools.takewhile(lambda frame: frame.filename != ASGIREF_SYNC_FILE, stack))
+        if len(thread_frames) < len(stack):
+            stack = thread_frames + traceback.StackSummary.extract(
+                (frame, frame.f_lineno) for frame in awaited_frames(task)
+            )
+    for frame in stack:
+        filename = frame.filename
+        if filename.startswith(root) and f'{os.sep}site-packages{os.sep}' not in filename and filename != __file__:
+            return f'{os.path.relpath(filename, root)}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting and timing the queries of the current
+    request. The request is found through a context variable, which reaches
+    the worker threads async views run their queries in. Only queries
+    slower than the request's threshold pay for a stack walk.
+    """
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.queries += 1
+        stats.query_time += elapsed
+        if elapsed >= stats.slow:
+            logger.warning(
+                'Slow query (%.1f ms) on %s from %s: %s',
+                elapsed * 1000, context['connection'].alias, query_origin(stats.task), sql,
+            )
+
+
+def install_query_timer(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+connection_created.connect(install_query_timer)
+
+
+class PerformanceMiddleware:
+    """
+    Record wall time, query count and time, render time and response size
+    for every request into `users.metrics`, labelled by view. With
+    `PERF_SERVER_TIMING` the same numbers are returned in a `Server-Timing`
+    header. Queries run while a streaming response is consumed happen after
+    this middleware returns and are not counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        # Connections opened before this module was imported missed the signal.
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+        token = self.start(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self.record(request, response, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        token = self.start(request, asyncio.current_task())
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_stats.reset(token)
+        return self.record(request, response, time.perf_counter() - start)
+
+    def start(self, request, task=None):
+        request.performance = RequestStats(getattr(settings, 'PERF_SLOW_QUERY_MS', 200) / 1000, task)
+        return _request_stats.set(request.performance)
+
+    def record(self, request, response, elapsed):
+        stats = request.performance
+        if request.resolver_match is not None:
+            stats.view = view_name(request.resolver_match.func, request.method)
+        view = stats.view
+        metrics.request_duration.observe(view, elapsed)
+        metrics.db_queries.observe(view, stats.queries)
+        metrics.db_duration.observe(view, stats.query_time)
+        metrics.render_duration.observe(view, stats.render_time)
+        if not response.streaming:
+            metrics.response_bytes.observe(view, len(response.content))
+        metrics.flush()
+        if getattr(settings, 'PERF_SERVER_TIMING', False):
+            response['Server-Timing'] = (
+                f'app;dur={elapsed * 1000:.1f}, '
+                f'db;dur={stats.query_time * 1000:.1f};desc="{stats.queries} queries", '
+                f'render;dur={stats.render_time * 1000:.1f}'
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        stats = request.performance
+        stats.render_start = time.perf_counter()
+
+        def rendered(response):
+            stats.render_time = time.perf_counter() - stats.render_start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve safe requests from the read replicas, unless the client wrote
+    recently: any unsafe request, or a safe one that wrote, pins the
+    client to the primary for `DATABASE_REPLICA_PIN_SECONDS` so it reads
+    its own writes.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not getattr(settings, 'DATABASE_REPLICAS', ()):
+            return self.get_response(request)
+        safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        replicas = safe and not routers.is_pinned(request)
+        with routers.replica_reads(replicas):
+            response = self.get_response(request)
+            # The router turns replica reads off at the first write.
+            wrote = replicas and not routers.reading_from_replicas()
+        if not safe or wrote:
+            routers.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'DATABASE_REPLICAS', ()):
+            return await self.get_response(request)
+        safe = request.method in ('GET', 'HEAD', 'OPTIONS')
+        replicas = safe and not await routers.ais_pinned(request)
+        with routers.replica_reads(replicas):
+            response = await self.get_response(request)
+            wrote = replicas and not routers.reading_from_replicas()
+        if not safe or wrote:
+            await routers.apin(request)
+        return response
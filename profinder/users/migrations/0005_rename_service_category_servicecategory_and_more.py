@@ -18,7 +18,7 @@ class Migration(migrations.Migration):
         migrations.AlterField(
             model_name='service',
             name='category',
-            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='services', to='users.service_category'),
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='services', to='users.servicecategory'),
         ),
         migrations.AlterModelTable(
             name='servicecategory',
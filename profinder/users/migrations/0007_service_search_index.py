@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def install_index(apps, schema_editor):
+    from users import search
+
+    backend = search.get_backend(schema_editor.connection)
+    if backend is not None:
+        with schema_editor.connection.cursor() as cursor:
+            backend.install(cursor)
+            backend.reindex(cursor)
+
+
+def uninstall_index(apps, schema_editor):
+    from users import search
+
+    backend = search.get_backend(schema_editor.connection)
+    if backend is not None:
+        with schema_editor.connection.cursor() as cursor:
+            backend.uninstall(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_alter_service_category'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_index, uninstall_index),
+    ]
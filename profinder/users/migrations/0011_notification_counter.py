@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    Notification = apps.get_model('users', 'Notification')
+    NotificationCounter = apps.get_model('users', 'NotificationCounter')
+    unread = (
+        Notification.objects.filter(read=False)
+        .values('user_id')
+        .annotate(count=models.Count('id'))
+    )
+    NotificationCounter.objects.bulk_create(
+        NotificationCounter(user_id=row['user_id'], unread=row['count']) for row in unread.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to='users.user')),
+                ('unread', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
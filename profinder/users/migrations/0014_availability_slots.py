@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0013_updated_at_watermarks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='service_provider',
+            field=models.ForeignKey(limit_choices_to={'user__user_type': 'service_provider'}, on_delete=django.db.models.deletion.CASCADE, to='users.serviceproviderprofile'),
+        ),
+        migrations.CreateModel(
+            name='AvailabilitySlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('booking', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='slot', to='users.booking')),
+                ('service_provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='users.serviceproviderprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['service_provider', 'starts_at', 'ends_at'], name='slot_interval_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('ends_at__gt', models.F('starts_at'))), name='slot_ends_after_start'), models.UniqueConstraint(fields=('service_provider', 'starts_at'), name='slot_provider_start_uniq')],
+            },
+        ),
+    ]
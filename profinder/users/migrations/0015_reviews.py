@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:24
+
+import django.core.validators
+import django.db.models.deletion
+import users.models
+from django.db import migrations, models
+
+
+def reset_ratings(apps, schema_editor):
+    """
+    No reviews exist yet, so every provider and service starts at the prior.
+    """
+    mean = users.models.prior_rating()
+    apps.get_model('users', 'ServiceProviderProfile').objects.update(rating=mean)
+    apps.get_model('users', 'Service').objects.update(rating=mean)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0014_availability_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Review',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)])),
+                ('comment', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rating',
+            field=models.FloatField(default=users.models.prior_rating, editable=False),
+        ),
+        migrations.AddField(
+            model_name='serviceproviderprofile',
+            name='rating_sum',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='serviceproviderprofile',
+            name='review_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='serviceproviderprofile',
+            name='rating',
+            field=models.FloatField(default=users.models.prior_rating, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['rating', 'id'], name='service_rating_idx'),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='users.user'),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='service_provider',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='users.serviceproviderprofile'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['service_provider', 'created_at', 'id'], name='review_feed_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('service_provider', 'author'), name='review_author_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.CheckConstraint(condition=models.Q(('score__gte', 1), ('score__lte', 5)), name='review_score_range'),
+        ),
+        migrations.RunPython(reset_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_conversations(apps, schema_editor):
+    """
+    Group existing messages into one conversation per pair of users. There
+    was no read state before, so every member starts fully read.
+    """
+    Message = apps.get_model('users', 'Message')
+    Conversation = apps.get_model('users', 'Conversation')
+    ConversationMember = apps.get_model('users', 'ConversationMember')
+    latest = {}
+    rows = Message.objects.order_by('id').values_list('id', 'sender_id', 'receiver_id', 'created_at')
+    for message_id, sender_id, receiver_id, created_at in rows.iterator():
+        latest[min(sender_id, receiver_id), max(sender_id, receiver_id)] = (message_id, created_at)
+    for (a, b), (message_id, created_at) in latest.items():
+        conversation = Conversation.objects.create(pair_key=f'{a}:{b}', last_message_id=message_id)
+        ConversationMember.objects.bulk_create(
+            ConversationMember(
+                conversation=conversation, user_id=user, peer_id=peer,
+                last_message_at=created_at, last_read_message_id=message_id,
+            )
+            for user, peer in {(a, b), (b, a)}
+        )
+        Message.objects.filter(
+            models.Q(sender_id=a, receiver_id=b) | models.Q(sender_id=b, receiver_id=a)
+        ).update(conversation=conversation)
+
+
+class Migration(migrations.Migration):
+    # The backfill commits on its own before Message.conversation becomes NOT
+    # NULL: on PostgreSQL its deferred FK checks would otherwise still be
+    # pending, and the ALTER TABLE would fail.
+    atomic = False
+
+    dependencies = [
+        ('users', '0015_reviews'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_message_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('unread_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pair_key', models.CharField(editable=False, max_length=50, null=True, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='users.message')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='users.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at', 'id'], name='message_thread_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='users.conversation'),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='users.message'),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='peer',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.user'),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to='users.user'),
+        ),
+        migrations.AddIndex(
+            model_name='conversationmember',
+            index=models.Index(fields=['user', 'last_message_at', 'id'], name='conversation_inbox_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversationmember',
+            constraint=models.UniqueConstraint(fields=('conversation', 'user'), name='conversation_member_uniq'),
+        ),
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop, atomic=True),
+        migrations.AlterField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='users.conversation'),
+        ),
+    ]
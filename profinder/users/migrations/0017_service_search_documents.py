@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:06
+
+from django.db import migrations, models
+from django.db.models.functions import Concat, Trim
+
+
+def build_documents(apps, schema_editor):
+    Service = apps.get_model('users', 'Service')
+    ServiceSearchDocument = apps.get_model('users', 'ServiceSearchDocument')
+    user = 'service_provider__user__'
+    rows = Service.objects.values(
+        'id', 'title', 'price', 'category_id', 'rating', 'location', 'is_active', 'created_at',
+        category_name=models.F('category__name'),
+        provider_id=models.F('service_provider_id'),
+        provider_user_id=models.F('service_provider__user_id'),
+        provider_name=Trim(Concat(f'{user}first_name', models.Value(' '), f'{user}last_name')),
+        profession=models.F('service_provider__profession'),
+    )
+    ServiceSearchDocument.objects.bulk_create((ServiceSearchDocument(**row) for row in rows.iterator()), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_conversations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceSearchDocument',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=100)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('category_id', models.BigIntegerField()),
+                ('category_name', models.CharField(max_length=100)),
+                ('provider_id', models.BigIntegerField()),
+                ('provider_user_id', models.BigIntegerField()),
+                ('provider_name', models.CharField(max_length=61)),
+                ('profession', models.CharField(max_length=100)),
+                ('rating', models.FloatField()),
+                ('location', models.CharField(blank=True, max_length=100)),
+                ('is_active', models.BooleanField()),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at', 'id'], name='search_document_created_idx'), models.Index(fields=['price', 'id'], name='search_document_price_idx'), models.Index(fields=['rating', 'id'], name='search_document_rating_idx')],
+            },
+        ),
+        migrations.RunPython(build_documents, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,13 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.core.validators import RegexValidator
-from django.db import models
+from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Concat, Trim
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from . import geo, writequeue
+
 
 class User(models.Model):
     USER_TYPE_CHOICES = (
@@ -23,11 +28,98 @@ class User(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='user_created_idx'),
+            models.Index(fields=['user_type', 'created_at', 'id'], name='user_type_created_idx'),
+            models.Index(fields=['updated_at', 'id'], name='user_updated_idx'),
+            models.Index(fields=['user_type', 'updated_at'], name='user_type_updated_idx'),
+        ]
+
     def __str__(self):
         return self.email
 
+    @property
+    def is_authenticated(self):
+        """
+        Always True, so a User can act as the authenticated principal of an API request.
+        """
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+
+class GeoLocated(models.Model):
+    latitude = models.FloatField(
+        null=True, blank=True,
+        validators=[MinValueValidator(-90.0), MaxValueValidator(90.0)]
+    )
+    longitude = models.FloatField(
+        null=True, blank=True,
+        validators=[MinValueValidator(-180.0), MaxValueValidator(180.0)]
+    )
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def set_geohash(self):
+        """
+        Derive `geohash` from the coordinates; bulk writes must call this
+        themselves since they bypass save().
+        """
+        if self.latitude is None or self.longitude is None:
+            self.geohash = ''
+        else:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+
+    def save(self, *args, **kwargs):
+        self.set_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
+
+
+def rating_prior():
+    """
+    Return the (mean, weight) of the prior every provider's rating starts from.
+    """
+    return getattr(settings, 'RATING_PRIOR_MEAN', 3.0), getattr(settings, 'RATING_PRIOR_WEIGHT', 5)
+
 
-class ServiceProviderProfile(models.Model):
+def prior_rating():
+    return rating_prior()[0]
+
+
+class ServiceProviderProfileManager(models.Manager):
+    def apply_review(self, profile_id, count_delta, score_delta):
+        """
+        Fold a review change into the provider's aggregates and Bayesian
+        average with one UPDATE, then copy the rating onto its services.
+        """
+        mean, weight = rating_prior()
+        rating = models.ExpressionWrapper(
+            (models.Value(float(mean * weight)) + models.F('rating_sum') + score_delta)
+            / (models.Value(float(weight)) + models.F('review_count') + count_delta),
+            output_field=models.FloatField(),
+        )
+        self.filter(pk=profile_id).update(
+            review_count=models.F('review_count') + count_delta,
+            rating_sum=models.F('rating_sum') + score_delta,
+            rating=rating,
+            updated_at=timezone.now(),
+        )
+        Service.objects.filter(service_provider_id=profile_id).update(
+            rating=models.Subquery(self.filter(pk=profile_id).values('rating')[:1]),
+            updated_at=timezone.now(),
+        )
+        ServiceSearchDocument.objects.refresh(Service.objects.filter(service_provider_id=profile_id))
+
+
+class ServiceProviderProfile(GeoLocated):
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -37,10 +129,14 @@ class ServiceProviderProfile(models.Model):
     location = models.CharField(max_length=100, blank=True)
     service_description = models.TextField(blank=True)
     experience = models.IntegerField(default=0)
-    rating = models.FloatField(default=0.0)
+    rating = models.FloatField(default=prior_rating, editable=False)
+    review_count = models.IntegerField(default=0, editable=False)
+    rating_sum = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ServiceProviderProfileManager()
+
     def __str__(self):
         return f"Service Provider Profile for {self.user.email}"
 
@@ -55,7 +151,7 @@ class ServiceCategory(models.Model):
         return self.name
 
 
-class Service(models.Model):
+class Service(GeoLocated):
     service_provider = models.ForeignKey(
         ServiceProviderProfile,
         on_delete=models.CASCADE,
@@ -67,12 +163,112 @@ class Service(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     location = models.CharField(max_length=100, blank=True)
     is_active = models.BooleanField(default=True)
+    rating = models.FloatField(default=prior_rating, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='service_created_idx'),
+            models.Index(fields=['is_active', 'category'], name='service_active_category_idx'),
+            models.Index(fields=['price', 'id'], name='service_price_idx'),
+            models.Index(fields=['updated_at', 'id'], name='service_updated_idx'),
+            models.Index(fields=['rating', 'id'], name='service_rating_idx'),
+        ]
+
     def __str__(self):
         return f"{self.title} by {self.service_provider.user.email}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.rating = self.service_provider.rating
+        super().save(*args, **kwargs)
+
+
+class ServiceSearchDocumentManager(models.Manager):
+    def source(self, services):
+        """
+        Read `services` as document rows, through the joins a document saves.
+        """
+        user = 'service_provider__user__'
+        return services.values(
+            'id', 'title', 'price', 'category_id', 'rating', 'location', 'is_active', 'created_at',
+            category_name=models.F('category__name'),
+            provider_id=models.F('service_provider_id'),
+            provider_user_id=models.F('service_provider__user_id'),
+            provider_name=Trim(Concat(f'{user}first_name', models.Value(' '), f'{user}last_name')),
+            profession=models.F('service_provider__profession'),
+        )
+
+    def refresh(self, services, batch_size=500):
+        """
+        Upsert the documents of `services`, a Service queryset.
+        """
+        documents = [self.model(**row) for row in self.source(services)]
+        self.bulk_create(
+            documents, batch_size=batch_size, update_conflicts=True, unique_fields=['id'],
+            update_fields=[field.name for field in self.model._meta.concrete_fields if not field.primary_key],
+        )
+        return len(documents)
+
+    def reconcile(self, batch_size=1000):
+        """
+        Walk every service in id order, rewrite the documents that differ
+        from it and delete documents left by services that no longer exist.
+        Return the numbers of documents rewritten and deleted.
+        """
+        fields = [field.attname for field in self.model._meta.concrete_fields]
+        rewritten, last_id = 0, 0
+        while True:
+            rows = list(self.source(Service.objects.filter(id__gt=last_id).order_by('id')[:batch_size]))
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            current = {row['id']: row for row in self.filter(id__in=[row['id'] for row in rows]).values(*fields)}
+            stale = [self.model(**row) for row in rows if current.get(row['id']) != row]
+            if stale:
+                self.bulk_create(
+                    stale, update_conflicts=True, unique_fields=['id'],
+                    update_fields=[field for field in fields if field != 'id'],
+                )
+                rewritten += len(stale)
+        deleted, _ = self.exclude(id__in=Service.objects.values('id')).delete()
+        return rewritten, deleted
+
+
+class ServiceSearchDocument(models.Model):
+    """
+    Everything a search result card shows for one service, copied into a
+    single row so that card search reads one table without joins. `id` is
+    the service's id. Signals and `apply_review` keep rows current, and the
+    `reconcile_search_documents` command repairs drift from bulk writes.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=100)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    category_id = models.BigIntegerField()
+    category_name = models.CharField(max_length=100)
+    provider_id = models.BigIntegerField()
+    provider_user_id = models.BigIntegerField()
+    provider_name = models.CharField(max_length=61)
+    profession = models.CharField(max_length=100)
+    rating = models.FloatField()
+    location = models.CharField(max_length=100, blank=True)
+    is_active = models.BooleanField()
+    created_at = models.DateTimeField()
+
+    objects = ServiceSearchDocumentManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='search_document_created_idx'),
+            models.Index(fields=['price', 'id'], name='search_document_price_idx'),
+            models.Index(fields=['rating', 'id'], name='search_document_rating_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
 
 class Booking(models.Model):
     STATUS_CHOICES = (
@@ -89,7 +285,7 @@ class Booking(models.Model):
     service_provider = models.ForeignKey(
         ServiceProviderProfile,
         on_delete=models.CASCADE,
-        limit_choices_to={'user_type': 'service_provider'}
+        limit_choices_to={'user__user_type': 'service_provider'}
     )
     service = models.ForeignKey(Service, on_delete=models.CASCADE)
     booking_date = models.DateTimeField()
@@ -97,25 +293,324 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['service_provider', 'booking_date'], name='booking_provider_date_idx'),
+            models.Index(fields=['updated_at', 'id'], name='booking_updated_idx'),
+        ]
+
     def __str__(self):
         return f"Booking by {self.client.email} for {self.service.title}"
 
+    def save(self, *args, **kwargs):
+        with writequeue.serialized():
+            super().save(*args, **kwargs)
+
+
+class AvailabilitySlot(models.Model):
+    """
+    A bookable interval on a provider's calendar. A slot is reserved by
+    pointing it at a booking; the one-to-one column lets the database
+    reject a second booking for the same slot.
+    """
+    service_provider = models.ForeignKey(ServiceProviderProfile, on_delete=models.CASCADE, related_name='slots')
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField()
+    booking = models.OneToOneField(
+        Booking, null=True, blank=True, on_delete=models.SET_NULL, related_name='slot'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(condition=models.Q(ends_at__gt=models.F('starts_at')), name='slot_ends_after_start'),
+            models.UniqueConstraint(fields=['service_provider', 'starts_at'], name='slot_provider_start_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['service_provider', 'starts_at', 'ends_at'], name='slot_interval_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.service_provider.user.email}: {self.starts_at:%Y-%m-%d %H:%M}-{self.ends_at:%H:%M}"
+
+
+class Review(models.Model):
+    service_provider = models.ForeignKey(ServiceProviderProfile, on_delete=models.CASCADE, related_name='reviews')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
+    score = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+    comment = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service_provider', 'author'], name='review_author_uniq'),
+            models.CheckConstraint(condition=models.Q(score__gte=1, score__lte=5), name='review_score_range'),
+        ]
+        indexes = [
+            models.Index(fields=['service_provider', 'created_at', 'id'], name='review_feed_idx'),
+            models.Index(fields=['service_provider', 'updated_at'], name='review_provider_updated_idx'),
+            models.Index(fields=['updated_at'], name='review_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.score}/5 for {self.service_provider.user.email}"
+
+    def save(self, *args, **kwargs):
+        """
+        Save and fold the score change into the provider's rating in the
+        same transaction.
+        """
+        with transaction.atomic():
+            if self._state.adding:
+                previous = None
+            else:
+                previous = Review.objects.select_for_update().filter(pk=self.pk).values_list('score', flat=True).first()
+            super().save(*args, **kwargs)
+            count_delta = int(previous is None)
+            score_delta = self.score - (previous or 0)
+            if count_delta or score_delta:
+                ServiceProviderProfile.objects.apply_review(self.service_provider_id, count_delta, score_delta)
+
+
+class ConversationManager(models.Manager):
+    def direct(self, user_id, other_id):
+        """
+        Return the two-party conversation between the users, creating it and
+        its memberships on first contact.
+        """
+        pair_key = f'{min(user_id, other_id)}:{max(user_id, other_id)}'
+        conversation = self.filter(pair_key=pair_key).first()
+        if conversation is not None:
+            return conversation
+        try:
+            with transaction.atomic():
+                conversation = self.create(pair_key=pair_key)
+                ConversationMember.objects.bulk_create(
+                    ConversationMember(conversation=conversation, user_id=user, peer_id=peer)
+                    for user, peer in {(user_id, other_id), (other_id, user_id)}
+                )
+        except IntegrityError:
+            conversation = self.get(pair_key=pair_key)
+        return conversation
+
+
+class Conversation(models.Model):
+    """
+    A message thread. `last_message` is kept current by Message.save so
+    that previews never need to look up the newest message.
+    """
+    pair_key = models.CharField(max_length=50, unique=True, null=True, editable=False)
+    last_message = models.ForeignKey(
+        'Message', null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ConversationManager()
+
+    def __str__(self):
+        return f"Conversation {self.pk}"
+
+
+class ConversationMember(models.Model):
+    """
+    A user's membership of a conversation, carrying that user's inbox sort
+    key, read cursor and unread count.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='members')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_memberships')
+    peer = models.ForeignKey(User, null=True, on_delete=models.CASCADE, related_name='+')
+    last_message_at = models.DateTimeField(default=timezone.now)
+    last_read_message = models.ForeignKey(
+        'Message', null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    unread_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='conversation_member_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'last_message_at', 'id'], name='conversation_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"User {self.user_id} in conversation {self.conversation_id}"
+
+    def mark_read(self, message_id=None):
+        """
+        Move the read cursor forward to `message_id`, or to the newest
+        message, and recount what is left unread after it.
+        """
+        with transaction.atomic():
+            member = ConversationMember.objects.select_for_update().get(pk=self.pk)
+            last_message_id = Conversation.objects.filter(pk=self.conversation_id).values_list(
+                'last_message_id', flat=True
+            ).get()
+            if message_id is None or (last_message_id is not None and message_id >= last_message_id):
+                message_id, unread = last_message_id, 0
+            elif member.last_read_message_id is not None and message_id <= member.last_read_message_id:
+                return member
+            else:
+                unread = Message.objects.filter(
+                    conversation_id=self.conversation_id, id__gt=message_id
+                ).exclude(sender_id=self.user_id).count()
+            member.last_read_message_id = message_id
+            member.unread_count = unread
+            member.save(update_fields=['last_read_message', 'unread_count'])
+        return member
+
 
 class Message(models.Model):
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, related_name='messages', editable=False
+    )
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['receiver', 'created_at', 'id'], name='message_inbox_idx'),
+            models.Index(fields=['conversation', 'created_at', 'id'], name='message_thread_idx'),
+            models.Index(fields=['receiver', 'updated_at'], name='message_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Message from {self.sender.email} to {self.receiver.email}"
 
+    def save(self, *args, **kwargs):
+        """
+        Save into the sender and receiver's conversation and, for a new
+        message, advance its last-message pointer and members' counters
+        in the same transaction.
+        """
+        with writequeue.serialized():
+            adding = self._state.adding
+            if self.conversation_id is None:
+                self.conversation = Conversation.objects.direct(self.sender_id, self.receiver_id)
+            super().save(*args, **kwargs)
+            if adding:
+                Conversation.objects.filter(pk=self.conversation_id).update(last_message=self)
+                sent = models.Q(user_id=self.sender_id)
+                ConversationMember.objects.filter(conversation_id=self.conversation_id).update(
+                    last_message_at=self.created_at,
+                    unread_count=models.Case(
+                        models.When(sent, then=models.Value(0)), default=models.F('unread_count') + 1
+                    ),
+                    last_read_message=models.Case(
+                        models.When(sent, then=models.Value(self.pk)), default=models.F('last_read_message'),
+                        output_field=models.BigIntegerField(),
+                    ),
+                )
+
 
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.TextField()
     read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='notification_feed_idx'),
+            models.Index(fields=['user', 'read'], name='notification_unread_idx'),
+            models.Index(fields=['user', 'updated_at'], name='notification_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notification for {self.user.email}"
+
+    def save(self, *args, **kwargs):
+        """
+        Save and adjust the owner's unread counter in the same transaction.
+        """
+        with writequeue.serialized():
+            if self._state.adding:
+                was_unread = False
+            else:
+                was_unread = Notification.objects.select_for_update().filter(
+                    pk=self.pk, read=False
+                ).exists()
+            super().save(*args, **kwargs)
+            delta = int(not self.read) - int(was_unread)
+            if delta:
+                NotificationCounter.objects.adjust(self.user_id, delta)
+
+    @classmethod
+    def mark_read(cls, user, ids=None):
+        """
+        Mark the user's unread notifications (optionally only `ids`) as read
+        with a single UPDATE and return how many changed.
+        """
+        with transaction.atomic():
+            queryset = cls.objects.filter(user=user, read=False)
+            if ids is not None:
+                queryset = queryset.filter(pk__in=ids)
+            updated = queryset.update(read=True, updated_at=timezone.now())
+            if updated:
+                NotificationCounter.objects.adjust(user.pk, -updated)
+        return updated
+
+
+class NotificationCounterManager(models.Manager):
+    def adjust(self, user_id, delta):
+        if not self.filter(user_id=user_id).update(unread=models.F('unread') + delta):
+            self.get_or_create(user_id=user_id)
+            self.filter(user_id=user_id).update(unread=models.F('unread') + delta)
+
+    def unread(self, user_id):
+        return self.filter(user_id=user_id).values_list('unread', flat=True).first() or 0
+
+
+class NotificationCounter(models.Model):
+    """
+    Denormalized count of a user's unread notifications, so badges never
+    have to count the Notification table.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notification_counter'
+    )
+    unread = models.IntegerField(default=0)
+
+    objects = NotificationCounterManager()
+
+    def __str__(self):
+        return f"{self.unread} unread for user {self.user_id}"
+
+
+class OutboundEmail(models.Model):
+    """
+    An email waiting in the outbox. Requests only enqueue rows; the
+    `process_email_outbox` command builds and sends them.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('skipped', 'Skipped'),
+        ('failed', 'Failed'),
+    )
+
+    kind = models.CharField(max_length=50)
+    to = models.EmailField()
+    context = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
 
     def __str__(self):
-        return f"Notification for {self.user.email}"
\ No newline at end of file
+        return f"{self.kind} email to {self.to} ({self.status})"
@@ -0,0 +1,129 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import User, OutboundEmail
+
+builders = {}
+
+
+def builder(kind):
+    """
+    Register a function that turns an OutboundEmail of `kind` into an
+    EmailMessage, or returns None when there is nothing to send.
+    """
+    def register(func):
+        builders[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, to, **context):
+    return OutboundEmail.objects.create(kind=kind, to=to, context=context)
+
+
+class UserTokenGenerator(PasswordResetTokenGenerator):
+    """
+    Password reset tokens for `users.User`, which has no password or
+    last_login; a token is invalidated by any later change to the user.
+    """
+    def _make_hash_value(self, user, timestamp):
+        return f'{user.pk}{user.email}{user.updated_at.replace(microsecond=0, tzinfo=None)}{timestamp}'
+
+
+password_reset_token_generator = UserTokenGenerator()
+
+
+@builder('password_reset')
+def build_password_reset(email):
+    user = User.objects.filter(email=email.to).first()
+    if user is None:
+        return None
+    token = password_reset_token_generator.make_token(user)
+    reset_url = f"http://example.com/reset-password/{token}/"
+    return EmailMessage(
+        "Password Reset",
+        f"Click here to reset your password: {reset_url}",
+        "noreply@example.com",
+        [email.to]
+    )
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def claim(email, now):
+    """
+    Take a lease on a due email so concurrent workers skip it.
+    """
+    lease = now + timedelta(seconds=_setting('EMAIL_OUTBOX_LEASE', 300))
+    return OutboundEmail.objects.filter(
+        pk=email.pk, status='pending', next_attempt_at=email.next_attempt_at
+    ).update(next_attempt_at=lease) == 1
+
+
+def retry_delay(attempts):
+    base = _setting('EMAIL_OUTBOX_BACKOFF', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), _setting('EMAIL_OUTBOX_MAX_BACKOFF', 3600)))
+
+
+def process_batch(batch_size=100):
+    """
+    Send up to `batch_size` due emails over one backend connection and
+    return how many rows were handled.
+    """
+    now = timezone.now()
+    due = list(
+        OutboundEmail.objects.filter(status='pending', next_attempt_at__lte=now)
+        .order_by('next_attempt_at', 'id')[:batch_size]
+    )
+    due = [email for email in due if claim(email, now)]
+    if not due:
+        return 0
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as exc:
+        # Nothing can be sent this round; every claimed email counts an attempt.
+        for email in due:
+            email.attempts += 1
+            _record_failure(email, exc)
+            _save(email)
+        return len(due)
+
+    try:
+        for email in due:
+            email.attempts += 1
+            try:
+                message = builders[email.kind](email)
+                if message is None:
+                    email.status = 'skipped'
+                else:
+                    message.connection = connection
+                    message.send()
+                    email.status = 'sent'
+                    email.sent_at = timezone.now()
+                email.last_error = ''
+            except Exception as exc:
+                _record_failure(email, exc)
+            _save(email)
+    finally:
+        connection.close()
+    return len(due)
+
+
+def _record_failure(email, exc):
+    email.last_error = f'{type(exc).__name__}: {exc}'
+    if email.attempts >= _setting('EMAIL_OUTBOX_MAX_ATTEMPTS', 5):
+        email.status = 'failed'
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+
+
+def _save(email):
+    email.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
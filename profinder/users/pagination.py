@@ -0,0 +1,143 @@
+import base64
+import binascii
+import json
+import operator
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks with a key comparison on the queryset's
+    ordering plus a unique `id` tie-breaker, so deep pages never use OFFSET.
+    Unordered querysets are paged newest first on (created_at, id).
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._set_page(list(self._page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        `paginate_queryset` for async views; the page is fetched in one
+        database round trip off the event loop.
+        """
+        return self._set_page([row async for row in self._page_queryset(queryset, request)])
+
+    def _page_queryset(self, queryset, request):
+        self.base_url = request.build_absolute_uri()
+        self.keys = self.get_ordering(queryset)
+        self.limit = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        self.reverse = cursor is not None and cursor['r']
+        self.has_cursor = cursor is not None
+
+        ordering = [self._flip(key) for key in self.keys] if self.reverse else self.keys
+        queryset = queryset.order_by(*ordering)
+        if cursor is not None:
+            try:
+                queryset = queryset.filter(self._seek(ordering, cursor['k']))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+        return queryset[:self.limit + 1]
+
+    def _set_page(self, rows):
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.has_cursor
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_ordering(self, queryset):
+        keys = [key for key in queryset.query.order_by if isinstance(key, str)] or list(self.ordering)
+        keys = [key[:-2] + 'id' if key.lstrip('-') == 'pk' else key for key in keys]
+        if not any(key.lstrip('-') == 'id' for key in keys):
+            keys.append('-id' if keys[-1].startswith('-') else 'id')
+        return keys
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def encode_cursor(self, row, reverse):
+        values = [self._value(row, key.lstrip('-')) for key in self.keys]
+        payload = json.dumps({'k': values, 'r': reverse}, default=str, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode()))
+            if not isinstance(cursor, dict) or len(cursor['k']) != len(self.keys):
+                raise ValueError
+            cursor['r'] = bool(cursor['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    @staticmethod
+    def _flip(key):
+        return key[1:] if key.startswith('-') else '-' + key
+
+    @staticmethod
+    def _value(row, path):
+        if isinstance(row, dict):
+            return row[path]
+        return reduce(getattr, path.split('__'), row)
+
+    @staticmethod
+    def _seek(ordering, values):
+        """
+        Build `(k1, k2, ...) > (v1, v2, ...)` in each key's sort direction.
+        """
+        steps = []
+        for i, key in enumerate(ordering):
+            lookup = 'lt' if key.startswith('-') else 'gt'
+            step = Q(**{f'{key.lstrip("-")}__{lookup}': values[i]})
+            for previous, value in zip(ordering[:i], values):
+                step &= Q(**{previous.lstrip('-'): value})
+            steps.append(step)
+        return reduce(operator.or_, steps)
@@ -0,0 +1,10 @@
+from rest_framework import permissions
+
+
+class IsStaff(permissions.BasePermission):
+    """
+    Allow staff accounts only. API principals that are `users.User` rows
+    have no staff flag and are refused.
+    """
+    def has_permission(self, request, view):
+        return bool(getattr(request.user, 'is_staff', False))
@@ -0,0 +1,58 @@
+from functools import lru_cache
+
+from rest_framework import serializers
+
+
+@lru_cache(maxsize=None)
+def related_paths(serializer_class):
+    """
+    Walk a serializer tree and return the (select_related, prefetch_related)
+    lookups needed to render it without per-row queries.
+    """
+    return _collect(serializer_class(), '', in_prefetch=False)
+
+
+def _collect(serializer, prefix, in_prefetch):
+    select, prefetch = [], []
+    model = serializer.Meta.model
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        many = isinstance(field, serializers.ListSerializer)
+        child = field.child if many else field
+        if not isinstance(child, serializers.ModelSerializer) or field.source == '*':
+            continue
+
+        path = prefix + field.source.replace('.', '__')
+        model_field = model._meta.get_field(field.source.split('.')[0])
+        to_many = many or model_field.many_to_many or model_field.one_to_many
+        nested_prefetch = in_prefetch or to_many
+        if nested_prefetch:
+            prefetch.append(path)
+        else:
+            select.append(path)
+
+        child_select, child_prefetch = _collect(child, path + '__', nested_prefetch)
+        select.extend(child_select)
+        prefetch.extend(child_prefetch)
+    return tuple(select), tuple(prefetch)
+
+
+def optimize_queryset(queryset, serializer_class):
+    """
+    Apply the joins and prefetches that `serializer_class` will traverse.
+    """
+    select, prefetch = related_paths(serializer_class)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+class PrefetchQuerySetMixin:
+    """
+    Make `get_queryset` load everything the view's serializer renders.
+    """
+    def get_queryset(self):
+        return optimize_queryset(super().get_queryset(), self.get_serializer_class())
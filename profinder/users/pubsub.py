@@ -0,0 +1,130 @@
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+
+try:
+    import redis
+    import redis.asyncio as aioredis
+except ImportError:
+    redis = aioredis = None
+
+
+class Subscription:
+    """
+    A bounded queue of messages for one listener. A listener that falls
+    more than `maxsize` messages behind is marked overflowed and should
+    disconnect and resynchronise over HTTP.
+    """
+    def __init__(self, broker, channel, loop, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def deliver(self, message):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        return await self.queue.get()
+
+    async def close(self):
+        await self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Fan-out of messages to listeners in this process. Safe to publish from
+    any thread; delivery is scheduled on each listener's event loop.
+    """
+    queue_size = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    async def subscribe(self, channel):
+        subscription = Subscription(self, channel, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        with self._lock:
+            listeners = self._subscriptions.get(subscription.channel, set())
+            listeners.discard(subscription)
+            if not listeners:
+                self._subscriptions.pop(subscription.channel, None)
+
+    def publish(self, channel, message):
+        self.dispatch(channel, message)
+
+    def dispatch(self, channel, message):
+        with self._lock:
+            listeners = list(self._subscriptions.get(channel, ()))
+        for subscription in listeners:
+            if subscription.loop.is_closed():
+                continue
+            subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Publishes through Redis so every worker sees every message. Each
+    worker holds one pub/sub connection and fans out to its own listeners.
+    """
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError('RedisBroker requires the redis package.')
+        super().__init__()
+        self.url = url
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = None
+        self._reader = None
+
+    async def subscribe(self, channel):
+        subscription = await super().subscribe(channel)
+        if self._pubsub is None:
+            self._pubsub = aioredis.from_url(self.url).pubsub()
+        await self._pubsub.subscribe(channel)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        await super().unsubscribe(subscription)
+        if subscription.channel not in self._subscriptions and self._pubsub is not None:
+            await self._pubsub.unsubscribe(subscription.channel)
+
+    def publish(self, channel, message):
+        self._client.publish(channel, json.dumps(message))
+
+    async def _read(self):
+        async for event in self._pubsub.listen():
+            if event['type'] == 'message':
+                self.dispatch(event['channel'].decode(), json.loads(event['data']))
+
+
+_broker = None
+
+
+def get_broker():
+    """
+    Return the process-wide broker chosen by `MESSAGE_BROKER_URL`.
+    """
+    global _broker
+    if _broker is None:
+        url = getattr(settings, 'MESSAGE_BROKER_URL', '')
+        _broker = RedisBroker(url) if url.startswith('redis') else InProcessBroker()
+    return _broker
+
+
+def user_channel(user_id):
+    return f'messages:user:{user_id}'
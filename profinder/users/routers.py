@@ -0,0 +1,108 @@
+import contextvars
+import hashlib
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.throttling import BaseThrottle
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+PIN_PREFIX = 'replica-pin:'
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """
+    Let reads in this context go to the replicas in `DATABASE_REPLICAS`.
+    Outside such a context every query goes to the primary.
+    """
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reading_from_replicas():
+    return _replica_reads.get()
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads to a random replica while the current context allows it,
+    and everything else to the primary. The first write in a context
+    pins its remaining reads to the primary, as do open transactions, so
+    a request never reads around its own writes.
+    """
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        if not replicas or not _replica_reads.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        _replica_reads.set(False)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *getattr(settings, 'DATABASE_REPLICAS', ())}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def client_keys(request):
+    """
+    Cache keys identifying the client behind a request: a digest of its
+    credentials, the `Authorization` header or the session cookie, when it
+    has some, or else its address, read like DRF's throttles do so that
+    `NUM_PROXIES` is honoured. Signed-in clients sharing an address are
+    then pinned apart.
+    """
+    credentials = request.headers.get('Authorization') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if credentials:
+        return [f'{PIN_PREFIX}auth:{hashlib.sha256(credentials.encode()).hexdigest()}']
+    return [f'{PIN_PREFIX}ip:{BaseThrottle().get_ident(request)}']
+
+
+def is_pinned(request):
+    return bool(cache.get_many(client_keys(request)))
+
+
+async def ais_pinned(request):
+    return bool(await cache.aget_many(client_keys(request)))
+
+
+def pin(request):
+    """
+    Keep the client on the primary for `DATABASE_REPLICA_PIN_SECONDS`,
+    long enough for its writes to reach the replicas.
+    """
+    cache.set_many(dict.fromkeys(client_keys(request), 1), settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+async def apin(request):
+    await cache.aset_many(dict.fromkeys(client_keys(request), 1), settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def check_pin_cache(app_configs, **kwargs):
+    """
+    Pins live in the default cache, which every worker must share for a
+    client's next request to find them.
+    """
+    if getattr(settings, 'DATABASE_REPLICAS', ()) and isinstance(
+        caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache)
+    ):
+        return [checks.Warning(
+            'Read replicas are configured but the default cache is not shared between processes, so '
+            'clients are not kept on the primary after their writes.',
+            hint='Set REDIS_URL, or point CACHES["default"] at another shared cache.',
+            id='users.W001',
+        )]
+    return []
@@ -0,0 +1,181 @@
+import re
+
+from django.db import connection, connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+SERVICE_DOCUMENTS = """
+    SELECT s.id, s.title, s.description, s.location, c.name
+    FROM users_service s
+    JOIN users_servicecategory c ON c.id = s.category_id
+"""
+
+
+class SQLiteSearchBackend:
+    """
+    Inverted index over services stored in an FTS5 virtual table, ranked
+    with bm25 weighting the columns like the PostgreSQL backend does: a
+    title match counts most, then category, location and description.
+    """
+    table = 'users_service_fts'
+    weights = (10.0, 1.0, 2.0, 5.0)  # title, description, location, category
+
+    def install(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            "title, description, location, category, tokenize='unicode61', prefix='2 3')"
+        )
+
+    def uninstall(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def reindex(self, cursor, where='', params=()):
+        cursor.execute(
+            f'DELETE FROM {self.table} WHERE rowid IN (SELECT s.id FROM users_service s {where})',
+            params,
+        )
+        cursor.execute(
+            f'INSERT INTO {self.table} (rowid, title, description, location, category) '
+            f'{SERVICE_DOCUMENTS} {where}',
+            params,
+        )
+
+    def remove(self, cursor, service_ids):
+        placeholders = ', '.join(['%s'] * len(service_ids))
+        cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', service_ids)
+
+    def build_query(self, terms):
+        return ' '.join('"%s"*' % term for term in terms)
+
+    def filter(self, queryset, terms):
+        return queryset.extra(
+            tables=[self.table],
+            where=[f'{self.table}.rowid = {queryset.model._meta.db_table}.id', f'{self.table} MATCH %s'],
+            params=[self.build_query(terms)],
+        ).annotate(
+            search_rank=RawSQL(f'bm25({self.table}, %s, %s, %s, %s)', self.weights, output_field=FloatField())
+        ).order_by('search_rank', 'id')
+
+
+class PostgresSearchBackend:
+    """
+    Inverted index over services stored as a GIN-indexed tsvector column.
+    """
+    table = 'users_service_search'
+    config = 'simple'
+
+    def install(self, cursor):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} ('
+            'service_id bigint PRIMARY KEY REFERENCES users_service (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)'
+        )
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {self.table}_document_idx ON {self.table} USING GIN (document)'
+        )
+
+    def uninstall(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def reindex(self, cursor, where='', params=()):
+        cursor.execute(
+            f'INSERT INTO {self.table} (service_id, document) '
+            f"SELECT d.id, setweight(to_tsvector('{self.config}', d.title), 'A') "
+            f"|| setweight(to_tsvector('{self.config}', d.name), 'B') "
+            f"|| setweight(to_tsvector('{self.config}', d.location), 'C') "
+            f"|| setweight(to_tsvector('{self.config}', d.description), 'D') "
+            f'FROM ({SERVICE_DOCUMENTS} {where}) d '
+            'ON CONFLICT (service_id) DO UPDATE SET document = EXCLUDED.document',
+            params,
+        )
+
+    def remove(self, cursor, service_ids):
+        cursor.execute(f'DELETE FROM {self.table} WHERE service_id = ANY(%s)', [list(service_ids)])
+
+    def build_query(self, terms):
+        return ' & '.join('%s:*' % term for term in terms)
+
+    def filter(self, queryset, terms):
+        tsquery = f"to_tsquery('{self.config}', %s)"
+        query = self.build_query(terms)
+        return queryset.extra(
+            tables=[self.table],
+            where=[
+                f'{self.table}.service_id = {queryset.model._meta.db_table}.id', f'{self.table}.document @@ {tsquery}',
+            ],
+            params=[query],
+        ).annotate(
+            search_rank=RawSQL(f'ts_rank({self.table}.document, {tsquery})', [query], output_field=FloatField())
+        ).order_by('-search_rank', 'id')
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_backend(conn=None):
+    """
+    Return the search backend for a connection, or None if the vendor has none.
+    """
+    backend_class = BACKENDS.get((conn or connection).vendor)
+    return backend_class() if backend_class else None
+
+
+def tokenize(text):
+    return [token.lower() for token in TOKEN_RE.findall(text or '')]
+
+
+def reindex_services(*service_ids):
+    backend = get_backend()
+    if backend is None or not service_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(service_ids))
+    with connection.cursor() as cursor:
+        backend.reindex(cursor, f'WHERE s.id IN ({placeholders})', service_ids)
+
+
+def reindex_category(category_id):
+    backend = get_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.reindex(cursor, 'WHERE s.category_id = %s', [category_id])
+
+
+def remove_services(*service_ids):
+    backend = get_backend()
+    if backend is None or not service_ids:
+        return
+    with connection.cursor() as cursor:
+        backend.remove(cursor, service_ids)
+
+
+def rebuild_index():
+    backend = get_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        backend.uninstall(cursor)
+        backend.install(cursor)
+        backend.reindex(cursor)
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Ranked, prefix-matching search over the service index, for querysets of
+    any model whose `id` is the service's id. Falls back to DRF's
+    `icontains` search on databases without a search backend.
+    """
+    def filter_queryset(self, request, queryset, view):
+        backend = get_backend(connections[queryset.db])
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+        terms = tokenize(request.query_params.get(self.search_param, ''))
+        if not terms:
+            return queryset
+        return backend.filter(queryset, terms)
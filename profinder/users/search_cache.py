@@ -0,0 +1,147 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import search
+
+KEY_PREFIX = 'service-search'
+
+
+def get_cache():
+    return caches[getattr(settings, 'SEARCH_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'SEARCH_CACHE_TIMEOUT', 300)
+
+
+def _tag_key(tag):
+    return f'{KEY_PREFIX}:tag:{tag}'
+
+
+def _prefixes(terms):
+    return {term[:size] for term in terms for size in (1, 2)}
+
+
+def normalize(request):
+    """
+    Reduce a search request to the parameters that change its response.
+    """
+    params = request.query_params
+    return {
+        'host': request.get_host(),
+        'search': sorted(set(search.tokenize(params.get('search', '')))),
+        'ordering': params.get('ordering', '').replace(' ', ''),
+        'cursor': params.get('cursor', ''),
+        'page_size': params.get('page_size', ''),
+    }
+
+
+def _result_key(query):
+    digest = hashlib.sha1(json.dumps(query, sort_keys=True).encode()).hexdigest()
+    return f'{KEY_PREFIX}:result:{digest}'
+
+
+def _query_tags(query):
+    if query['search']:
+        return {f'prefix:{term[:2]}' for term in query['search']}
+    return {'listing'}
+
+
+def _result_tags(data):
+    tags = set()
+    for row in data.get('results', []):
+        tags.add(f"service:{row['id']}")
+        tags.add(f"category:{row['category']}")
+        tags.add(f"user:{row['service_provider']['user']['id']}")
+    return tags
+
+
+def _current_versions(cache, tags):
+    """
+    Return the version of each tag, starting missing ones at a fresh value
+    so that an evicted tag never matches a version recorded before it.
+    """
+    keys = {tag: _tag_key(tag) for tag in tags}
+    found = cache.get_many(keys.values())
+    versions = {}
+    for tag, key in keys.items():
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+        versions[tag] = found[key]
+    return versions
+
+
+def get_page(request):
+    """
+    Return cached response data for a search request, or None.
+    """
+    cache = get_cache()
+    entry = cache.get(_result_key(normalize(request)))
+    if entry is None:
+        return None
+    versions = cache.get_many([_tag_key(tag) for tag in entry['versions']])
+    for tag, version in entry['versions'].items():
+        if versions.get(_tag_key(tag)) != version:
+            return None
+    return entry['data']
+
+
+def snapshot(request):
+    """
+    Record the versions of the tags covering a query. Taken before the query
+    runs, so a write that commits meanwhile leaves the stored page stale-marked.
+    """
+    return _current_versions(get_cache(), _query_tags(normalize(request)))
+
+
+def set_page(request, data, versions):
+    cache = get_cache()
+    result_tags = _result_tags(data) - versions.keys()
+    entry = {'versions': {**versions, **_current_versions(cache, result_tags)}, 'data': data}
+    cache.set(_result_key(normalize(request)), entry, get_timeout())
+
+
+def versions(tags):
+    """
+    Return the current version of each tag, for callers that tag something
+    other than search pages.
+    """
+    return _current_versions(get_cache(), tags)
+
+
+def invalidate(*tags):
+    """
+    Bump the version of each tag, orphaning every cached page recorded under it.
+    """
+    cache = get_cache()
+    for tag in set(tags):
+        key = _tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def service_tags(service):
+    document = ' '.join([service.title, service.description, service.location, service.category.name])
+    return [
+        'listing',
+        f'service:{service.pk}',
+        *(f'prefix:{prefix}' for prefix in _prefixes(search.tokenize(document))),
+    ]
+
+
+def category_tags(category):
+    return [
+        f'category:{category.pk}',
+        *(f'prefix:{prefix}' for prefix in _prefixes(search.tokenize(category.name))),
+    ]
+
+
+def user_tags(user_id):
+    return [f'user:{user_id}']
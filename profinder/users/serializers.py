@@ -1,7 +1,8 @@
 from rest_framework import serializers
+from users import suggest
 from users.models import (
-    User, ServiceProviderProfile, ServiceCategory, Service,
-    Booking, Message, Notification
+    User, ServiceProviderProfile, ServiceCategory, Service, ServiceSearchDocument,
+    Booking, AvailabilitySlot, Review, ConversationMember, Message, Notification, OutboundEmail
 )
 
 
@@ -17,7 +18,10 @@ class ServiceProviderProfileSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ServiceProviderProfile
-        fields = ['user', 'profession', 'location', 'service_description', 'experience', 'rating']
+        fields = [
+            'user', 'profession', 'location', 'latitude', 'longitude',
+            'service_description', 'experience', 'rating', 'review_count'
+        ]
 
 
 class ServiceCategorySerializer(serializers.ModelSerializer):
@@ -31,7 +35,39 @@ class ServiceSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Service
-        fields = ['id', 'service_provider', 'category', 'title', 'description', 'price', 'location', 'is_active']
+        fields = [
+            'id', 'service_provider', 'category', 'title', 'description', 'price',
+            'location', 'latitude', 'longitude', 'is_active', 'rating'
+        ]
+
+
+class ServiceCardSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ServiceSearchDocument
+        fields = [
+            'id', 'title', 'price', 'category_id', 'category_name', 'provider_id', 'provider_user_id',
+            'provider_name', 'profession', 'rating', 'location', 'is_active'
+        ]
+
+
+class NearbyServiceSerializer(ServiceSerializer):
+    distance_km = serializers.FloatField(read_only=True)
+
+    class Meta(ServiceSerializer.Meta):
+        fields = ServiceSerializer.Meta.fields + ['distance_km']
+
+
+class NearbyQuerySerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90.0, max_value=90.0)
+    lon = serializers.FloatField(min_value=-180.0, max_value=180.0)
+    radius = serializers.FloatField(min_value=0.1, max_value=200.0, default=10.0)
+    limit = serializers.IntegerField(min_value=1, max_value=200, default=50)
+
+
+class SuggestQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=100)
+    type = serializers.MultipleChoiceField(choices=suggest.KINDS, required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=20, default=8)
 
 
 class BookingSerializer(serializers.ModelSerializer):
@@ -40,15 +76,85 @@ class BookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = ['id', 'service', 'client', 'service_provider', 'booking_date', 'status']
+        read_only_fields = ['client', 'service_provider', 'booking_date', 'status']
+
+
+class AvailabilitySlotSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AvailabilitySlot
+        fields = ['id', 'starts_at', 'ends_at']
+
+
+class PublishSlotsSerializer(serializers.Serializer):
+    slots = AvailabilitySlotSerializer(many=True, allow_empty=False, max_length=500)
+
+
+class ReservationSerializer(serializers.Serializer):
+    slot = serializers.PrimaryKeyRelatedField(queryset=AvailabilitySlot.objects.all())
+    service = serializers.PrimaryKeyRelatedField(queryset=Service.objects.filter(is_active=True))
+
+    def validate(self, attrs):
+        if attrs['service'].service_provider_id != attrs['slot'].service_provider_id:
+            raise serializers.ValidationError({"service": "The service is not offered by the slot's provider."})
+        return attrs
+
+
+class ReviewSerializer(serializers.ModelSerializer):
+    author = serializers.HiddenField(default=serializers.CurrentUserDefault())
+
+    class Meta:
+        model = Review
+        fields = ['id', 'service_provider', 'author', 'score', 'comment', 'created_at']
+
+    def validate_service_provider(self, value):
+        if self.instance is not None and value != self.instance.service_provider:
+            raise serializers.ValidationError("A review cannot move to another provider.")
+        if value.user_id == self.context['request'].user.pk:
+            raise serializers.ValidationError("Providers cannot review themselves.")
+        return value
 
 
 class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
-        fields = ['id', 'sender', 'receiver', 'content', 'created_at']
+        fields = ['id', 'conversation', 'sender', 'receiver', 'content', 'created_at']
+        read_only_fields = ['conversation', 'sender']
+
+
+class MessagePreviewSerializer(serializers.ModelSerializer):
+    content = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Message
+        fields = ['id', 'sender', 'content', 'created_at']
+
+    def get_content(self, obj):
+        return obj.content[:140]
+
+
+class ConversationSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='conversation_id', read_only=True)
+    peer = UserSerializer(read_only=True)
+    last_message = MessagePreviewSerializer(source='conversation.last_message', read_only=True)
+
+    class Meta:
+        model = ConversationMember
+        fields = ['id', 'peer', 'last_message', 'last_message_at', 'unread_count', 'last_read_message']
+
+
+class PasswordResetSerializer(serializers.Serializer):
+    email = serializers.EmailField(max_length=OutboundEmail._meta.get_field('to').max_length)
+
+
+class ReadCursorSerializer(serializers.Serializer):
+    message = serializers.IntegerField(required=False, min_value=1)
 
 
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = ['id', 'user', 'message', 'read', 'created_at']
\ No newline at end of file
+        fields = ['id', 'user', 'message', 'read', 'created_at']
+
+
+class NotificationIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
@@ -0,0 +1,115 @@
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import search, search_cache, suggest
+from .authentication import principal_cache
+from .conditional import deletion_tag
+from .models import (
+    User, ServiceProviderProfile, Service, ServiceCategory, ServiceSearchDocument, Notification,
+    NotificationCounter, Review, Booking, ConversationMember, Message,
+)
+
+
+def invalidate_search_cache(tags):
+    transaction.on_commit(lambda: search_cache.invalidate(*tags))
+
+
+@receiver(post_save, sender=Service)
+def index_service(sender, instance, **kwargs):
+    search.reindex_services(instance.pk)
+    ServiceSearchDocument.objects.refresh(Service.objects.filter(pk=instance.pk))
+    invalidate_search_cache(search_cache.service_tags(instance))
+    suggest.services_changed([instance])
+
+
+@receiver(post_delete, sender=Service)
+def unindex_service(sender, instance, **kwargs):
+    search.remove_services(instance.pk)
+    ServiceSearchDocument.objects.filter(pk=instance.pk).delete()
+    invalidate_search_cache(search_cache.service_tags(instance))
+    suggest.service_removed(instance.pk)
+
+
+@receiver(post_save, sender=ServiceCategory)
+def index_category(sender, instance, created, **kwargs):
+    if not created:
+        search.reindex_category(instance.pk)
+        ServiceSearchDocument.objects.refresh(Service.objects.filter(category_id=instance.pk))
+        invalidate_search_cache(search_cache.category_tags(instance))
+    suggest.categories_changed([instance])
+
+
+@receiver(post_delete, sender=ServiceCategory)
+def unindex_category(sender, instance, **kwargs):
+    suggest.category_removed(instance.pk)
+
+
+@receiver(post_save, sender=ServiceProviderProfile)
+def invalidate_provider(sender, instance, created, **kwargs):
+    if not created:
+        ServiceSearchDocument.objects.refresh(Service.objects.filter(service_provider_id=instance.pk))
+    invalidate_search_cache(search_cache.user_tags(instance.user_id))
+    suggest.providers_changed([instance])
+
+
+@receiver(post_delete, sender=ServiceProviderProfile)
+def unindex_provider(sender, instance, **kwargs):
+    suggest.provider_removed(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user(sender, instance, created, **kwargs):
+    if not created:
+        ServiceSearchDocument.objects.refresh(Service.objects.filter(service_provider__user_id=instance.pk))
+        invalidate_search_cache(search_cache.user_tags(instance.pk))
+
+
+@receiver(post_delete, sender=Review)
+def retract_review(sender, instance, **kwargs):
+    ServiceProviderProfile.objects.apply_review(instance.service_provider_id, -1, -instance.score)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_rated_services(sender, instance, **kwargs):
+    services = Service.objects.filter(service_provider_id=instance.service_provider_id).select_related('category')
+    invalidate_search_cache([tag for service in services for tag in search_cache.service_tags(service)])
+
+
+@receiver(post_delete, sender=Notification)
+def release_unread(sender, instance, **kwargs):
+    if not instance.read:
+        NotificationCounter.objects.filter(user_id=instance.user_id).update(unread=models.F('unread') - 1)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=ConversationMember)
+@receiver(post_delete, sender=Notification)
+@receiver(post_delete, sender=Booking)
+@receiver(post_delete, sender=Review)
+def invalidate_etags(sender, instance, **kwargs):
+    invalidate_search_cache([deletion_tag(sender)])
+
+
+@receiver(post_delete, sender=Token)
+def revoke_principal(sender, instance, **kwargs):
+    principal_cache.revoke(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def revoke_user_principals(sender, instance, created=False, **kwargs):
+    """
+    Drop cached principals built from the old account or profile: a
+    deactivated or deleted user must stop authenticating, and an edited one
+    must not be served from a stale snapshot.
+    """
+    if not created:
+        user_id = instance.pk  # Cleared on the instance once it is deleted.
+        transaction.on_commit(lambda: principal_cache.revoke_users(user_id))
@@ -0,0 +1,303 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from . import search, search_cache
+from .models import Service, ServiceCategory, ServiceProviderProfile
+
+KINDS = ('category', 'profession', 'service')
+
+GENERATION_KEY = 'suggest:generation'
+CHANGE_KEY = 'suggest:change:%d'
+
+# Prefixes matching more keys than this keep their answer until the next write.
+MEMO_MIN_KEYS = 256
+
+
+def normalize(text):
+    return ' '.join(search.tokenize(text))
+
+
+class SuggestIndex:
+    """
+    Prefix index over category names, provider professions and active
+    service titles, held in each process.
+
+    Every word suffix of a term ("pipe repair", "repair") sits in one sorted
+    list, so the terms matching a prefix are a contiguous slice found with
+    bisect. A term's weight is how many active services (categories, titles)
+    or providers (professions) it stands for, and the heaviest matches are
+    suggested first. Answers for short prefixes, whose slices are long, are
+    memoized until the next write.
+
+    The index remembers what each row contributed, so applying a row's
+    current values is idempotent whatever it held before. Writes in this
+    process are applied on commit and logged in the search cache under a
+    new generation; within `SUGGEST_SYNC_SECONDS` other processes replay
+    the entries logged since their own generation. The log keeps the last
+    `SUGGEST_LOG_SIZE` entries, and only a process that has fallen further
+    behind, or finds an entry missing, loads the index from the database
+    again.
+    """
+    state = ('_keys', '_terms', '_categories', '_category_services', '_services', '_providers', '_memo')
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rebuilding = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._keys = []           # sorted (suffix, kind, term)
+            self._terms = {}          # (kind, term) -> [label, refs, weight]
+            self._categories = {}     # category pk -> term
+            self._category_services = Counter()
+            self._services = {}       # active service pk -> (term, category pk)
+            self._providers = {}      # provider pk -> term
+            self._memo = {}
+            self._loading = False
+            self.generation = None
+            self._checked = 0.0
+            self._stalled = None
+
+    # Terms
+
+    def _add(self, kind, term, label, refs=0, weight=0):
+        if not term:
+            return
+        self._memo.clear()
+        entry = self._terms.get((kind, term))
+        if entry is None:
+            entry = self._terms[kind, term] = [label, 0, 0]
+            words = term.split(' ')
+            for i in range(len(words)):
+                key = (' '.join(words[i:]), kind, term)
+                if self._loading:
+                    self._keys.append(key)
+                else:
+                    insort(self._keys, key)
+        entry[1] += refs
+        entry[2] += weight
+
+    def _discard(self, kind, term, refs=0, weight=0):
+        entry = self._terms.get((kind, term))
+        if entry is None:
+            return
+        self._memo.clear()
+        entry[1] -= refs
+        entry[2] -= weight
+        if entry[1] <= 0:
+            del self._terms[kind, term]
+            words = term.split(' ')
+            for i in range(len(words)):
+                key = (' '.join(words[i:]), kind, term)
+                index = bisect_left(self._keys, key)
+                if index < len(self._keys) and self._keys[index] == key:
+                    del self._keys[index]
+
+    # Rows
+
+    def set_categories(self, rows):
+        with self._lock:
+            for pk, name in rows:
+                count = self._category_services[pk]
+                if pk in self._categories:
+                    self._discard('category', self._categories[pk], 1, count)
+                self._categories[pk] = normalize(name)
+                self._add('category', self._categories[pk], name, 1, count)
+
+    def remove_category(self, pk):
+        with self._lock:
+            if pk in self._categories:
+                self._discard('category', self._categories.pop(pk), 1, self._category_services.pop(pk, 0))
+
+    def set_services(self, rows):
+        with self._lock:
+            for pk, title, category_id, is_active in rows:
+                self.remove_service(pk)
+                if not is_active:
+                    continue
+                self._services[pk] = (normalize(title), category_id)
+                self._add('service', self._services[pk][0], title, 1, 1)
+                self._category_services[category_id] += 1
+                if category_id in self._categories:
+                    self._add('category', self._categories[category_id], None, 0, 1)
+
+    def remove_service(self, pk):
+        with self._lock:
+            if pk not in self._services:
+                return
+            term, category_id = self._services.pop(pk)
+            self._discard('service', term, 1, 1)
+            self._category_services[category_id] -= 1
+            if category_id in self._categories:
+                self._discard('category', self._categories[category_id], 0, 1)
+
+    def set_providers(self, rows):
+        with self._lock:
+            for pk, profession in rows:
+                self.remove_provider(pk)
+                self._providers[pk] = normalize(profession)
+                self._add('profession', self._providers[pk], profession, 1, 1)
+
+    def remove_provider(self, pk):
+        with self._lock:
+            if pk in self._providers:
+                self._discard('profession', self._providers.pop(pk), 1, 1)
+
+    # Freshness
+
+    def rebuild(self, generation=None):
+        """
+        Load every category, provider and active service into a new index,
+        then swap it in.
+        """
+        fresh = SuggestIndex()
+        fresh._loading = True
+        fresh.set_categories(ServiceCategory.objects.values_list('pk', 'name').iterator())
+        fresh.set_providers(ServiceProviderProfile.objects.values_list('pk', 'profession').iterator())
+        fresh.set_services(
+            Service.objects.filter(is_active=True).values_list('pk', 'title', 'category_id', 'is_active').iterator()
+        )
+        fresh._keys.sort()
+        fresh._memo.clear()
+        with self._lock:
+            for name in self.state:
+                setattr(self, name, getattr(fresh, name))
+            self.generation = generation
+            self._stalled = None
+
+    def replay(self, generation):
+        """
+        Apply the changes logged after this index's generation, up to
+        `generation`. Return False if the index must be rebuilt instead:
+        it is further behind than the log reaches, or an entry is still
+        missing one sync after it was first found missing (a writer bumps
+        the generation just before logging its change).
+        """
+        if generation - self.generation > settings.SUGGEST_LOG_SIZE:
+            return False
+        keys = [CHANGE_KEY % number for number in range(self.generation + 1, generation + 1)]
+        changes = search_cache.get_cache().get_many(keys)
+        with self._lock:
+            # A local write may have moved the generation on meanwhile.
+            for number in range(self.generation + 1, generation + 1):
+                change = changes.get(CHANGE_KEY % number)
+                if change is None:
+                    if self._stalled == number:
+                        return False
+                    self._stalled = number
+                    return True
+                name, args = change
+                getattr(self, name)(*args)
+                self.generation = number
+        return True
+
+    def ensure_current(self):
+        now = time.monotonic()
+        if self.generation is not None and now < self._checked + settings.SUGGEST_SYNC_SECONDS:
+            return
+        self._checked = now
+        cache = search_cache.get_cache()
+        generation = cache.get(GENERATION_KEY)
+        if generation is None:
+            cache.add(GENERATION_KEY, time.time_ns(), None)
+            generation = cache.get(GENERATION_KEY)
+        if self.generation is not None and self.replay(generation):
+            return
+        # One thread per process rebuilds; once an index is loaded, the others keep serving it meanwhile.
+        if not self._rebuilding.acquire(blocking=self.generation is None):
+            return
+        try:
+            if self.generation != generation:
+                self.rebuild(generation)
+        finally:
+            self._rebuilding.release()
+
+    def apply(self, method, *args):
+        """
+        Call `method` with the index locked, then bump the shared generation
+        and log the change under it for the other processes. The index
+        keeps the new generation only if it held the one before; otherwise
+        it catches up on the next sync. A missing generation starts at a
+        fresh value, so that processes synced before it was evicted rebuild.
+        """
+        with self._lock:
+            method(*args)
+            cache = search_cache.get_cache()
+            try:
+                generation = cache.incr(GENERATION_KEY)
+            except ValueError:
+                generation = time.time_ns()
+                cache.set(GENERATION_KEY, generation, None)
+            cache.set(CHANGE_KEY % generation, (method.__name__, args), None)
+            cache.delete(CHANGE_KEY % (generation - settings.SUGGEST_LOG_SIZE))
+            if self.generation is not None and generation == self.generation + 1:
+                self.generation = generation
+
+    # Queries
+
+    def suggest(self, prefix, kinds=KINDS, limit=8):
+        """
+        Return up to `limit` `(kind, label, weight)` terms with a word
+        starting with `prefix`, heaviest first.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            memo_key = (prefix, tuple(sorted(kinds)), limit)
+            if memo_key in self._memo:
+                return self._memo[memo_key]
+            keys, terms = self._keys, self._terms
+            start = bisect_left(keys, (prefix,))
+            stop = bisect_left(keys, (prefix + '\uffff',), start)
+            matches = {(kind, term) for _, kind, term in keys[start:stop] if kind in kinds}
+            best = heapq.nsmallest(limit, matches, key=lambda match: (-terms[match][2], match[1], match[0]))
+            results = [(kind, terms[kind, term][0], terms[kind, term][2]) for kind, term in best]
+            if stop - start > MEMO_MIN_KEYS:
+                self._memo[memo_key] = results
+            return results
+
+
+index = SuggestIndex()
+
+
+def suggest(prefix, kinds=KINDS, limit=8):
+    index.ensure_current()
+    return index.suggest(prefix, kinds, limit)
+
+
+def _on_commit(method, *args):
+    transaction.on_commit(lambda: index.apply(method, *args))
+
+
+def services_changed(services):
+    _on_commit(index.set_services, [
+        (service.pk, service.title, service.category_id, service.is_active) for service in services
+    ])
+
+
+def service_removed(pk):
+    _on_commit(index.remove_service, pk)
+
+
+def categories_changed(categories):
+    _on_commit(index.set_categories, [(category.pk, category.name) for category in categories])
+
+
+def category_removed(pk):
+    _on_commit(index.remove_category, pk)
+
+
+def providers_changed(profiles):
+    _on_commit(index.set_providers, [(profile.pk, profile.profession) for profile in profiles])
+
+
+def provider_removed(pk):
+    _on_commit(index.remove_provider, pk)
@@ -1,3 +1,1886 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import itertools
+import json
+import os
+import runpy
+import tempfile
+import threading
+import time
+import types
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from django.core.management import CommandError, call_command
+from django.db import connection, router, transaction
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import (
+    authentication, availability, benchmark, export, geo, ingest, metrics, outbox, routers, search_cache, suggest,
+    throttling, websocket, writequeue,
+)
+from .models import (
+    User, ServiceProviderProfile, ServiceCategory, Service, Message, Notification, NotificationCounter,
+    OutboundEmail, Booking, AvailabilitySlot, Review, Conversation, ConversationMember, ServiceSearchDocument,
+)
+from .authentication import principal_cache
+from .compiled import compile_serializer
+from .middleware import ReplicaRoutingMiddleware
+from .prefetch import related_paths
+from .pubsub import InProcessBroker, get_broker, user_channel
+from .renderers import FastJSONRenderer
+from .asyncviews import AsyncAPIViewMixin
+from .views import MessageViewSet, NotificationViewSet, ServiceSearchView
+from .serializers import UserSerializer, ServiceSerializer, ServiceProviderProfileSerializer
+
+
+_emails = itertools.count()
+
+
+def create_provider(email, profession='Plumber', location='Tunis'):
+    user = User.objects.create(email=email, user_type='service_provider', first_name='Pro')
+    return ServiceProviderProfile.objects.create(user=user, profession=profession, location=location)
+
+
+def create_services(count, category=None, provider=None, title='Pipe repair'):
+    category = category or ServiceCategory.objects.create(name='Plumbing')
+    services = []
+    for _ in range(count):
+        profile = provider or create_provider(f'provider{next(_emails)}@example.com')
+        services.append(Service.objects.create(
+            service_provider=profile, category=category, title=title,
+            description='Fix leaks', price=Decimal('25.00'), location='Tunis',
+        ))
+    return services
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+
+class PrefetchPlannerTests(APITestCase):
+    def test_related_paths_follow_serializer_tree(self):
+        self.assertEqual(
+            related_paths(ServiceSerializer),
+            (('service_provider', 'service_provider__user'), ()),
+        )
+        self.assertEqual(related_paths(ServiceProviderProfileSerializer), (('user',), ()))
+
+    def test_search_query_count_is_constant(self):
+        client = self.client
+        url = reverse('users:service-search')
+        category = ServiceCategory.objects.create(name='Plumbing')
+
+        create_services(2, category=category)
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(len(client.get(url).data['results']), 2)
+
+        create_services(20, category=category)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(len(client.get(url, {'page_size': 50}).data['results']), 22)
+
+        self.assertEqual(len(small), 1)
+        self.assertEqual(len(large), len(small))
+
+
+class FullTextSearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('users:service-search')
+        self.plumbing = ServiceCategory.objects.create(name='Plumbing')
+        self.garden = ServiceCategory.objects.create(name='Gardening')
+
+    def search(self, term):
+        return [row['id'] for row in self.client.get(self.url, {'search': term}).data['results']]
+
+    def test_prefix_match_across_fields(self):
+        drain, = create_services(1, category=self.plumbing, title='Drain unblocking')
+        hedge, = create_services(1, category=self.garden, title='Hedge trimming')
+        self.assertEqual(self.search('drai'), [drain.id])
+        self.assertEqual(self.search('garden'), [hedge.id])
+        self.assertEqual(set(self.search('tunis')), {drain.id, hedge.id})
+
+    def test_title_matches_rank_first(self):
+        described, = create_services(1, category=self.plumbing, title='General fixes')
+        described.description = 'Boiler boiler boiler'
+        described.save()
+        titled, = create_services(1, category=self.plumbing, title='Boiler service')
+        self.assertEqual(self.search('boiler'), [titled.id, described.id])
+        self.assertEqual(self.search('boiler service'), [titled.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        service, = create_services(1, category=self.plumbing, title='Drain unblocking')
+        self.assertEqual(self.search('drain'), [service.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            service.title = 'Roof repair'
+            service.save()
+        self.assertEqual(self.search('drain'), [])
+        self.assertEqual(self.search('roof'), [service.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plumbing.name = 'Roofing'
+            self.plumbing.save()
+        self.assertEqual(self.search('roofing'), [service.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            service.delete()
+        self.assertEqual(self.search('roof'), [])
+
+    def test_punctuation_is_not_query_syntax(self):
+        create_services(1, category=self.plumbing, title='Leak repair')
+        self.assertEqual(self.client.get(self.url, {'search': '"leak* OR ('}).status_code, 200)
+
+
+class SearchResultCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('users:service-search')
+        self.plumbing = ServiceCategory.objects.create(name='Plumbing')
+        self.garden = ServiceCategory.objects.create(name='Gardening')
+        self.drain, = create_services(1, category=self.plumbing, title='Drain unblocking')
+        self.hedge, = create_services(1, category=self.garden, title='Hedge trimming')
+
+    def assertCached(self, params, cached=True):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries) == 0, cached)
+        return response.data
+
+    def write(self, obj, **changes):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, value in changes.items():
+                setattr(obj, name, value)
+            obj.save()
+
+    def test_repeat_search_is_served_from_cache(self):
+        self.assertCached({'search': 'Drain  '}, cached=False)
+        data = self.assertCached({'search': 'drain'})
+        self.assertEqual([row['id'] for row in data['results']], [self.drain.id])
+
+    def test_unrelated_write_keeps_entry(self):
+        self.assertCached({'search': 'drain'}, cached=False)
+        self.write(self.hedge, price=Decimal('99.00'))
+        self.assertCached({'search': 'drain'})
+
+    def test_edit_of_listed_service_evicts_entry(self):
+        self.assertCached({'search': 'drain'}, cached=False)
+        self.write(self.drain, title='Blocked drain')
+        data = self.assertCached({'search': 'drain'}, cached=False)
+        self.assertEqual(data['results'][0]['title'], 'Blocked drain')
+
+    def test_new_matching_service_evicts_entry(self):
+        self.assertCached({'search': 'hedge'}, cached=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            create_services(1, category=self.garden, title='Hedge planting')
+        data = self.assertCached({'search': 'hedge'}, cached=False)
+        self.assertEqual(len(data['results']), 2)
+
+    def test_provider_and_category_writes_evict_entry(self):
+        self.assertCached({}, cached=False)
+        self.write(self.drain.service_provider.user, first_name='Renamed')
+        self.assertCached({}, cached=False)
+        self.write(self.drain.service_provider, profession='Roofer')
+        self.assertCached({}, cached=False)
+        self.assertCached({'search': 'plumbing'}, cached=False)
+        self.write(self.plumbing, name='Pipes')
+        self.assertCached({'search': 'plumbing'}, cached=False)
+
+    def test_evicted_tag_invalidates_entry(self):
+        self.assertCached({'search': 'drain'}, cached=False)
+        cache.delete(f'{search_cache.KEY_PREFIX}:tag:service:{self.drain.id}')
+        self.assertCached({'search': 'drain'}, cached=False)
+
+
+class SearchDocumentTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.plumbing = ServiceCategory.objects.create(name='Plumbing')
+        self.services = create_services(3, self.plumbing)
+        self.provider = self.services[0].service_provider
+
+    def assert_documents_current(self):
+        expected = sorted(ServiceSearchDocument.objects.source(Service.objects.all()), key=lambda row: row['id'])
+        self.assertEqual(list(ServiceSearchDocument.objects.order_by('id').values()), expected)
+
+    def test_documents_follow_writes(self):
+        self.assert_documents_current()
+        self.plumbing.name = 'Pipework'
+        self.plumbing.save()
+        user = self.provider.user
+        user.first_name, user.last_name = 'Amel', 'Ben Ali'
+        user.save()
+        self.provider.profession = 'Pipe fitter'
+        self.provider.save()
+        Review.objects.create(service_provider=self.provider, author=User.objects.create(email='a@example.com'), score=5)
+        self.services[1].is_active = False
+        self.services[1].save()
+        self.services[2].delete()
+        self.assert_documents_current()
+        document = ServiceSearchDocument.objects.get(pk=self.services[0].pk)
+        self.assertEqual(
+            (document.category_name, document.provider_name, document.profession),
+            ('Pipework', 'Amel Ben Ali', 'Pipe fitter'),
+        )
+        self.assertEqual(document.rating, Service.objects.get(pk=self.services[0].pk).rating)
+
+    def test_card_search_reads_one_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('users:service-search-cards'), {'search': 'pipe', 'ordering': 'price'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['id'] for row in response.data['results']}, {service.pk for service in self.services})
+        self.assertEqual(response.data['results'][0]['category_name'], 'Plumbing')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('JOIN', queries[0]['sql'])
+
+    def test_reconcile_repairs_drift(self):
+        Service.objects.filter(pk=self.services[0].pk).update(title='Changed behind our back')
+        ServiceSearchDocument.objects.filter(pk=self.services[1].pk).delete()
+        ServiceSearchDocument.objects.create(
+            id=10 ** 9, title='Orphan', price=Decimal('1.00'), category_id=0, category_name='', provider_id=0,
+            provider_user_id=0, provider_name='', profession='', rating=0, is_active=True, created_at=timezone.now(),
+        )
+        out = io.StringIO()
+        call_command('reconcile_search_documents', batch_size=2, stdout=out)
+        self.assertIn('Rewrote 2 and deleted 1', out.getvalue())
+        self.assert_documents_current()
+
+
+class SuggestTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        suggest.index.clear()
+        self.plumbing = ServiceCategory.objects.create(name='Plumbing')
+        self.painting = ServiceCategory.objects.create(name='Painting')
+        create_services(3, self.plumbing, title='Pipe repair')
+        create_services(1, self.painting, title='Wall painting')
+        self.painter = create_provider('painter@example.com', profession='Painter')
+
+    def get(self, q, **params):
+        response = self.client.get(reverse('users:service-suggest'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(row['type'], row['text'], row['count']) for row in response.data['results']]
+
+    def assert_index_matches_database(self):
+        rebuilt = suggest.SuggestIndex()
+        rebuilt.rebuild()
+        self.assertEqual(suggest.index._terms, rebuilt._terms)
+        self.assertEqual(suggest.index._keys, rebuilt._keys)
+
+    def test_heaviest_word_prefix_matches_first(self):
+        self.assertEqual(self.get('p'), [
+            ('profession', 'Plumber', 4), ('service', 'Pipe repair', 3), ('category', 'Plumbing', 3),
+            ('profession', 'Painter', 1), ('category', 'Painting', 1), ('service', 'Wall painting', 1),
+        ])
+        self.assertEqual(self.get('REP'), [('service', 'Pipe repair', 3)])
+        self.assertEqual(self.get('pipe re'), [('service', 'Pipe repair', 3)])
+        self.assertEqual(self.get('pl', type='category', limit=5), [('category', 'Plumbing', 3)])
+        self.assertEqual(self.get('zz'), [])
+
+    def test_warm_suggestions_make_no_queries(self):
+        self.get('pl')
+        with self.assertNumQueries(0):
+            self.get('pa')
+
+    def test_signals_keep_the_index_current(self):
+        self.get('p')
+        with self.captureOnCommitCallbacks(execute=True):
+            service = create_services(1, self.painting, title='Boiler service')[0]
+            self.painting.name = 'Decorating'
+            self.painting.save()
+            Service.objects.filter(title='Pipe repair').first().delete()
+            self.painter.profession = 'Pipe fitter'
+            self.painter.save()
+            service.is_active = False
+            service.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get('p', type=['category', 'service']), [
+                ('service', 'Pipe repair', 2), ('category', 'Plumbing', 2), ('service', 'Wall painting', 1),
+            ])
+            self.assertEqual(self.get('fit'), [('profession', 'Pipe fitter', 1)])
+            self.assertEqual(self.get('deco'), [('category', 'Decorating', 1)])
+        self.assert_index_matches_database()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plumbing.delete()
+        self.assert_index_matches_database()
+
+    @override_settings(SUGGEST_SYNC_SECONDS=0)
+    def test_writes_in_other_processes_are_replayed_from_the_log(self):
+        self.get('p')
+        other = suggest.SuggestIndex()
+        other.rebuild()
+        with mock.patch.object(suggest, 'index', other), self.captureOnCommitCallbacks(execute=True):
+            create_services(1, self.painting, title='Boiler service')
+            self.painter.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get('boil'), [('service', 'Boiler service', 1)])
+            self.assertEqual(self.get('painter'), [])
+        self.assert_index_matches_database()
+
+    @override_settings(SUGGEST_SYNC_SECONDS=0, SUGGEST_LOG_SIZE=10)
+    def test_processes_behind_the_log_rebuild(self):
+        self.get('p')
+        Service.objects.create(
+            service_provider=self.painter, category=self.plumbing, title='Pipe repair',
+            description='Fix leaks', price=Decimal('25.00'),
+        )
+        cache = search_cache.get_cache()
+        generation = cache.get(suggest.GENERATION_KEY)
+        cache.set(suggest.GENERATION_KEY, generation + 1, None)
+        cache.delete(suggest.CHANGE_KEY % (generation + 1))
+        # A missing entry may still be on its way, so it is waited for once.
+        self.assertIn(('service', 'Pipe repair', 3), self.get('pipe'))
+        self.assertIn(('service', 'Pipe repair', 4), self.get('pipe'))
+
+        cache.set(suggest.GENERATION_KEY, generation + 12, None)
+        with self.assertNumQueries(3):
+            self.get('pipe')
+
+    @override_settings(SUGGEST_SYNC_SECONDS=0, SUGGEST_LOG_SIZE=10)
+    def test_one_thread_rebuilds_while_the_others_serve_the_loaded_index(self):
+        self.get('p')
+        search_cache.get_cache().set(suggest.GENERATION_KEY, 99, None)
+        with suggest.index._rebuilding, self.assertNumQueries(0):
+            self.assertIn(('service', 'Pipe repair', 3), self.get('pipe'))
+
+    def test_invalid_parameters_are_rejected(self):
+        url = reverse('users:service-suggest')
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'p', 'type': 'user'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'q': 'p', 'limit': 50}).status_code, 400)
+
+
+class CompiledSerializerTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        category = ServiceCategory.objects.create(name='Plumbing')
+        self.services = create_services(3, category=category)
+        odd = self.services[0]
+        odd.title = 'Répar\u2028ation "express" 🚰'
+        odd.price = Decimal('1234567.5')
+        odd.latitude, odd.longitude = 36.806495, 10.181532
+        odd.save()
+        profile = self.services[1].service_provider
+        profile.rating = 4.35
+        profile.save()
+
+    def assertParity(self, serializer_class, queryset):
+        compiled = compile_serializer(serializer_class)
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        actual = FastJSONRenderer().render(compiled.render(compiled.values(queryset)))
+        self.assertEqual(actual, expected)
+
+    def test_output_is_byte_identical(self):
+        self.assertParity(ServiceSerializer, Service.objects.order_by('id'))
+        self.assertParity(ServiceProviderProfileSerializer, ServiceProviderProfile.objects.order_by('id'))
+        self.assertParity(UserSerializer, User.objects.order_by('id'))
+
+    def test_endpoint_matches_drf_rendering(self):
+        response = self.client.get(reverse('users:service-search'))
+        services = Service.objects.order_by('-created_at', '-id')
+        expected = JSONRenderer().render({
+            'next': None, 'previous': None, 'results': ServiceSerializer(services, many=True).data,
+        })
+        self.assertEqual(response.content, expected)
+
+
+class GeoTests(TestCase):
+    def test_encode_matches_reference_geohash(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+    def test_covering_cells_contain_points_in_box(self):
+        box = geo.bounding_box(36.8, 10.18, 5)
+        cells = geo.covering_cells(*box)
+        self.assertLessEqual(len(cells), geo.MAX_CELLS)
+        for lat, lon in [(36.8, 10.18), (36.84, 10.23), (36.76, 10.13)]:
+            self.assertTrue(any(geo.encode(lat, lon).startswith(cell) for cell in cells))
+
+    def test_covering_cells_wrap_antimeridian(self):
+        cells = geo.covering_cells(*geo.bounding_box(0.0, 179.99, 5))
+        self.assertTrue(any(geo.encode(0.0, -179.99).startswith(cell) for cell in cells))
+
+    def test_nearby_endpoint_ranks_by_distance(self):
+        url = reverse('users:service-nearby')
+        center, near, far = create_services(3)
+        for service, (lat, lon) in zip([center, near, far], [(36.8065, 10.1815), (36.82, 10.2), (35.8, 10.6)]):
+            service.latitude, service.longitude = lat, lon
+            service.save()
+
+        response = APIClient().get(url, {'lat': 36.8, 'lon': 10.18, 'radius': 5})
+        self.assertEqual([row['id'] for row in response.data], [center.id, near.id])
+        self.assertLess(response.data[0]['distance_km'], response.data[1]['distance_km'])
+
+        self.assertEqual(APIClient().get(url, {'lat': 100, 'lon': 0}).status_code, 400)
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.viewer = User.objects.create(email='viewer@example.com')
+        self.client.force_authenticate(self.viewer)
+
+    def walk(self, url, params=None):
+        pages, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            if not response.data['next']:
+                return pages
+            response = self.client.get(response.data['next'])
+
+    def test_pages_cover_every_row_newest_first(self):
+        for i in range(6):
+            User.objects.create(email=f'client{i}@example.com')
+        pages = self.walk(reverse('users:user-list'), {'page_size': 4})
+        ids = [row['id'] for page in pages for row in page['results']]
+        self.assertEqual(ids, list(User.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+        self.assertEqual(len(pages), 2)
+
+        back = self.client.get(pages[-1]['previous'])
+        self.assertEqual(back.data['results'], pages[0]['results'])
+
+    def test_deep_pages_seek_instead_of_offset(self):
+        for i in range(5):
+            User.objects.create(email=f'client{i}@example.com', user_type='client')
+        first = self.client.get(reverse('users:user-get-clients'), {'page_size': 2})
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(first.data['next'])
+        self.assertEqual(len(second.data['results']), 2)
+        self.assertNotIn('OFFSET', queries[-1]['sql'].upper())
+
+    def test_inbox_is_paginated_per_receiver(self):
+        sender = User.objects.create(email='sender@example.com')
+        for i in range(3):
+            Message.objects.create(sender=sender, receiver=self.viewer, content=f'hello {i}')
+        Message.objects.create(sender=self.viewer, receiver=sender, content='reply')
+        pages = self.walk(reverse('users:message-list'), {'page_size': 2})
+        contents = [row['content'] for page in pages for row in page['results']]
+        self.assertEqual(contents, ['hello 2', 'hello 1', 'hello 0'])
+
+    def test_ranked_search_pages_keep_relevance_order(self):
+        category = ServiceCategory.objects.create(name='Plumbing')
+        create_services(5, category=category, title='Boiler service')
+        url = reverse('users:service-search')
+        everything = self.client.get(url, {'search': 'boiler', 'page_size': 10}).data['results']
+        pages = self.walk(url, {'search': 'boiler', 'page_size': 2})
+        self.assertEqual([row for page in pages for row in page['results']], everything)
+
+    def test_ordering_param_drives_the_keyset(self):
+        category = ServiceCategory.objects.create(name='Plumbing')
+        for price in ['30.00', '10.00', '20.00', '10.00']:
+            service, = create_services(1, category=category)
+            service.price = Decimal(price)
+            service.save()
+        pages = self.walk(reverse('users:service-search'), {'ordering': 'price', 'page_size': 1})
+        prices = [row['price'] for page in pages for row in page['results']]
+        self.assertEqual(prices, ['10.00', '10.00', '20.00', '30.00'])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(reverse('users:user-list'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class QueryPlanTests(APITestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on every query an endpoint issues and fails if
+    one of them regresses to a full table scan or an unindexed sort. The
+    tables are deliberately not ANALYZEd: without statistics SQLite plans as
+    if they were large, which is the case these indexes exist for.
+    """
+    def setUp(self):
+        super().setUp()
+        self.viewer = User.objects.create(email='viewer@example.com')
+        self.client.force_authenticate(self.viewer)
+        category = ServiceCategory.objects.create(name='Plumbing')
+        create_services(3, category=category)
+        Message.objects.create(sender=self.viewer, receiver=self.viewer, content='note')
+
+    def query_plans(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans.append((query['sql'], [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def assertIndexed(self, url, params=None, allow_sort=False):
+        for sql, plan in self.query_plans(url, params):
+            for step in plan:
+                full_scan = step.startswith('SCAN ') and ' USING ' not in step and 'VIRTUAL TABLE' not in step
+                self.assertFalse(full_scan, f'{step} in plan for {sql}')
+                if not allow_sort:
+                    self.assertNotIn('TEMP B-TREE', step, f'{step} in plan for {sql}')
+
+    def test_user_listings(self):
+        self.assertIndexed(reverse('users:user-list'))
+        self.assertIndexed(reverse('users:user-get-clients'))
+        self.assertIndexed(reverse('users:user-get-service-providers'))
+        self.assertIndexed(reverse('users:user-search-by-email'), {'email': 'viewer@example.com'})
+
+    def test_inbox_and_notifications(self):
+        self.assertIndexed(reverse('users:message-list'))
+        self.assertIndexed(reverse('users:notification-list'))
+        self.assertIndexed(reverse('users:conversation-list'))
+        conversation = Conversation.objects.get()
+        self.assertIndexed(reverse('users:conversation-messages', args=[conversation.pk]))
+
+    def test_provider_reviews(self):
+        provider = Service.objects.first().service_provider
+        self.assertIndexed(reverse('users:review-list'), {'service_provider': provider.pk})
+
+    def test_service_search(self):
+        url = reverse('users:service-search')
+        self.assertIndexed(url)
+        self.assertIndexed(url, {'ordering': '-price'})
+        self.assertIndexed(url, {'ordering': '-rating'})
+        self.assertIndexed(url, {'search': 'pipe'}, allow_sort=True)
+
+    def test_nearby_services(self):
+        self.assertIndexed(reverse('users:service-nearby'), {'lat': 36.8, 'lon': 10.18}, allow_sort=True)
+
+
+class MessageSocketTests(SimpleTestCase):
+    def connect(self, ticket):
+        scope = {'type': 'websocket', 'path': '/ws/messages/', 'query_string': f'ticket={ticket}'.encode()}
+        return ApplicationCommunicator(websocket.application, scope)
+
+    async def test_pushes_messages_for_ticket_user(self):
+        socket = self.connect(websocket.make_ticket(7))
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await socket.receive_output(1))['type'], 'websocket.accept')
+
+        get_broker().publish(user_channel(8), {'content': 'not yours'})
+        get_broker().publish(user_channel(7), {'content': 'hello'})
+        event = await socket.receive_output(1)
+        self.assertEqual(event, {'type': 'websocket.send', 'text': '{"content": "hello"}'})
+        self.assertTrue(await socket.receive_nothing())
+
+        await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await socket.wait(1)
+        self.assertNotIn(user_channel(7), get_broker()._subscriptions)
+
+    async def test_rejects_forged_ticket(self):
+        socket = self.connect(websocket.make_ticket(7) + 'x')
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual(await socket.receive_output(1), {'type': 'websocket.close', 'code': 4401})
+
+    async def test_slow_listener_is_disconnected(self):
+        broker = InProcessBroker()
+        broker.queue_size = 2
+        subscription = await broker.subscribe('channel')
+        for i in range(3):
+            broker.publish('channel', i)
+        await asyncio.sleep(0)
+        self.assertTrue(subscription.overflowed)
+        self.assertEqual([await subscription.get(), await subscription.get()], [0, 1])
+
+
+class MessagePublishTests(APITestCase):
+    def test_created_message_reaches_receiver_channel(self):
+        sender = User.objects.create(email='sender@example.com')
+        receiver = User.objects.create(email='receiver@example.com')
+        self.client.force_authenticate(sender)
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        subscription = loop.run_until_complete(get_broker().subscribe(user_channel(receiver.pk)))
+        self.addCleanup(loop.run_until_complete, subscription.close())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('users:message-list'), {'receiver': receiver.pk, 'content': 'hi'})
+        self.assertEqual(response.status_code, 201)
+        pushed = loop.run_until_complete(asyncio.wait_for(subscription.get(), 1))
+        self.assertEqual(pushed['content'], 'hi')
+        self.assertEqual(pushed['sender'], sender.pk)
+
+    def test_ticket_is_issued_to_the_requesting_user(self):
+        user = User.objects.create(email='user@example.com')
+        self.client.force_authenticate(user)
+        ticket = self.client.post(reverse('users:message-ws-ticket')).data['ticket']
+        self.assertEqual(websocket.read_ticket(ticket), user.pk)
+
+
+class NotificationCounterTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(email='user@example.com')
+        self.other = User.objects.create(email='other@example.com')
+        self.client.force_authenticate(self.user)
+        self.notifications = [Notification.objects.create(user=self.user, message=f'n{i}') for i in range(4)]
+        Notification.objects.create(user=self.other, message='elsewhere')
+
+    def unread(self):
+        with self.assertNumQueries(1) as queries:
+            count = self.client.get(reverse('users:notification-unread-count')).data['unread']
+        self.assertNotIn('users_notification"', queries.captured_queries[0]['sql'])
+        self.assertEqual(count, Notification.objects.filter(user=self.user, read=False).count())
+        return count
+
+    def test_counter_follows_creates_saves_and_deletes(self):
+        self.assertEqual(self.unread(), 4)
+        first, second = self.notifications[:2]
+        first.read = True
+        first.save()
+        self.assertEqual(self.unread(), 3)
+        first.save()
+        self.assertEqual(self.unread(), 3)
+        second.delete()
+        first.delete()
+        self.assertEqual(self.unread(), 2)
+
+    def test_mark_read_by_ids_is_one_update(self):
+        ids = [n.pk for n in self.notifications[:2]] + [Notification.objects.get(user=self.other).pk]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('users:notification-mark-read'), {'ids': ids}, format='json')
+        self.assertEqual(response.data, {'updated': 2})
+        self.assertEqual(sum(q['sql'].startswith('UPDATE "users_notification"') for q in queries), 1)
+        self.assertEqual(self.unread(), 2)
+        self.assertEqual(NotificationCounter.objects.unread(self.other.pk), 1)
+
+    def test_mark_all_read(self):
+        self.client.post(reverse('users:notification-mark-as-read', args=[self.notifications[0].pk]))
+        response = self.client.post(reverse('users:notification-mark-all-read'))
+        self.assertEqual(response.data, {'updated': 3})
+        self.assertEqual(self.unread(), 0)
+
+    def test_mark_as_read_of_unknown_notification_is_not_found(self):
+        other = Notification.objects.get(user=self.other)
+        url = reverse('users:notification-mark-as-read', args=[other.pk])
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertEqual(NotificationCounter.objects.unread(self.other.pk), 1)
+
+
+class EmailOutboxTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(email='user@example.com')
+        self.url = reverse('users:password-reset')
+
+    def test_request_only_enqueues(self):
+        for email in ['user@example.com', 'nobody@example.com']:
+            with self.assertNumQueries(1):
+                response = self.client.post(self.url, {'email': email})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.filter(status='pending').count(), 2)
+
+    def test_invalid_addresses_are_rejected_before_queueing(self):
+        for data in [{}, {'email': 'not-an-email'}, {'email': ['user@example.com']},
+                     {'email': 'a' * 250 + '@example.com'}]:
+            response = self.client.post(self.url, data, format='json')
+            self.assertEqual(response.status_code, 400, data)
+            self.assertIn('email', response.data)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_worker_sends_known_addresses_and_skips_others(self):
+        self.client.post(self.url, {'email': 'user@example.com'})
+        self.client.post(self.url, {'email': 'nobody@example.com'})
+        call_command('process_email_outbox', stdout=io.StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+        token = mail.outbox[0].body.rstrip('/').rsplit('/', 1)[-1]
+        self.assertTrue(outbox.password_reset_token_generator.check_token(self.user, token))
+        self.assertEqual(
+            dict(OutboundEmail.objects.values_list('to', 'status')),
+            {'user@example.com': 'sent', 'nobody@example.com': 'skipped'},
+        )
+
+    def test_failures_back_off_then_give_up(self):
+        email = outbox.enqueue('password_reset', 'user@example.com')
+        with override_settings(EMAIL_BACKEND='users.tests.FailingEmailBackend', EMAIL_OUTBOX_MAX_ATTEMPTS=2):
+            self.assertEqual(outbox.process_batch(), 1)
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            self.assertGreater(email.next_attempt_at, timezone.now())
+            self.assertIn('SMTP down', email.last_error)
+
+            self.assertEqual(outbox.process_batch(), 0)
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            outbox.process_batch()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', 2))
+
+    def test_batch_reuses_one_connection(self):
+        for i in range(3):
+            User.objects.create(email=f'user{i}@example.com')
+            outbox.enqueue('password_reset', f'user{i}@example.com')
+        CountingEmailBackend.opened = 0
+        with override_settings(EMAIL_BACKEND='users.tests.CountingEmailBackend'):
+            self.assertEqual(outbox.process_batch(), 3)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_unreachable_server_backs_off_every_claimed_email(self):
+        emails = [outbox.enqueue('password_reset', 'user@example.com') for _ in range(2)]
+        with override_settings(EMAIL_BACKEND='users.tests.UnreachableEmailBackend', EMAIL_OUTBOX_MAX_ATTEMPTS=2):
+            self.assertEqual(outbox.process_batch(), 2)
+            for email in emails:
+                email.refresh_from_db()
+                self.assertEqual((email.status, email.attempts), ('pending', 1))
+                self.assertGreater(email.next_attempt_at, timezone.now())
+                self.assertIn('Connection refused', email.last_error)
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(outbox.process_batch(), 2)
+        self.assertEqual(set(OutboundEmail.objects.values_list('status', 'attempts')), {('failed', 2)})
+
+
+class FailingEmailBackend(locmem.EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionError('SMTP down')
+
+
+class UnreachableEmailBackend(locmem.EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError('Connection refused')
+
+
+class CountingEmailBackend(locmem.EmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return True
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class TokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        principal_cache.clear_local()
+        account = get_user_model().objects.create_user(username='pro@example.com', password='s3cret-pass')
+        self.user = User.objects.create(id=account.id, email='pro@example.com')
+        response = self.client.post(
+            reverse('users:user-login'), {'username': 'pro@example.com', 'password': 's3cret-pass'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['id'], self.user.id)
+        self.token = response.data['token']
+        self.url = reverse('users:notification-unread-count')
+
+    def get(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        return client.get(self.url)
+
+    def test_warm_principal_costs_no_queries(self):
+        with self.assertNumQueries(3):
+            self.assertEqual(self.get().status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_shared_cache_serves_other_processes(self):
+        self.get()
+        principal_cache.clear_local()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_logout_revokes_token(self):
+        self.get()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.assertEqual(client.post(reverse('users:user-logout')).status_code, 200)
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_unknown_token_is_rejected(self):
+        self.token = 'not-a-token'
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_account_changes_revoke_the_principal(self):
+        account = get_user_model().objects.get(pk=self.user.pk)
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Renamed'
+            self.user.save()
+        self.assertEqual(principal_cache.get(self.token), None)
+        self.get()
+        self.assertEqual(principal_cache.get(self.token).first_name, 'Renamed')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            account.is_active = False
+            account.save()
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_deleted_profile_stops_authenticating(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.get().status_code, 401)
+
+    def test_revocation_reaches_other_processes_within_the_local_ttl(self):
+        self.get()
+        other = authentication.PrincipalCache(maxsize=10, local_ttl=30, shared_ttl=300)
+        self.assertEqual(other.get(self.token), self.user)
+        principal_cache.revoke(self.token)
+        self.assertIsNone(principal_cache.get(self.token))
+        self.assertEqual(other.get(self.token), self.user)
+        with mock.patch('users.authentication.time.monotonic', return_value=time.monotonic() + 31):
+            self.assertIsNone(other.get(self.token))
+
+    def test_revocation_leaves_other_principals_cached(self):
+        self.get()
+        other_key = Token.objects.create(user=get_user_model().objects.create_user(username='other')).key
+        principal_cache.revoke(other_key)
+        with mock.patch.object(cache, 'get', side_effect=AssertionError('shared cache read')):
+            self.assertEqual(principal_cache.get(self.token), self.user)
+
+    def test_lookup_racing_a_revocation_cannot_cache_the_old_principal(self):
+        started = time.time_ns()
+        principal_cache.revoke(self.token)
+        principal_cache.set(self.token, self.user, started)
+        self.assertIsNone(principal_cache.get(self.token))
+        self.get()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get().status_code, 200)
+
+    def test_imported_provider_updates_revoke_the_principal(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest.ingest('providers', [{'email': 'pro@example.com', 'profession': 'Plumber'}], convert_clients=True)
+        self.assertIsNone(principal_cache.get(self.token))
+        self.get()
+        self.assertEqual(principal_cache.get(self.token).user_type, 'service_provider')
+
+
+def throttle_rates(**rates):
+    return override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {scope.replace('_', '-'): rate for scope, rate in rates.items()},
+    })
+
+
+class ThrottleTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = 6000.0
+        clock = mock.patch.object(throttling.WindowRateThrottle, 'timer', mock.Mock(side_effect=lambda: self.now))
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def login(self, username, address='10.0.0.1'):
+        return self.client.post(
+            reverse('users:user-login'), {'username': username, 'password': 'wrong'}, REMOTE_ADDR=address
+        )
+
+    @throttle_rates(login_account='3/min')
+    def test_each_account_has_its_own_budget(self):
+        for i in range(3):
+            self.assertEqual(self.login('victim@example.com', f'10.0.0.{i}').status_code, 400)
+        response = self.login('Victim@example.com ', '10.0.0.9')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '90')
+        self.assertEqual(self.login('other@example.com').status_code, 400)
+
+    @throttle_rates(password_reset_ip='2/min')
+    def test_window_slides(self):
+        def reset():
+            return self.client.post(reverse('users:password-reset'), {'email': 'a@example.com'}).status_code
+
+        self.assertEqual([reset(), reset(), reset()], [200, 200, 429])
+        self.now += 100
+        self.assertEqual(reset(), 200)
+        self.now += 120
+        self.assertEqual([reset(), reset(), reset()], [200, 200, 429])
+
+    @throttle_rates(register_endpoint='2/min')
+    def test_endpoint_limit_covers_every_client(self):
+        codes = [
+            self.client.post(reverse('users:user-register'), {}, REMOTE_ADDR=f'10.0.0.{i}').status_code
+            for i in range(3)
+        ]
+        self.assertEqual(codes, [400, 400, 429])
+        self.assertEqual(self.login('user@example.com').status_code, 400)
+
+    @throttle_rates(search_by_email_ip='1/min')
+    def test_rejected_before_authentication(self):
+        account = get_user_model().objects.create_user(username='viewer@example.com')
+        User.objects.create(id=account.id, email='viewer@example.com')
+        url = reverse('users:user-search-by-email')
+        self.assertEqual(self.client.get(url, {'email': 'viewer@example.com'}).status_code, 401)
+        principal_cache.clear_local()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=account).key}')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, {'email': 'viewer@example.com'}).status_code, 429)
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        staff = get_user_model().objects.create(username='analyst', is_staff=True)
+        self.client.force_authenticate(staff)
+        self.users = [User.objects.create(email=f'user{i}@example.com') for i in range(5)]
+
+    def fetch(self, name, **params):
+        response = self.client.get(reverse('users:export', args=[name]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_streams_every_row(self):
+        lines = [json.loads(line) for line in self.fetch('users').splitlines()]
+        self.assertEqual([row['id'] for row in lines], [user.id for user in self.users])
+        self.assertEqual(lines[0]['email'], 'user0@example.com')
+
+    @override_settings(EXPORT_WATERMARK_LAG=0)
+    def test_watermark_ships_only_changed_rows(self):
+        last = json.loads(self.fetch('users').splitlines()[-1])
+        changed = self.users[1]
+        changed.first_name = 'Changed'
+        changed.save()
+        lines = self.fetch('users', since=last['updated_at'], after=last['id']).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [changed.id])
+
+    def test_rows_committed_after_the_watermark_passed_them_are_shipped(self):
+        last = json.loads(self.fetch('users').splitlines()[-1])
+        late = User.objects.create(email='late@example.com')
+        User.objects.filter(pk=late.pk).update(updated_at=parse_datetime(last['updated_at']) - timedelta(seconds=1))
+        lines = self.fetch('users', since=last['updated_at'], after=last['id']).splitlines()
+        self.assertIn(late.id, [json.loads(line)['id'] for line in lines])
+        with self.settings(EXPORT_WATERMARK_LAG=0):
+            lines = self.fetch('users', since=last['updated_at'], after=last['id']).splitlines()
+        self.assertEqual(lines, [])
+
+    def test_csv_has_header_and_typed_values(self):
+        create_services(1)
+        rows = list(csv.reader(io.StringIO(self.fetch('services', output='csv'))))
+        self.assertEqual(rows[0], export.EXPORTS['services'][1])
+        self.assertEqual(rows[1][rows[0].index('price')], '25.00')
+
+    def test_rows_come_from_a_chunked_iterator(self):
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(export.stream('users', chunk_size=2))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(queries), 1)
+
+    def test_rejects_bad_requests(self):
+        url = reverse('users:export', args=['users'])
+        self.assertEqual(self.client.get(url, {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('users:export', args=['secrets'])).status_code, 404)
+        self.client.force_authenticate(self.users[0])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_command_writes_file(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'users.csv')
+        call_command('export_data', 'users', '--output', 'csv', '--file', path)
+        with open(path, newline='') as handle:
+            self.assertEqual(len(list(csv.reader(handle))), len(self.users) + 1)
+
+
+class IngestTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        staff = get_user_model().objects.create(username='importer', is_staff=True)
+        self.client.force_authenticate(staff)
+
+    def post(self, kind, body, content_type='application/x-ndjson'):
+        return self.client.generic('POST', reverse('users:import', args=[kind]), body, content_type)
+
+    def ndjson(self, rows):
+        return '\n'.join(json.dumps(row) for row in rows)
+
+    def test_providers_are_upserted_by_email(self):
+        create_provider('known@example.com', profession='Painter')
+        body = (
+            'email,first_name,profession,experience,latitude,longitude\n'
+            'known@example.com,Amel,Plumber,4,36.8,10.18\n'
+            'new@example.com,Sami,Electrician,2,,\n'
+        )
+        response = self.post('providers', body, 'text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'created': 1, 'updated': 1, 'errors': []})
+        known = ServiceProviderProfile.objects.get(user__email='known@example.com')
+        self.assertEqual((known.profession, known.experience, known.user.first_name), ('Plumber', 4, 'Amel'))
+        self.assertEqual(known.geohash, geo.encode(36.8, 10.18))
+        self.assertEqual(User.objects.get(email='new@example.com').user_type, 'service_provider')
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        rows = [
+            {'email': 'ok@example.com', 'profession': 'Plumber'},
+            {'email': 'not-an-email', 'profession': 'Plumber', 'experience': '-1'},
+            {'email': 'ok@example.com', 'profession': 'Mason'},
+            {'email': 'geo@example.com', 'profession': 'Mason', 'latitude': '91'},
+        ]
+        report = self.post('providers', self.ndjson(rows)).data
+        self.assertEqual(report['created'], 1)
+        self.assertEqual([error['row'] for error in report['errors']], [2, 3, 4])
+        self.assertEqual(set(report['errors'][0]['errors']), {'email', 'experience'})
+        self.assertEqual(list(report['errors'][2]['errors']), ['latitude'])
+
+    def test_client_accounts_are_converted_only_on_request(self):
+        client = User.objects.create(email='client@example.com')
+        body = self.ndjson([{'email': 'client@example.com', 'profession': 'Plumber'}])
+        report = self.post('providers', body).data
+        self.assertEqual((report['created'], report['updated']), (0, 0))
+        self.assertEqual([(error['row'], list(error['errors'])) for error in report['errors']], [(1, ['email'])])
+        client.refresh_from_db()
+        self.assertEqual(client.user_type, 'client')
+
+        response = self.client.generic(
+            'POST', reverse('users:import', args=['providers']) + '?convert_clients=true', body,
+            'application/x-ndjson',
+        )
+        self.assertEqual(response.data, {'created': 0, 'updated': 1, 'errors': []})
+        client.refresh_from_db()
+        self.assertEqual(client.user_type, 'service_provider')
+
+    def test_services_link_providers_and_are_searchable(self):
+        create_provider('pro@example.com')
+        rows = [
+            {'provider_email': 'pro@example.com', 'category': 'Gardening', 'title': 'Hedge trimming',
+             'description': 'Tidy hedges', 'price': '40.5', 'latitude': 36.8, 'longitude': 10.18},
+            {'provider_email': 'ghost@example.com', 'category': 'Gardening', 'title': 'Lawn',
+             'description': 'Mow', 'price': '10'},
+            {'provider_email': 'pro@example.com', 'category': 'Gardening', 'title': 'Lawn',
+             'description': 'Mow', 'price': '1.005'},
+        ]
+        report = self.post('services', self.ndjson(rows)).data
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(
+            [(error['row'], list(error['errors'])) for error in report['errors']],
+            [(2, ['provider_email']), (3, ['price'])],
+        )
+        service = Service.objects.get()
+        self.assertEqual((service.category.name, service.price), ('Gardening', Decimal('40.50')))
+        self.assertEqual(service.geohash, geo.encode(36.8, 10.18))
+        results = self.client.get(reverse('users:service-search'), {'search': 'hedg'}).data['results']
+        self.assertEqual([row['id'] for row in results], [service.id])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        create_provider('pro@example.com')
+
+        def run(count):
+            rows = [
+                {'provider_email': 'pro@example.com', 'category': f'Category {count}-{i % 3}', 'title': f'Job {i}',
+                 'description': 'Work', 'price': '10'}
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                report = ingest.ingest('services', rows)
+            self.assertEqual(report['created'], count)
+            return len(queries)
+
+        self.assertEqual(run(5), run(50))
+
+    def test_chunks_commit_independently(self):
+        rows = [{'email': f'bulk{i}@example.com', 'profession': 'Plumber'} for i in range(5)]
+        report = ingest.ingest('providers', rows, chunk_size=2)
+        self.assertEqual(report, {'created': 5, 'updated': 0, 'errors': []})
+        self.assertEqual(ServiceProviderProfile.objects.count(), 5)
+
+    def test_malformed_lines_are_reported_after_earlier_chunks_commit(self):
+        body = '\n'.join([
+            json.dumps({'email': 'first@example.com', 'profession': 'Plumber'}),
+            json.dumps({'email': 'second@example.com', 'profession': 'Plumber'}),
+            '',
+            '{bad',
+            '[1, 2]',
+            json.dumps({'email': 'last@example.com', 'profession': 'Plumber'}),
+        ])
+        report = ingest.ingest_text('providers', body, 'ndjson', chunk_size=2)
+        self.assertEqual(report['created'], 3)
+        self.assertEqual([(error['row'], list(error['errors'])) for error in report['errors']],
+                         [(3, ['line']), (4, ['line'])])
+        self.assertIn('Line 4 is not valid JSON', report['errors'][0]['errors']['line'])
+        self.assertEqual(report['errors'][1]['errors']['line'], 'Line 5 is not a JSON object.')
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.post('providers', b'\xff').status_code, 400)
+        self.assertEqual(self.post('secrets', '').status_code, 404)
+        self.client.force_authenticate(User.objects.create(email='plain@example.com'))
+        self.assertEqual(self.post('providers', '').status_code, 403)
+
+    def test_benchmark_meets_the_throughput_target(self):
+        out = io.StringIO()
+        call_command('benchmark_import', rows=2000, chunk_size=500, stdout=out)
+        self.assertIn('providers', out.getvalue())
+        self.assertEqual(Service.objects.count(), 2000)
+        with self.assertRaises(CommandError):
+            call_command('benchmark_import', rows=10, min_rows_per_minute=10 ** 12, stdout=out)
+
+    def test_command_reads_file(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'providers.csv')
+        with open(path, 'w', newline='') as handle:
+            handle.write('email,profession\nfile@example.com,Plumber\n')
+        out = io.StringIO()
+        call_command('import_data', 'providers', path, stdout=out)
+        self.assertIn('1 created', out.getvalue())
+        self.assertTrue(User.objects.filter(email='file@example.com').exists())
+
+
+class BookingAvailabilityTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = create_services(1)[0]
+        self.provider = self.service.service_provider
+        self.client_user = User.objects.create(email='client@example.com')
+        self.start = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        self.slots = availability.publish(self.provider, [
+            (self.start + timedelta(hours=i), self.start + timedelta(hours=i, minutes=30)) for i in range(3)
+        ])
+
+    def week(self):
+        year, week, _ = self.start.isocalendar()
+        return f'{year}-W{week:02d}'
+
+    def reserve(self, slot, service=None):
+        self.client.force_authenticate(self.client_user)
+        return self.client.post(reverse('users:booking-list'), {'slot': slot.pk, 'service': (service or self.service).pk})
+
+    def test_week_lists_only_free_slots(self):
+        self.assertEqual(self.reserve(self.slots[0]).status_code, 201)
+        url = reverse('users:provider-availability', args=[self.provider.pk])
+        response = self.client.get(url, {'week': self.week()})
+        self.assertEqual([slot['id'] for slot in response.data['results']], [slot.pk for slot in self.slots[1:]])
+        self.assertEqual(self.client.get(url, {'week': 'soon'}).status_code, 400)
+
+    def test_week_query_is_a_bounded_index_range(self):
+        start, end = availability.parse_week(self.week())
+        sql = str(availability.overlapping(self.provider.pk, start, end).query)
+        self.assertIn('"starts_at" >', sql)
+        self.assertIn('"starts_at" <', sql)
+
+    def test_slot_is_booked_once(self):
+        response = self.reserve(self.slots[0])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['service_provider'], self.provider.pk)
+        self.assertEqual(self.reserve(self.slots[0]).status_code, 409)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(AvailabilitySlot.objects.get(pk=self.slots[0].pk).booking_id, response.data['id'])
+
+    def test_stale_read_cannot_double_book(self):
+        slot = AvailabilitySlot.objects.get(pk=self.slots[1].pk)
+        availability.reserve(User.objects.create(email='first@example.com'), slot, self.service)
+        with self.assertRaises(availability.SlotUnavailable):
+            availability.reserve(self.client_user, slot, self.service)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_cancelling_frees_the_slot(self):
+        booking_id = self.reserve(self.slots[0]).data['id']
+        self.assertEqual(self.client.delete(reverse('users:booking-detail', args=[booking_id])).status_code, 204)
+        self.assertEqual(self.reserve(self.slots[0]).status_code, 201)
+
+    def test_service_must_belong_to_slot_provider(self):
+        other = create_services(1, title='Other')[0]
+        self.assertEqual(self.reserve(self.slots[0], service=other).status_code, 400)
+
+    def test_provider_publishes_non_overlapping_slots(self):
+        url = reverse('users:provider-availability', args=[self.provider.pk])
+        late = self.start + timedelta(days=1)
+        payload = {'slots': [{'starts_at': late.isoformat(), 'ends_at': (late + timedelta(hours=1)).isoformat()}]}
+        self.client.force_authenticate(self.client_user)
+        self.assertEqual(self.client.post(url, payload, format='json').status_code, 403)
+        self.client.force_authenticate(self.provider.user)
+        self.assertEqual(self.client.post(url, payload, format='json').status_code, 201)
+        self.assertEqual(self.client.post(url, payload, format='json').status_code, 400)
+
+    def test_bookings_are_listed_for_both_parties(self):
+        self.reserve(self.slots[0])
+        self.assertEqual(len(self.client.get(reverse('users:booking-list')).data['results']), 1)
+        self.client.force_authenticate(self.provider.user)
+        self.assertEqual(len(self.client.get(reverse('users:booking-list')).data['results']), 1)
+        self.client.force_authenticate(User.objects.create(email='stranger@example.com'))
+        self.assertEqual(self.client.get(reverse('users:booking-list')).data['results'], [])
+
+
+@override_settings(RATING_PRIOR_MEAN=3.0, RATING_PRIOR_WEIGHT=5)
+class ReviewRatingTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.service = create_services(1)[0]
+        self.provider = self.service.service_provider
+        self.authors = [User.objects.create(email=f'reviewer{i}@example.com') for i in range(3)]
+
+    def review(self, author, score):
+        return Review.objects.create(service_provider=self.provider, author=author, score=score)
+
+    def assertRating(self, count, total):
+        self.provider.refresh_from_db()
+        self.service.refresh_from_db()
+        expected = (3.0 * 5 + total) / (5 + count)
+        self.assertEqual((self.provider.review_count, self.provider.rating_sum), (count, total))
+        self.assertAlmostEqual(self.provider.rating, expected)
+        self.assertAlmostEqual(self.service.rating, expected)
+
+    def test_aggregates_follow_create_update_and_delete(self):
+        self.assertRating(0, 0)
+        first = self.review(self.authors[0], 5)
+        self.review(self.authors[1], 4)
+        self.assertRating(2, 9)
+        first.score = 1
+        first.save()
+        self.assertRating(2, 5)
+        first.delete()
+        self.assertRating(1, 4)
+
+    def test_review_costs_constant_queries(self):
+        self.review(self.authors[0], 5)
+        with CaptureQueriesContext(connection) as first:
+            self.review(self.authors[1], 4)
+        with CaptureQueriesContext(connection) as later:
+            self.review(self.authors[2], 3)
+        self.assertEqual(len(first), len(later))
+        self.assertFalse(any('COUNT(' in query['sql'] or 'SUM(' in query['sql'] for query in later))
+
+    def test_new_service_inherits_provider_rating(self):
+        self.review(self.authors[0], 5)
+        self.provider.refresh_from_db()
+        service = create_services(1, provider=self.provider, title='Drain unblocking')[0]
+        self.assertAlmostEqual(service.rating, self.provider.rating)
+
+    def test_search_orders_by_rating(self):
+        other = create_services(1)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(service_provider=other.service_provider, author=self.authors[0], score=5)
+        url = reverse('users:service-search')
+        results = self.client.get(url, {'ordering': '-rating'}).data['results']
+        self.assertEqual([row['id'] for row in results], [other.id, self.service.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            for author in self.authors:
+                self.review(author, 5)
+        results = self.client.get(url, {'ordering': '-rating'}).data['results']
+        self.assertEqual([row['id'] for row in results], [self.service.id, other.id])
+
+    def test_api_creates_one_review_per_author(self):
+        self.client.force_authenticate(self.authors[0])
+        url = reverse('users:review-list')
+        payload = {'service_provider': self.provider.pk, 'score': 4}
+        self.assertEqual(self.client.post(url, payload).status_code, 201)
+        self.assertEqual(self.client.post(url, payload).status_code, 400)
+        self.assertEqual(self.client.post(url, {**payload, 'score': 6}).status_code, 400)
+        self.client.force_authenticate(self.provider.user)
+        self.assertEqual(self.client.post(url, payload).status_code, 400)
+        self.assertRating(1, 4)
+
+    def test_only_author_edits_review(self):
+        review = self.review(self.authors[0], 2)
+        url = reverse('users:review-detail', args=[review.pk])
+        self.client.force_authenticate(self.authors[1])
+        self.assertEqual(self.client.patch(url, {'score': 5}).status_code, 404)
+        self.client.force_authenticate(self.authors[0])
+        self.assertEqual(self.client.patch(url, {'score': 5}).status_code, 200)
+        self.assertRating(1, 5)
+
+
+class ConversationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.me = User.objects.create(email='me@example.com')
+        self.friends = [User.objects.create(email=f'friend{i}@example.com') for i in range(3)]
+        self.client.force_authenticate(self.me)
+
+    def send(self, sender, receiver, content='hello'):
+        return Message.objects.create(sender=sender, receiver=receiver, content=content)
+
+    def inbox(self):
+        return self.client.get(reverse('users:conversation-list')).data['results']
+
+    def test_pair_shares_one_conversation(self):
+        first = self.send(self.me, self.friends[0])
+        reply = self.send(self.friends[0], self.me)
+        self.assertEqual(first.conversation_id, reply.conversation_id)
+        self.assertEqual(Conversation.objects.count(), 1)
+        self.assertEqual(Conversation.objects.get().last_message_id, reply.id)
+
+    def test_inbox_lists_latest_activity_with_previews(self):
+        self.send(self.friends[0], self.me, 'old news')
+        self.send(self.friends[1], self.me, 'x' * 500)
+        self.send(self.friends[1], self.me, 'second')
+        self.send(self.me, self.friends[2], 'my question')
+        self.send(self.friends[0], self.me, 'latest')
+
+        # The ETag validators, then the page.
+        with self.assertNumQueries(2):
+            rows = self.inbox()
+        self.assertEqual([row['peer']['id'] for row in rows], [self.friends[0].pk, self.friends[2].pk, self.friends[1].pk])
+        self.assertEqual([row['unread_count'] for row in rows], [2, 0, 2])
+        self.assertEqual(rows[0]['last_message']['content'], 'latest')
+        self.assertEqual(rows[2]['last_message']['content'], 'second')
+
+    def test_inbox_query_count_is_constant(self):
+        self.send(self.friends[0], self.me)
+        with CaptureQueriesContext(connection) as small:
+            self.inbox()
+        for friend in self.friends:
+            for _ in range(3):
+                self.send(friend, self.me)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(len(self.inbox()), 3)
+        self.assertEqual(len(small), len(large))
+
+    def test_read_cursor_recounts_unread(self):
+        messages = [self.send(self.friends[0], self.me, f'm{i}') for i in range(4)]
+        url = reverse('users:conversation-read', args=[messages[0].conversation_id])
+
+        response = self.client.post(url, {'message': messages[1].pk})
+        self.assertEqual(response.data, {'last_read_message': messages[1].pk, 'unread_count': 2})
+        response = self.client.post(url, {'message': messages[0].pk})
+        self.assertEqual(response.data['unread_count'], 2)
+        self.assertEqual(self.client.post(url).data['unread_count'], 0)
+        self.assertEqual(self.inbox()[0]['unread_count'], 0)
+
+        other = self.send(self.friends[1], self.me)
+        self.assertEqual(self.client.post(url, {'message': other.pk}).status_code, 400)
+
+    def test_replying_clears_own_unread(self):
+        self.send(self.friends[0], self.me)
+        reply = self.send(self.me, self.friends[0])
+        row = self.inbox()[0]
+        self.assertEqual((row['unread_count'], row['last_read_message']), (0, reply.pk))
+
+    def test_thread_history_is_keyset_paginated(self):
+        pair = (self.me, self.friends[0])
+        messages = [self.send(pair[i % 2], pair[1 - i % 2], f'm{i}') for i in range(5)]
+        url = reverse('users:conversation-messages', args=[messages[0].conversation_id])
+        seen, params = [], {'page_size': 2}
+        while url:
+            data = self.client.get(url, params).data
+            seen += [row['id'] for row in data['results']]
+            url, params = data['next'], None
+        self.assertEqual(seen, [message.pk for message in reversed(messages)])
+
+    def test_conversation_is_private_to_members(self):
+        message = self.send(self.friends[0], self.friends[1])
+        self.assertEqual(self.inbox(), [])
+        url = reverse('users:conversation-messages', args=[message.conversation_id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(PERF_SERVER_TIMING=True, PERF_SLOW_QUERY_MS=200)
+class PerformanceMiddlewareTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.clear()
+        self.addCleanup(metrics.clear)
+        create_services(2)
+
+    def samples(self, histogram, view):
+        counts, total = histogram.samples(view)
+        return sum(counts), total
+
+    def test_records_view_labelled_histograms(self):
+        response = self.client.get(reverse('users:service-search'))
+        self.assertEqual(response.status_code, 200)
+        view = 'ServiceSearchView'
+        self.assertEqual(self.samples(metrics.db_queries, view), (1, 1))
+        self.assertEqual(self.samples(metrics.response_bytes, view), (1, len(response.content)))
+        self.assertGreater(self.samples(metrics.request_duration, view)[1], 0)
+        self.assertGreater(self.samples(metrics.render_duration, view)[1], 0)
+
+    def test_viewset_actions_are_labelled(self):
+        user = User.objects.create(email='viewer@example.com')
+        self.client.force_authenticate(user)
+        self.client.get(reverse('users:user-list'))
+        self.client.get(reverse('users:user-get-clients'))
+        self.assertEqual(self.samples(metrics.request_duration, 'UserViewSet.list')[0], 1)
+        self.assertEqual(self.samples(metrics.request_duration, 'UserViewSet.get_clients')[0], 1)
+
+    def test_server_timing_header(self):
+        header = self.client.get(reverse('users:service-search'))['Server-Timing']
+        self.assertRegex(header, r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="1 queries", render;dur=[\d.]+$')
+        with self.settings(PERF_SERVER_TIMING=False):
+            self.assertNotIn('Server-Timing', self.client.get(reverse('users:service-search')))
+
+    def test_slow_queries_are_logged_with_origin(self):
+        self.client.force_authenticate(User.objects.create(email='viewer@example.com'))
+        with self.settings(PERF_SLOW_QUERY_MS=0), self.assertLogs('users.performance', 'WARNING') as logs:
+            self.client.get(reverse('users:service-search'))
+        self.assertIn('from users/pagination.py:', logs.output[0])
+
+    def test_metrics_endpoint_renders_prometheus_text(self):
+        self.client.get(reverse('users:service-search'))
+        self.client.force_authenticate(get_user_model().objects.create(username='ops', is_staff=True))
+        response = self.client.get(reverse('users:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE profinder_request_duration_seconds histogram', body)
+        self.assertIn('profinder_db_queries_bucket{view="ServiceSearchView",le="1"} 1', body)
+        self.assertIn('profinder_db_queries_bucket{view="ServiceSearchView",le="+Inf"} 1', body)
+        self.client.force_authenticate(User.objects.create(email='plain@example.com'))
+        self.assertEqual(self.client.get(reverse('users:metrics')).status_code, 403)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test.', (0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe('v', value)
+        self.assertEqual(histogram.render().splitlines()[2:], [
+            'test_seconds_bucket{view="v",le="0.1"} 2',
+            'test_seconds_bucket{view="v",le="1"} 3',
+            'test_seconds_bucket{view="v",le="+Inf"} 4',
+            'test_seconds_sum{view="v"} 3.65',
+            'test_seconds_count{view="v"} 4',
+        ])
+
+    def test_metrics_are_summed_across_workers_sharing_a_directory(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        counts = [0] * (len(metrics.COUNT_BUCKETS) + 1)
+        counts[1] = 3
+        with open(os.path.join(directory, '1-worker.json'), 'w') as other:
+            json.dump({metrics.db_queries.name: {'ServiceSearchView': [counts, 3]}}, other)
+        with self.settings(METRICS_DIR=directory):
+            self.client.get(reverse('users:service-search'))
+            self.assertEqual(len(os.listdir(directory)), 2)
+            body = metrics.render()
+        self.assertIn('profinder_db_queries_bucket{view="ServiceSearchView",le="1"} 4', body)
+        self.assertIn('profinder_db_queries_sum{view="ServiceSearchView"} 4', body)
+        self.assertNotIn('profinder_db_queries_sum{view="ServiceSearchView"} 4', metrics.render())
+
+
+class BenchmarkTests(APITestCase):
+    volumes = {'users': 30, 'providers': 5, 'services': 12, 'messages': 60, 'notifications': 40, 'accounts': 1}
+
+    def setUp(self):
+        super().setUp()
+        benchmark.Seeder(self.volumes, batch_size=7).run()
+
+    def test_seeded_data_is_consistent(self):
+        self.assertEqual(Service.objects.count(), 12)
+        self.assertFalse(ServiceProviderProfile.objects.filter(services__isnull=True).exists())
+        self.assertEqual(len(self.client.get(reverse('users:service-search'), {'search': 'service'}).data['results']), 12)
+        self.assertEqual(ServiceSearchDocument.objects.count(), 12)
+        self.assertEqual(len(self.client.get(reverse('users:service-search-cards')).data['results']), 12)
+        for conversation in Conversation.objects.all():
+            self.assertEqual(conversation.last_message_id, conversation.messages.order_by('-id').first().pk)
+        for member in ConversationMember.objects.all():
+            unread = member.conversation.messages.filter(
+                receiver_id=member.user_id, id__gt=member.last_read_message_id or 0
+            ).count()
+            self.assertEqual(member.unread_count, unread)
+        for counter in NotificationCounter.objects.all():
+            self.assertEqual(counter.unread, Notification.objects.filter(user_id=counter.user_id, read=False).count())
+        with self.assertRaises(ValueError):
+            benchmark.Seeder(self.volumes).run()
+
+    def test_scenarios_run_without_errors(self):
+        context = benchmark.Context()
+        self.assertEqual(len(context.tokens), 1)
+        with self.settings(PERF_SERVER_TIMING=True):
+            results = {
+                name: benchmark.run_scenario(name, benchmark.ClientDriver, context, 3, warmup=1)
+                for name in benchmark.SCENARIOS
+            }
+        for name, result in results.items():
+            self.assertEqual((result['requests'], result['errors']), (3, 0), name)
+        self.assertEqual(results['inbox']['queries'], 2)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'inbox': {'p50_ms': 2.0, 'p95_ms': 4.0, 'p99_ms': 6.0, 'throughput': 400, 'queries': 1, 'errors': 0}}
+        self.assertEqual(benchmark.compare({'inbox': {**baseline['inbox'], 'p50_ms': 2.4}}, baseline, 0.25), [])
+        regressions = benchmark.compare(
+            {'inbox': {**baseline['inbox'], 'p95_ms': 6.0, 'throughput': 200, 'queries': 2, 'errors': 1},
+             'login': baseline['inbox']},
+            baseline, 0.25,
+        )
+        self.assertEqual([regression.split(' ')[1] for regression in regressions],
+                         ['p95_ms', 'throughput', 'queries', '1'])
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(
+            [benchmark.percentile(values, f) for f in (0.5, 0.95, 0.99)], [50, 95, 99]
+        )
+        self.assertEqual(benchmark.percentile([], 0.5), 0.0)
+
+
+def asgi_urlconf():
+    """
+    The app's URLconf as the ASGI entry point builds it, with coroutine views.
+    """
+    with override_settings(ASYNC_VIEWS=True):
+        patterns = runpy.run_module('users.urls')['urlpatterns']
+    urlconf = types.ModuleType('asgi_urls')
+    urlconf.urlpatterns = [path('', include((patterns, 'users')))]
+    return urlconf
+
+
+WSGI_URLCONF = settings.ROOT_URLCONF
+
+
+@override_settings(ROOT_URLCONF=asgi_urlconf())
+class AsyncViewTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        principal_cache.clear_local()
+        account = get_user_model().objects.create_user(username='reader@example.com')
+        self.user = User.objects.create(id=account.id, email='reader@example.com')
+        self.token = Token.objects.create(user=account).key
+        other = User.objects.create(email='sender@example.com')
+        for i in range(5):
+            Message.objects.create(sender=other, receiver=self.user, content=f'm{i}')
+            Notification.objects.create(user=self.user, message=f'n{i}')
+        create_services(3)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+    def aget(self, url, params=None, token=None, headers=None):
+        headers = {'Authorization': f'Token {token or self.token}', **(headers or {})}
+        return AsyncClient().get(url, params, headers=headers)
+
+    def sync_get(self, url, params=None):
+        with override_settings(ROOT_URLCONF=WSGI_URLCONF):
+            return self.client.get(url, params)
+
+    def test_hot_list_views_are_coroutines_under_asgi_only(self):
+        def views():
+            return [
+                MessageViewSet.as_view({'get': 'list'}), NotificationViewSet.as_view({'get': 'list'}),
+                ServiceSearchView.as_view(),
+            ]
+        self.assertFalse(any(iscoroutinefunction(view) for view in views()))
+        with override_settings(ASYNC_VIEWS=True):
+            self.assertTrue(all(iscoroutinefunction(view) for view in views()))
+
+    def test_wsgi_requests_never_start_an_event_loop(self):
+        with mock.patch.object(AsyncAPIViewMixin, 'adispatch') as adispatch:
+            for name in ['message-list', 'notification-list', 'service-search']:
+                self.assertEqual(self.sync_get(reverse(f'users:{name}')).status_code, 200)
+        adispatch.assert_not_called()
+
+    async def test_slow_queries_awaited_by_a_coroutine_are_logged_with_origin(self):
+        with self.settings(PERF_SLOW_QUERY_MS=0), self.assertLogs('users.performance', 'WARNING') as logs:
+            await self.aget(reverse('users:message-list'))
+        self.assertNotIn('from unknown', '\n'.join(logs.output))
+        self.assertIn('from users/conditional.py:', logs.output[-2])
+        self.assertIn('from users/pagination.py:', logs.output[-1])
+
+    async def test_routes_without_a_twin_run_in_a_thread(self):
+        notification = await Notification.objects.filter(user=self.user).afirst()
+        response = await self.aget(reverse('users:notification-detail', args=[notification.pk]))
+        self.assertEqual((response.status_code, response.json()['id']), (200, notification.pk))
+
+    async def test_async_pages_match_sync_pages(self):
+        for url, params in [
+            (reverse('users:message-list'), {'page_size': 2}),
+            (reverse('users:notification-list'), {'page_size': 2}),
+            (reverse('users:service-search'), {'q': 'pipe', 'page_size': 2}),
+        ]:
+            with self.subTest(url=url):
+                sync_response = await sync_to_async(self.sync_get)(url, params)
+                response = await self.aget(url, params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), sync_response.json())
+                following = await self.aget(response.json()['next'])
+                sync_following = await sync_to_async(self.sync_get)(response.json()['next'])
+                self.assertEqual(following.json(), sync_following.json())
+
+    async def test_cursors_walk_every_row(self):
+        ids, url = [], reverse('users:notification-list') + '?page_size=2'
+        while url:
+            page = (await self.aget(url)).json()
+            ids.extend(row['id'] for row in page['results'])
+            url = page['next']
+        notifications = Notification.objects.filter(user=self.user).order_by('-created_at', '-id')
+        expected = [pk async for pk in notifications.values_list('id', flat=True)]
+        self.assertEqual(ids, expected)
+
+    @override_settings(PERF_SERVER_TIMING=True)
+    async def test_warm_request_runs_validators_and_page_only(self):
+        await self.aget(reverse('users:message-list'))
+        response = await self.aget(reverse('users:message-list'))
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        response = await self.aget(reverse('users:message-list'), headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    async def test_unknown_token_is_rejected(self):
+        response = await self.aget(reverse('users:message-list'), token='not-a-token')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual((await AsyncClient().get(reverse('users:message-list'))).status_code, 401)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(email='user@example.com')
+        self.client.force_authenticate(self.user)
+        self.notifications = [Notification.objects.create(user=self.user, message=f'n{i}') for i in range(3)]
+
+    def etag(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assertNotModified(self, url, etag, **params):
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def assertModified(self, url, etag, **params):
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def age(self, model, pk, seconds=5):
+        model.objects.filter(pk=pk).update(updated_at=timezone.now() - timedelta(seconds=seconds))
+
+    def test_matching_etag_is_answered_before_serializing(self):
+        url = reverse('users:user-detail', args=[self.user.pk])
+        response = self.client.get(url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertIn('Authorization', response['Vary'])
+        with self.assertNumQueries(1), mock.patch.object(UserSerializer, 'to_representation') as render:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        render.assert_not_called()
+
+    def test_if_modified_since_is_honoured(self):
+        self.age(User, self.user.pk)
+        url = reverse('users:user-detail', args=[self.user.pk])
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        self.user.first_name = 'Edited'
+        self.user.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_last_modified_waits_for_its_second_to_pass(self):
+        # A second edit within the same second would not move the header.
+        url = reverse('users:user-detail', args=[self.user.pk])
+        with mock.patch('users.conditional.time.time', return_value=self.user.updated_at.timestamp()):
+            self.assertNotIn('Last-Modified', self.client.get(url))
+        self.age(User, self.user.pk)
+        self.assertIn('Last-Modified', self.client.get(url))
+
+    def test_lists_ignore_if_modified_since(self):
+        url = reverse('users:notification-list')
+        for notification in self.notifications:
+            self.age(Notification, notification.pk)
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        since = http_date(time.time())
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notifications[0].delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+        self.assertModified(url, response['ETag'])
+
+    def test_missing_object_is_still_not_found(self):
+        self.assertEqual(self.client.get(reverse('users:user-detail', args=[0])).status_code, 404)
+        url = reverse('users:notification-detail', args=[Notification.objects.create(
+            user=User.objects.create(email='other@example.com'), message='elsewhere').pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_list_etag_follows_updates_creates_and_deletes(self):
+        url = reverse('users:notification-list')
+        etag = self.etag(url)
+        self.assertNotModified(url, etag)
+        self.notifications[0].message = 'edited'
+        self.notifications[0].save()
+        self.assertModified(url, etag)
+        etag = self.etag(url)
+        Notification.objects.create(user=self.user, message='new')
+        self.assertModified(url, etag)
+        etag = self.etag(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.notifications[1].delete()
+        self.assertModified(url, etag)
+        etag = self.etag(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.filter(pk=self.notifications[2].pk).delete()
+        self.assertModified(url, etag)
+
+    def test_list_etag_follows_rows_leaving_the_filter(self):
+        clients = [User.objects.create(email=f'client{i}@example.com', user_type='client') for i in range(2)]
+        url = reverse('users:user-get-clients')
+        etag = self.etag(url)
+        User.objects.filter(pk=clients[1].pk).update(updated_at=timezone.now() + timedelta(seconds=5))
+        etag = self.etag(url)
+        clients[0].user_type = 'service_provider'
+        clients[0].save()
+        self.assertModified(url, etag)
+
+        url = reverse('users:user-list')
+        etag = self.etag(url, search='client1')
+        clients[1].email = 'renamed@example.com'
+        clients[1].save()
+        self.assertModified(url, etag, search='client1')
+
+    def test_etag_depends_on_query_and_user(self):
+        url = reverse('users:notification-list')
+        etag = self.etag(url)
+        self.assertModified(url, etag, page_size=1)
+        self.client.force_authenticate(User.objects.create(email='other@example.com'))
+        self.assertModified(url, etag)
+
+    def test_bulk_mark_read_invalidates(self):
+        url = reverse('users:notification-list')
+        etag = self.etag(url)
+        self.client.post(reverse('users:notification-mark-all-read'))
+        self.assertModified(url, etag)
+
+    def test_conversation_etag_follows_messages_and_read_cursor(self):
+        friend = User.objects.create(email='friend@example.com')
+        Message.objects.create(sender=friend, receiver=self.user, content='hello')
+        url = reverse('users:conversation-list')
+        etag = self.etag(url)
+        Message.objects.create(sender=friend, receiver=self.user, content='again')
+        self.assertModified(url, etag)
+        etag = self.etag(url)
+        ConversationMember.objects.get(user=self.user).mark_read()
+        self.assertModified(url, etag)
+        etag = self.etag(url)
+        friend.first_name = 'Renamed'
+        friend.save()
+        self.assertModified(url, etag)
+
+    def test_booking_etag_follows_nested_service_and_rating(self):
+        service = create_services(1)[0]
+        start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        slot = availability.publish(service.service_provider, [(start, start + timedelta(minutes=30))])[0]
+        availability.reserve(self.user, slot, service)
+        url = reverse('users:booking-list')
+        etag = self.etag(url)
+        self.assertNotModified(url, etag)
+        Review.objects.create(service_provider=service.service_provider, author=self.user, score=5)
+        self.assertModified(url, etag)
+        etag = self.etag(url)
+        service.title = 'Renamed'
+        service.save()
+        self.assertModified(url, etag)
+
+    def test_public_listings_may_be_stored_by_shared_caches(self):
+        create_services(1)
+        self.client.force_authenticate(None)
+        for name, params in [('service-search', {}), ('service-search-cards', {}), ('service-suggest', {'q': 'pl'}),
+                             ('review-list', {})]:
+            response = self.client.get(reverse(f'users:{name}'), params)
+            self.assertEqual(response.status_code, 200, name)
+            self.assertEqual(response['Cache-Control'], f'public, max-age={settings.PUBLIC_CACHE_MAX_AGE}', name)
+        response = self.client.post(reverse('users:review-list'), {})
+        self.assertNotIn('Cache-Control', response)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'], DATABASE_REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.routed = []
+
+        def view(request):
+            self.routed.append(router.db_for_read(Service))
+            if request.path == '/writes/':
+                router.db_for_write(Service)
+                self.routed.append(router.db_for_read(Service))
+            return HttpResponse()
+
+        self.middleware = ReplicaRoutingMiddleware(view)
+
+    def request(self, method, path='/reads/', address='10.0.0.1', **headers):
+        self.routed.clear()
+        self.middleware(self.factory.generic(method, path, REMOTE_ADDR=address, headers=headers))
+        return self.routed
+
+    def test_reads_use_primary_outside_requests(self):
+        self.assertEqual(router.db_for_read(Service), 'default')
+        with routers.replica_reads():
+            self.assertIn(router.db_for_read(Service), ['replica_1', 'replica_2'])
+            self.assertEqual(router.db_for_write(Service), 'default')
+            self.assertEqual(router.db_for_read(Service), 'default')
+
+    def test_safe_requests_read_from_replicas(self):
+        self.assertIn(self.request('GET')[0], ['replica_1', 'replica_2'])
+        self.assertEqual(self.request('POST'), ['default'])
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.request('POST', address='10.0.0.2')
+        self.assertEqual(self.request('GET', address='10.0.0.2'), ['default'])
+        self.assertNotEqual(self.request('GET', address='10.0.0.3'), ['default'])
+
+        self.request('POST', address='10.0.0.4', authorization='Token abc')
+        self.assertEqual(self.request('GET', address='10.0.0.5', authorization='Token abc'), ['default'])
+        self.request('POST', address='10.0.0.4', cookie='sessionid=abc')
+        self.assertEqual(self.request('GET', address='10.0.0.5', cookie='sessionid=abc'), ['default'])
+
+        routed = self.request('GET', '/writes/', address='10.0.0.6')
+        self.assertNotEqual(routed[0], 'default')
+        self.assertEqual(routed[1], 'default')
+        self.assertEqual(self.request('GET', address='10.0.0.6'), ['default'])
+
+    def test_signed_in_clients_sharing_an_address_are_pinned_apart(self):
+        self.request('POST', address='10.0.0.2', authorization='Token abc')
+        self.assertNotEqual(self.request('GET', address='10.0.0.2', authorization='Token def'), ['default'])
+        self.assertNotEqual(self.request('GET', address='10.0.0.2'), ['default'])
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1})
+    def test_anonymous_clients_behind_a_proxy_are_pinned_by_forwarded_address(self):
+        self.request('POST', x_forwarded_for='203.0.113.1')
+        self.assertEqual(self.request('GET', x_forwarded_for='198.51.100.7, 203.0.113.1'), ['default'])
+        self.assertNotEqual(self.request('GET', x_forwarded_for='203.0.113.2'), ['default'])
+
+    def test_replicas_without_a_shared_cache_are_reported(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}}
+        with self.settings(CACHES=locmem):
+            self.assertEqual([warning.id for warning in routers.check_pin_cache(None)], ['users.W001'])
+            with self.settings(DATABASE_REPLICAS=[]):
+                self.assertEqual(routers.check_pin_cache(None), [])
+        with self.settings(CACHES=redis):
+            self.assertEqual(routers.check_pin_cache(None), [])
+
+    def test_pin_expires(self):
+        with self.settings(DATABASE_REPLICA_PIN_SECONDS=0):
+            self.request('POST')
+        self.assertNotEqual(self.request('GET'), ['default'])
+
+    def test_open_transactions_read_from_primary(self):
+        with routers.replica_reads(), mock.patch.object(connection, 'in_atomic_block', True):
+            self.assertEqual(router.db_for_read(Service), 'default')
+
+
+@override_settings(SQLITE_WRITE_QUEUE=True)
+class WriteQueueTests(TransactionTestCase):
+    def test_concurrent_writers_are_serialized(self):
+        users = User.objects.bulk_create(User(email=f'writer{i}@example.com') for i in range(8))
+        errors = []
+
+        def write(user):
+            try:
+                for i in range(10):
+                    Notification.objects.create(user=user, message=f'n{i}')
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(Notification.objects.count(), 80)
+        self.assertEqual(list(NotificationCounter.objects.values_list('unread', flat=True)), [10] * 8)
+
+    def test_nested_writes_join_the_open_transaction(self):
+        user = User.objects.create(email='nested@example.com')
+        with mock.patch.object(writequeue.WriteQueue, 'acquire') as acquire:
+            Notification.objects.create(user=user, message='queued')
+            self.assertEqual(acquire.call_count, 1)
+            with transaction.atomic():
+                Notification.objects.create(user=user, message='nested')
+            self.assertEqual(acquire.call_count, 1)
+            with self.settings(SQLITE_WRITE_QUEUE=False):
+                Notification.objects.create(user=user, message='unqueued')
+            self.assertEqual(acquire.call_count, 1)
@@ -0,0 +1,134 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class WindowRateThrottle(SimpleRateThrottle):
+    """
+    Sliding-window limit for the view's `throttle_scope`, using the rate
+    `DEFAULT_THROTTLE_RATES['<scope>-<kind>']`. A missing rate means no limit.
+
+    Each key keeps one counter per fixed window. The current count plus the
+    previous window's count weighted by how much of it still overlaps
+    approximates a true sliding window. A decision is one atomic `incr` and
+    one `get` on `THROTTLE_CACHE_ALIAS`, whatever the rate. Rejected
+    attempts count too, so a client that keeps hammering stays blocked.
+    """
+    kind = None
+
+    def __init__(self):
+        # The rate depends on the view, so it is resolved in allow_request().
+        pass
+
+    def get_ident_key(self, request, view):
+        """
+        Return what this throttle counts requests by, or None to let the
+        request through unchecked.
+        """
+        raise NotImplementedError('.get_ident_key() must be overridden')
+
+    def get_cache_key(self, request, view):
+        ident = self.get_ident_key(request, view)
+        if ident is None:
+            return None
+        return f'throttle:{self.scope}-{self.kind}:{ident}'
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+        self.rate = api_settings.DEFAULT_THROTTLE_RATES.get(f'{self.scope}-{self.kind}') if self.scope else None
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        self.now = self.timer()
+        window, self.elapsed = divmod(self.now / self.duration, 1)
+        current = f'{self.key}:{int(window)}'
+        try:
+            self.count = cache.incr(current)
+        except ValueError:
+            # First hit in this window; add() loses to a concurrent first hit.
+            self.count = 1 if cache.add(current, 1, self.duration * 2) else cache.incr(current)
+        self.previous = cache.get(f'{self.key}:{int(window) - 1}', 0)
+        return self.previous * (1 - self.elapsed) + self.count <= self.num_requests
+
+    def wait(self):
+        """
+        Seconds until the next request would be allowed if this client
+        stopped now.
+        """
+        room = self.num_requests - 1
+        if self.count <= room:
+            # Only the previous window's weight is in the way.
+            return max(0.0, (1 - (room - self.count) / self.previous - self.elapsed) * self.duration)
+        # The current window becomes the previous one and must decay first.
+        return (1 - self.elapsed + 1 - room / self.count) * self.duration
+
+
+class EndpointRateThrottle(WindowRateThrottle):
+    """
+    Limit an endpoint across all clients: the ceiling on password hashing or
+    email sends that a distributed burst can cause.
+    """
+    kind = 'endpoint'
+
+    def get_ident_key(self, request, view):
+        return 'all'
+
+
+class IPRateThrottle(WindowRateThrottle):
+    """
+    Limit each client address, honouring `NUM_PROXIES` like DRF's throttles.
+    """
+    kind = 'ip'
+
+    def get_ident_key(self, request, view):
+        return self.get_ident(request)
+
+
+class AccountRateThrottle(WindowRateThrottle):
+    """
+    Limit each account a request names before it is authenticated: the
+    `username` or `email` in the body of a login, registration or reset, or
+    else the credentials in the `Authorization` header.
+    """
+    kind = 'account'
+    fields = ('username', 'email')
+
+    def get_ident_key(self, request, view):
+        if request.method not in SAFE_METHODS and hasattr(request.data, 'get'):
+            for field in self.fields:
+                value = request.data.get(field)
+                if isinstance(value, str) and value.strip():
+                    return hashlib.sha256(value.strip().lower().encode()).hexdigest()
+        credentials = request.headers.get('Authorization')
+        if credentials:
+            return hashlib.sha256(credentials.encode()).hexdigest()
+        return None
+
+
+ABUSE_THROTTLES = [EndpointRateThrottle, IPRateThrottle, AccountRateThrottle]
+
+
+class ThrottleFirstMixin:
+    """
+    Check throttles before authentication rather than after permissions, so
+    a rejected request never looks up credentials, hashes a password or
+    touches a serializer. Its throttles must therefore not use `request.user`.
+    """
+    throttle_scope = None
+
+    def perform_authentication(self, request):
+        super().check_throttles(request)
+        super().perform_authentication(request)
+
+    def check_throttles(self, request):
+        # Already done by perform_authentication().
+        pass
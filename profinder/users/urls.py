@@ -2,11 +2,27 @@ from rest_framework.routers import DefaultRouter
 from django.urls import path, include
 
 from users.views import (
-    UserViewSet)
+    UserViewSet, MessageViewSet, NotificationViewSet, PasswordResetView, ServiceSearchView, NearbyServiceView,
+    ExportView, ImportView, BookingViewSet, ProviderAvailabilityView, ReviewViewSet, ConversationViewSet,
+    MetricsView, ServiceSuggestView, ServiceCardSearchView)
 
 router = DefaultRouter()
 router.register('users', UserViewSet, basename='user')
+router.register('messages', MessageViewSet, basename='message')
+router.register('conversations', ConversationViewSet, basename='conversation')
+router.register('notifications', NotificationViewSet, basename='notification')
+router.register('bookings', BookingViewSet, basename='booking')
+router.register('reviews', ReviewViewSet, basename='review')
 app_name = 'users'
 urlpatterns = [
     path('', include(router.urls)),
+    path('password-reset/', PasswordResetView.as_view(), name='password-reset'),
+    path('services/search/', ServiceSearchView.as_view(), name='service-search'),
+    path('services/search/cards/', ServiceCardSearchView.as_view(), name='service-search-cards'),
+    path('services/nearby/', NearbyServiceView.as_view(), name='service-nearby'),
+    path('services/suggest/', ServiceSuggestView.as_view(), name='service-suggest'),
+    path('providers/<int:pk>/availability/', ProviderAvailabilityView.as_view(), name='provider-availability'),
+    path('export/<str:name>/', ExportView.as_view(), name='export'),
+    path('import/<str:kind>/', ImportView.as_view(), name='import'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -1,20 +1,40 @@
-from rest_framework import viewsets, generics, permissions, filters, status
+from asgiref.sync import sync_to_async
+from rest_framework import viewsets, generics, mixins, permissions, filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Max, Q, Sum
 
-from .models import User, Message, Notification, Service
+from . import availability, export, geo, ingest, metrics, outbox, search_cache, suggest, websocket
+from .asyncviews import AsyncAPIViewMixin
+from .authentication import principal_cache
+from .models import (
+    User, ServiceProviderProfile, Booking, Review, ConversationMember, Message, Notification,
+    NotificationCounter, Service, ServiceSearchDocument,
+)
+from .compiled import CompiledListMixin
+from .conditional import CacheControlMixin, ConditionalGetMixin
+from .prefetch import PrefetchQuerySetMixin
+from .permissions import IsStaff
+from .pubsub import get_broker, user_channel
+from .search import FullTextSearchFilter
+from .throttling import ABUSE_THROTTLES, ThrottleFirstMixin
 from .serializers import (
-    UserSerializer, MessageSerializer, NotificationSerializer, ServiceSerializer
+    UserSerializer, MessageSerializer, NotificationSerializer, ServiceSerializer,
+    NearbyServiceSerializer, NearbyQuerySerializer, NotificationIdsSerializer, BookingSerializer,
+    AvailabilitySlotSerializer, PublishSlotsSerializer, ReservationSerializer, ReviewSerializer,
+    ConversationSerializer, ReadCursorSerializer, SuggestQuerySerializer, ServiceCardSerializer,
+    PasswordResetSerializer,
 )
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ThrottleFirstMixin, ConditionalGetMixin, CompiledListMixin, viewsets.ModelViewSet):
     """
     A viewset for user-related actions, including registration, login, logout,
     filtering by user type, and profile management.
@@ -24,7 +44,10 @@ class UserViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter]
     search_fields = ['email', 'first_name', 'last_name']
 
-    @action(detail=False, methods=['post'], url_path='register')
+    @action(
+        detail=False, methods=['post'], url_path='register', permission_classes=[permissions.AllowAny],
+        throttle_classes=ABUSE_THROTTLES, throttle_scope='register',
+    )
     def register(self, request):
         """
         Register a new user.
@@ -35,7 +58,10 @@ class UserViewSet(viewsets.ModelViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=False, methods=['post'], url_path='login')
+    @action(
+        detail=False, methods=['post'], url_path='login', permission_classes=[permissions.AllowAny],
+        throttle_classes=ABUSE_THROTTLES, throttle_scope='login',
+    )
     def login(self, request):
         """
         Log in a user and return an authentication token.
@@ -56,19 +82,23 @@ class UserViewSet(viewsets.ModelViewSet):
                 })
 
         custom_auth_view = CustomObtainAuthToken.as_view()
-        return custom_auth_view(request)
+        return custom_auth_view(request._request)
 
     @action(detail=False, methods=['post'], url_path='logout')
     def logout(self, request):
         """
         Log out a user by deleting their auth token.
         """
-        if request.user.is_authenticated:
-            request.user.auth_token.delete()
+        if request.user.is_authenticated and isinstance(request.auth, str):
+            Token.objects.filter(key=request.auth).delete()
+            principal_cache.revoke(request.auth)
             return Response({"detail": "Logged out successfully."}, status=status.HTTP_200_OK)
         return Response({"detail": "User not authenticated."}, status=status.HTTP_401_UNAUTHORIZED)
 
-    @action(detail=False, methods=['get'], url_path='search-by-email')
+    @action(
+        detail=False, methods=['get'], url_path='search-by-email',
+        throttle_classes=ABUSE_THROTTLES, throttle_scope='search-by-email',
+    )
     def search_by_email(self, request):
         """
         Search a user by email.
@@ -86,8 +116,7 @@ class UserViewSet(viewsets.ModelViewSet):
         Get all users with user_type='client'.
         """
         clients = User.objects.filter(user_type='client')
-        serializer = self.get_serializer(clients, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.not_modified(request, clients) or self.compiled_list_response(clients)
 
     @action(detail=False, methods=['get'], url_path='service-providers')
     def get_service_providers(self, request):
@@ -95,32 +124,29 @@ class UserViewSet(viewsets.ModelViewSet):
         Get all users with user_type='service_provider'.
         """
         service_providers = User.objects.filter(user_type='service_provider')
-        serializer = self.get_serializer(service_providers, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return self.not_modified(request, service_providers) or self.compiled_list_response(service_providers)
 
 
-class PasswordResetView(APIView):
+class PasswordResetView(ThrottleFirstMixin, APIView):
     """
     A view to handle password reset requests.
     """
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = ABUSE_THROTTLES
+    throttle_scope = 'password-reset'
+
     def post(self, request):
-        email = request.data.get('email')
-        if not email:
-            return Response({"detail": "Email is required."}, status=status.HTTP_400_BAD_REQUEST)
-        user = User.objects.filter(email=email).first()
-        if user:
-            token = default_token_generator.make_token(user)
-            reset_url = f"http://example.com/reset-password/{token}/"
-            send_mail(
-                "Password Reset",
-                f"Click here to reset your password: {reset_url}",
-                "noreply@example.com",
-                [email]
-            )
+        """
+        Queue the reset email. Whether the address belongs to a user is only
+        checked by the outbox worker, so every request costs the same.
+        """
+        serializer = PasswordResetSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        outbox.enqueue('password_reset', serializer.validated_data['email'])
         return Response({"detail": "Password reset link sent if email exists."}, status=status.HTTP_200_OK)
 
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(AsyncAPIViewMixin, ConditionalGetMixin, CompiledListMixin, viewsets.ModelViewSet):
     """
     A viewset to handle messages between users.
     """
@@ -134,14 +160,89 @@ class MessageViewSet(viewsets.ModelViewSet):
         """
         return Message.objects.filter(receiver=self.request.user)
 
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return await self.anot_modified(request, queryset) or await self.acompiled_list_response(queryset)
+
     def perform_create(self, serializer):
         """
-        Automatically set the sender to the authenticated user.
+        Automatically set the sender to the authenticated user and push the
+        message to the receiver's open sockets once it is committed.
+        """
+        message = serializer.save(sender=self.request.user)
+        payload = serializer.data
+        transaction.on_commit(lambda: get_broker().publish(user_channel(message.receiver_id), payload))
+
+    @action(detail=False, methods=['post'], url_path='ws-ticket')
+    def ws_ticket(self, request):
+        """
+        Issue a short-lived ticket for opening the message WebSocket.
+        """
+        return Response({"ticket": websocket.make_ticket(request.user.pk)}, status=status.HTTP_200_OK)
+
+
+class ConversationViewSet(ConditionalGetMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                          viewsets.GenericViewSet):
+    """
+    The user's conversations, most recently active first, each with its
+    peer, a preview of the last message and the user's unread count.
+    """
+    serializer_class = ConversationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_field = 'conversation_id'
+    lookup_url_kwarg = 'pk'
+    etag_field = 'last_message_at'
+    # Sums change when any one member's cursor or count does; a user has
+    # few enough memberships to add them up.
+    etag_aggregates = {
+        'read': Sum('last_read_message'),
+        'unread': Sum('unread_count'),
+        'peer': Max('peer__updated_at'),
+        'preview': Max('conversation__last_message__updated_at'),
+    }
+    etag_deletions = [ConversationMember, Message]
+
+    def get_queryset(self):
+        """
+        One indexed query over the user's memberships; the preview and peer
+        come from denormalized pointers rather than a scan of messages.
+        """
+        return (
+            ConversationMember.objects.filter(user=self.request.user)
+            .select_related('peer', 'conversation__last_message')
+            .order_by('-last_message_at', '-id')
+        )
+
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """
+        Page through the thread's history, newest first.
         """
-        serializer.save(sender=self.request.user)
+        member = self.get_object()
+        page = self.paginate_queryset(Message.objects.filter(conversation_id=member.conversation_id))
+        return self.get_paginated_response(MessageSerializer(page, many=True).data)
+
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        """
+        Advance the user's read cursor to `message`, or to the newest message.
+        """
+        serializer = ReadCursorSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        member = self.get_object()
+        message_id = serializer.validated_data.get('message')
+        if message_id is not None and not Message.objects.filter(
+            pk=message_id, conversation_id=member.conversation_id
+        ).exists():
+            raise ValidationError({"message": "Not a message of this conversation."})
+        member = member.mark_read(message_id)
+        return Response(
+            {"last_read_message": member.last_read_message_id, "unread_count": member.unread_count},
+            status=status.HTTP_200_OK
+        )
 
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(AsyncAPIViewMixin, ConditionalGetMixin, CompiledListMixin, viewsets.ModelViewSet):
     """
     A viewset to handle notifications for users.
     """
@@ -155,23 +256,298 @@ class NotificationViewSet(viewsets.ModelViewSet):
         """
         return Notification.objects.filter(user=self.request.user)
 
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return await self.anot_modified(request, queryset) or await self.acompiled_list_response(queryset)
+
     @action(detail=True, methods=['post'], url_path='mark-as-read')
     def mark_as_read(self, request, pk=None):
         """
         Mark a specific notification as read.
         """
-        notification = self.get_object()
-        notification.read = True
-        notification.save()
+        if not (pk.isdigit() and Notification.mark_read(request.user, ids=[pk])):
+            self.get_object()
         return Response({"detail": "Notification marked as read."}, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['post'], url_path='mark-all-read')
+    def mark_all_read(self, request):
+        """
+        Mark every unread notification of the user as read.
+        """
+        updated = Notification.mark_read(request.user)
+        return Response({"updated": updated}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='mark-read')
+    def mark_read(self, request):
+        """
+        Mark the notifications listed in `ids` as read.
+        """
+        serializer = NotificationIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated = Notification.mark_read(request.user, ids=serializer.validated_data['ids'])
+        return Response({"updated": updated}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        """
+        Return the user's unread count from the denormalized counter.
+        """
+        return Response({"unread": NotificationCounter.objects.unread(request.user.pk)}, status=status.HTTP_200_OK)
+
 
-class ServiceSearchView(generics.ListAPIView):
+class ServiceSearchView(AsyncAPIViewMixin, CacheControlMixin, CompiledListMixin, PrefetchQuerySetMixin,
+                        generics.ListAPIView):
     """
     API to search and filter services.
     """
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    permission_classes = [permissions.AllowAny]
+    cache_scope = 'public'
+    filter_backends = [FullTextSearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'description', 'location', 'category__name']
-    ordering_fields = ['price', 'rating']
\ No newline at end of file
+    ordering_fields = ['price', 'rating']
+
+    def list(self, request, *args, **kwargs):
+        """
+        Serve repeated searches from the versioned result cache.
+        """
+        data = search_cache.get_page(request)
+        if data is not None:
+            return Response(data, status=status.HTTP_200_OK)
+        versions = search_cache.snapshot(request)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            search_cache.set_page(request, response.data, versions)
+        return response
+
+    async def aget(self, request, *args, **kwargs):
+        """
+        `list` for async dispatch. Cache calls are blocking I/O with a shared
+        cache, so each runs in a worker thread.
+        """
+        data = await sync_to_async(search_cache.get_page)(request)
+        if data is not None:
+            return Response(data, status=status.HTTP_200_OK)
+        versions = await sync_to_async(search_cache.snapshot)(request)
+        response = await self.acompiled_list_response(self.filter_queryset(self.get_queryset()))
+        if response.status_code == status.HTTP_200_OK:
+            await sync_to_async(search_cache.set_page)(request, response.data, versions)
+        return response
+
+
+class NearbyServiceView(CacheControlMixin, PrefetchQuerySetMixin, generics.ListAPIView):
+    """
+    API to list active services within `radius` km of `lat`/`lon`, nearest first.
+    """
+    queryset = Service.objects.filter(is_active=True)
+    serializer_class = NearbyServiceSerializer
+    permission_classes = [permissions.AllowAny]
+    cache_scope = 'public'
+
+    def list(self, request, *args, **kwargs):
+        params = NearbyQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        services = geo.nearby(
+            self.get_queryset(),
+            params.validated_data['lat'],
+            params.validated_data['lon'],
+            params.validated_data['radius'],
+        )[:params.validated_data['limit']]
+        serializer = self.get_serializer(services, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class ServiceCardSearchView(AsyncAPIViewMixin, CacheControlMixin, CompiledListMixin, generics.ListAPIView):
+    """
+    `ServiceSearchView` returning flat result cards, read from
+    `ServiceSearchDocument` alone instead of joining services to their
+    category, provider and user.
+    """
+    queryset = ServiceSearchDocument.objects.all()
+    serializer_class = ServiceCardSerializer
+    permission_classes = [permissions.AllowAny]
+    cache_scope = 'public'
+    filter_backends = [FullTextSearchFilter, filters.OrderingFilter]
+    search_fields = ['title', 'location', 'category_name']  # The indexed columns the documents carry.
+    ordering_fields = ['price', 'rating']
+
+    async def aget(self, request, *args, **kwargs):
+        return await self.acompiled_list_response(self.filter_queryset(self.get_queryset()))
+
+
+class ServiceSuggestView(CacheControlMixin, APIView):
+    """
+    Typeahead suggestions for the search box: categories, professions and
+    service titles with a word starting with `q`, most used first. Answered
+    from the in-process `suggest` index; no authentication is needed, so a
+    request makes no database or cache lookups.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+    cache_scope = 'public'
+
+    def get(self, request):
+        params = SuggestQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        results = suggest.suggest(
+            params.validated_data['q'],
+            params.validated_data.get('type') or suggest.KINDS,
+            params.validated_data['limit'],
+        )
+        return Response({
+            'results': [{'type': kind, 'text': text, 'count': count} for kind, text, count in results]
+        }, status=status.HTTP_200_OK)
+
+
+class ExportView(APIView):
+    """
+    Stream a full or incremental export of users, services or bookings as
+    NDJSON (default) or CSV. Pass the last row's `updated_at` and `id` as
+    `since` and `after` to receive only rows changed after it, along with
+    those changed in the `EXPORT_WATERMARK_LAG` seconds before it: upsert
+    them by id.
+    """
+    permission_classes = [IsStaff]
+
+    def get(self, request, name):
+        if name not in export.EXPORTS:
+            raise NotFound()
+        output = request.query_params.get('output', 'ndjson')
+        if output not in export.FORMATS:
+            raise ValidationError({"output": f"Choose one of: {', '.join(export.FORMATS)}."})
+        try:
+            watermark = export.parse_watermark(
+                request.query_params.get('since'), request.query_params.get('after')
+            )
+        except ValueError:
+            raise ValidationError({"since": "Expected an ISO 8601 datetime and an integer `after`."})
+
+        response = StreamingHttpResponse(
+            export.stream(name, output, watermark), content_type=export.FORMATS[output]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{name}.{output}"'
+        return response
+
+
+class ImportView(APIView):
+    """
+    Bulk upsert providers or create services from a CSV or NDJSON body,
+    chosen by `?input=` or the request content type. Valid rows are written
+    in chunked transactions; invalid ones are reported by row number.
+    Providers naming a client account are rejected unless
+    `?convert_clients=true`.
+    """
+    permission_classes = [IsStaff]
+
+    def post(self, request, kind):
+        if kind not in ingest.IMPORTERS:
+            raise NotFound()
+        input_format = request.query_params.get('input')
+        if input_format is None:
+            input_format = 'csv' if request.content_type.startswith('text/csv') else 'ndjson'
+        if input_format not in export.FORMATS:
+            raise ValidationError({"input": f"Choose one of: {', '.join(export.FORMATS)}."})
+        options = {}
+        if kind == 'providers':
+            options['convert_clients'] = request.query_params.get('convert_clients', '').lower() in ingest.TRUE_VALUES
+        try:
+            report = ingest.ingest_text(kind, request.body.decode('utf-8'), input_format, **options)
+        except (UnicodeDecodeError, ValueError) as exc:
+            raise ValidationError({"detail": f"Could not read the {input_format} body: {exc}"})
+        return Response(report)
+
+
+class ProviderAvailabilityView(APIView):
+    """
+    List a provider's free slots for an ISO week (`?week=2026-W42`, default
+    the current one), or let the provider publish new slots.
+    """
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get(self, request, pk):
+        try:
+            start, end = availability.parse_week(request.query_params.get('week'))
+        except ValueError:
+            raise ValidationError({"week": "Expected an ISO week such as 2026-W42."})
+        slots = availability.free_slots(pk, start, end)
+        return Response({
+            'week_start': start,
+            'results': AvailabilitySlotSerializer(slots, many=True).data,
+        })
+
+    def post(self, request, pk):
+        provider = get_object_or_404(ServiceProviderProfile, pk=pk)
+        if provider.user_id != request.user.id:
+            return Response({"detail": "Only the provider can publish slots."}, status=status.HTTP_403_FORBIDDEN)
+        serializer = PublishSlotsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            slots = availability.publish(
+                provider, [(slot['starts_at'], slot['ends_at']) for slot in serializer.validated_data['slots']]
+            )
+        except ValueError as exc:
+            raise ValidationError({"slots": str(exc)})
+        return Response(AvailabilitySlotSerializer(slots, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class BookingViewSet(ConditionalGetMixin, PrefetchQuerySetMixin, mixins.CreateModelMixin, mixins.ListModelMixin,
+                     mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Reserve provider slots and list or cancel the bookings the user is a
+    party to. Cancelling frees the slot.
+    """
+    queryset = Booking.objects.all()
+    serializer_class = BookingSerializer
+    # The nested service, provider and user are rendered too.
+    etag_aggregates = {
+        'service': Max('service__updated_at'),
+        'provider': Max('service__service_provider__updated_at'),
+        'user': Max('service__service_provider__user__updated_at'),
+    }
+
+    def get_queryset(self):
+        user = self.request.user
+        return super().get_queryset().filter(Q(client=user) | Q(service_provider__user=user))
+
+    def create(self, request, *args, **kwargs):
+        serializer = ReservationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            booking = availability.reserve(request.user, **serializer.validated_data)
+        except availability.SlotUnavailable:
+            return Response({"detail": "This slot is no longer available."}, status=status.HTTP_409_CONFLICT)
+        return Response(BookingSerializer(booking).data, status=status.HTTP_201_CREATED)
+
+
+class ReviewViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """
+    Reviews of providers, filterable by `?service_provider=<id>`. Anyone
+    can read them; only the author can change or delete a review.
+    """
+    queryset = Review.objects.all()
+    serializer_class = ReviewSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    cache_scope = 'public'
+
+    def get_queryset(self):
+        queryset = Review.objects.all()
+        if self.request.method not in permissions.SAFE_METHODS:
+            return queryset.filter(author=self.request.user)
+        provider = self.request.query_params.get('service_provider')
+        if provider is not None:
+            if not provider.isdigit():
+                raise ValidationError({"service_provider": "Expected a provider id."})
+            queryset = queryset.filter(service_provider_id=provider)
+        return queryset
+
+
+class MetricsView(APIView):
+    """
+    Request histograms in the Prometheus text format: summed across the
+    workers sharing METRICS_DIR, or for this process alone when it is unset.
+    """
+    permission_classes = [IsStaff]
+
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
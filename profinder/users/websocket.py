@@ -0,0 +1,87 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from django.core import signing
+
+from .pubsub import get_broker, user_channel
+
+TICKET_SALT = 'users.websocket.ticket'
+TICKET_MAX_AGE = 60
+
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+def make_ticket(user_id):
+    """
+    Sign a short-lived ticket that lets `user_id` open a message socket.
+    """
+    return signing.dumps({'user': user_id}, salt=TICKET_SALT)
+
+
+def read_ticket(ticket):
+    try:
+        return signing.loads(ticket, salt=TICKET_SALT, max_age=TICKET_MAX_AGE)['user']
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+async def message_socket(scope, receive, send):
+    """
+    Push every message sent to the ticket's user while the socket is open.
+    The connection holds no thread and no database connection while idle.
+    """
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    ticket = parse_qs(scope.get('query_string', b'').decode()).get('ticket', [''])[0]
+    user_id = read_ticket(ticket)
+    if user_id is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+
+    subscription = await get_broker().subscribe(user_channel(user_id))
+    await send({'type': 'websocket.accept'})
+    try:
+        await _relay(receive, send, subscription)
+    finally:
+        await subscription.close()
+
+
+async def _relay(receive, send, subscription):
+    receiving = asyncio.ensure_future(receive())
+    delivering = asyncio.ensure_future(subscription.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receiving, delivering}, return_when=asyncio.FIRST_COMPLETED)
+            if receiving in done:
+                if receiving.result()['type'] == 'websocket.disconnect':
+                    return
+                receiving = asyncio.ensure_future(receive())
+            if delivering in done:
+                await send({'type': 'websocket.send', 'text': json.dumps(delivering.result())})
+                if subscription.overflowed and subscription.queue.empty():
+                    await send({'type': 'websocket.close', 'code': CLOSE_TRY_AGAIN_LATER})
+                    return
+                delivering = asyncio.ensure_future(subscription.get())
+    finally:
+        receiving.cancel()
+        delivering.cancel()
+
+
+routes = {
+    '/ws/messages/': message_socket,
+}
+
+
+async def application(scope, receive, send):
+    """
+    ASGI application for WebSocket connections.
+    """
+    handler = routes.get(scope['path'])
+    if handler is None:
+        await receive()
+        await send({'type': 'websocket.close'})
+        return
+    await handler(scope, receive, send)
@@ -0,0 +1,79 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class WriteQueue:
+    """
+    Line up the write transactions on one SQLite file: threads queue on a
+    lock and processes on an flock()ed file next to the database, so each
+    writer wakes as soon as the one ahead of it commits instead of polling
+    SQLite's busy handler with growing sleeps.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+
+    def _lock_file(self):
+        # A descriptor inherited across fork() shares its flock with the parent.
+        if self._pid != os.getpid():
+            self._file = open(f'{self.path}-writequeue', 'a')
+            self._pid = os.getpid()
+        return self._file
+
+    @contextmanager
+    def acquire(self):
+        with self._lock:
+            lock_file = self._lock_file() if fcntl is not None and self.path else None
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    path = None if connection.is_in_memory_db() else str(connection.settings_dict['NAME'])
+    with _queues_lock:
+        queue = _queues.get(using)
+        if queue is None or queue.path != path:
+            queue = _queues[using] = WriteQueue(path)
+        return queue
+
+
+@contextmanager
+def serialized(using=DEFAULT_DB_ALIAS):
+    """
+    Run the block in a transaction, queued behind other writers when
+    `SQLITE_WRITE_QUEUE` is on and `using` is SQLite. A block nested in an
+    open transaction joins it without queueing, so a transaction that
+    already holds the database lock never waits on the queue.
+    """
+    connection = connections[using]
+    if (
+        not getattr(settings, 'SQLITE_WRITE_QUEUE', False)
+        or connection.vendor != 'sqlite'
+        or connection.in_atomic_block
+    ):
+        with transaction.atomic(using=using):
+            yield
+        return
+    with get_queue(using).acquire(), transaction.atomic(using=using):
+        yield